@@ -11,17 +11,14 @@
 #Users are encouraged to use data files from March 11th 2021 onwards.
 ####
 
-import urllib
-from urllib import request
-from http.cookiejar import CookieJar
-import getpass
-import netrc
-import requests
-import json
 import socket 
-###############The lines below are to get the IP address. You can make this static and assign a fixed value to the IPAddr variable
-hostname = socket.gethostname()    
-IPAddr = socket.gethostbyname(hostname)
+from s6mf.session import setup_earthdata_login_auth
+from s6mf.telemetry import Telemetry
+from s6mf.tokens import TokenCache, delete_token, get_token
+###############The IP address is only looked up when a new CMR token is created. You can make this static and assign a fixed value to the IPAddr variable
+IPAddr = None
+def user_ip():
+    return IPAddr or socket.gethostbyname(socket.gethostname())
 ######################################
 
 print("Running Sentinel-6 MF Data Download")
@@ -50,65 +47,10 @@ print("Running Sentinel-6 MF Data Download")
 # `$ chmod 0600 ~/.netrc` 
 # 
 # *You'll need to authenticate using the netrc method when running from command line with [`papermill`](https://papermill.readthedocs.io/en/latest/). You can log in manually by executing the cell below when running in the notebook client in your browser.*
+# 
+# setup_earthdata_login_auth reads these credentials (s6mf/session.py), and get_token and delete_token create and delete the CMR token
+# (s6mf/tokens.py). They are part of the s6mf package, so other Python programs can import them as well.
 
-
-def setup_earthdata_login_auth(endpoint):
-    """
-    Set up the request library so that it authenticates against the given Earthdata Login
-    endpoint and is able to track cookies between requests.  This looks in the .netrc file 
-    first and if no credentials are found, it prompts for them.
-
-    Valid endpoints include:
-        urs.earthdata.nasa.gov - Earthdata Login production
-    """
-    try:
-        username, _, password = netrc.netrc().authenticators(endpoint)
-    except (FileNotFoundError, TypeError):
-        # FileNotFound = There's no .netrc file
-        # TypeError = The endpoint isn't in the netrc file, causing the above to try unpacking None
-        print("There's no .netrc file or the The endpoint isn't in the netrc file")
-
-    manager = request.HTTPPasswordMgrWithDefaultRealm()
-    manager.add_password(None, endpoint, username, password)
-    auth = request.HTTPBasicAuthHandler(manager)
-
-    jar = CookieJar()
-    processor = request.HTTPCookieProcessor(jar)
-    opener = request.build_opener(auth, processor)
-    request.install_opener(opener)
-
-###############################################################################
-# GET TOKEN FROM CMR 
-###############################################################################
-def get_token( url: str,client_id: str, user_ip: str,endpoint: str) -> str:
-    try:
-        token: str = ''
-        username, _, password = netrc.netrc().authenticators(endpoint)
-        xml: str = """<?xml version='1.0' encoding='utf-8'?>
-        <token><username>{}</username><password>{}</password><client_id>{}</client_id>
-        <user_ip_address>{}</user_ip_address></token>""".format(username, password, client_id, user_ip)
-        headers: Dict = {'Content-Type': 'application/xml','Accept': 'application/json'}
-        resp = requests.post(url, headers=headers, data=xml)
-        response_content: Dict = json.loads(resp.content)
-        token = response_content['token']['id']
-    except:
-        print("Error getting the token - check user name and password")
-    return token
-###############################################################################
-# DELETE TOKEN FROM CMR 
-###############################################################################
-def delete_token(url: str, token: str) -> None:
-	try:
-		headers: Dict = {'Content-Type': 'application/xml','Accept': 'application/json'}
-		url = '{}/{}'.format(url, token)
-		resp = requests.request('DELETE', url, headers=headers)
-		if resp.status_code == 204:
-			print("CMR token successfully deleted")
-		else:
-			print("CMR token deleting failed.")
-	except:
-		print("Error deleting the token")
-	exit(0)
 ###############################################################################
 # Downloading the file
 ###############################################################################
@@ -120,9 +62,19 @@ def delete_token(url: str, token: str) -> None:
 edl="urs.earthdata.nasa.gov"
 cmr="cmr.earthdata.nasa.gov" 
 
-setup_earthdata_login_auth(edl)
+session=setup_earthdata_login_auth(edl)
+
+# The login, token, every search page and every file are timed and summed up at the end of the run. Set telemetry_file to also append each
+# timing to a file as a JSON line, and prometheus_file to write the totals in the Prometheus text format (e.g. for the node_exporter textfile collector).
+telemetry_file = ""
+prometheus_file = ""
+session.telemetry = Telemetry(telemetry_file or None, prometheus_file or None)
 token_url="https://"+cmr+"/legacy-services/rest/tokens"
-token=get_token(token_url,'Sentinel-6', IPAddr,edl)
+
+# The CMR token is kept in ~/.cache/s6mf/cmr_tokens.json and reused by the following runs until it is a day old or CMR rejects it,
+# instead of creating a token at the start of every run and deleting it at the end. Set cache_token = False to go back to that.
+cache_token = True
+token=TokenCache(lambda: get_token(token_url,'Sentinel-6', user_ip(),edl,session), token_url+" Sentinel-6", max_age=24*3600 if cache_token else 0, telemetry=session.telemetry)
 
 
  
@@ -134,96 +86,200 @@ Short_Name="SHORTNAME OF THE PRODUCT TO DOWNLOAD"
 ## Sentinel-6 MF datasets also have *.bufr.bin, *.DBL, *.rnx, *.dat 
 extensions = ['.nc','.bin']
 
-data = "DOWNLOAD LOCATION" 
-#You should change `data` to a suitable download path on your file system. 
+granule_names = []
+#Optional granule name patterns with * and ? wildcards, e.g. ['*_NR_*_F08']. Granules that match none of them are filtered out by CMR and never listed.
 
+search_format = "umm_json"
+#"umm_json" returns full granule records. "json" (Atom) returns smaller responses that are faster to parse but do not list file sizes and checksums, so the downloaded files are not verified.
 
+data = "DOWNLOAD LOCATION" 
+#You should change `data` to a suitable download path on your file system. 
 
-from os import makedirs
+workers = 8
+workers_per_host = 4
+#Number of files downloaded at the same time, in total and per data server. Use workers = 1 to download one file at a time.
+chunk_mb = 0
+#Files larger than chunk_mb megabytes are downloaded as several parallel byte ranges (0 = off).
+#Interrupted downloads are kept as *.part files and resumed where they stopped.
+buffer_mb = 1
+memory_mb = 64
+#Downloads are read and written buffer_mb megabytes at a time, with at most memory_mb megabytes of buffers shared by all of them.
+preallocate = False
+sync_mb = 0
+#For network or shared storage: preallocate reserves the full size of each file on disk before writing it, and sync_mb flushes
+#every sync_mb megabytes written to disk so they do not pile up in memory (0 = off).
+shard = ""
+#To split the downloads over several processes or hosts that share `data`, give each a different shard "INDEX/COUNT", e.g. "0/4" to "3/4".
+#While it runs, the script holds a lease on `data` (the .lease file); a second run on the same data directory and shard, e.g. cron
+#starting while a slow run is still going, prints a note and exits instead of downloading the same files.
+store_data = ""
+#Set store_data to a directory (e.g. data+"/s6mf.zarr") to also append the along-track variables of every downloaded .nc file to a
+#compressed store there with one array per variable and cycle, so reading a whole cycle does not open every file (needs: pip3 install netCDF4).
+plan_only = False
+plan_file = ""
+#Set plan_only = True to search without downloading and print what a run would download: the files and bytes by extension that are new,
+#resumed from a .part file, revised in CMR or gone from disk, and how long that takes at the throughput measured in telemetry_file.
+#With plan_file set the plan is also saved there, and the next run with plan_only = False downloads exactly the files of that plan
+#instead of searching again, then removes plan_file once all of them are downloaded.
+
+
+
+from os import makedirs, remove
 import datetime
-from os.path import isdir, basename
-from urllib.parse import urlencode
-from urllib.request import urlopen, urlretrieve
-from datetime import datetime, timedelta
-from json import dumps, loads
-
-
-# **The search retrieves granules for a particular cycle and pass. 
-# Pass is an optional parameter -- If pass is not provided then all files for a particular pass will be used
+from os.path import isdir, isfile, basename
+from datetime import datetime
+from json import dumps
+from s6mf.download import DownloadEngine, print_result
+from s6mf.links import LinkSelector, granule_name_params
+from s6mf.locking import Lease, LeaseError
+from s6mf.manifest import Manifest, NewFiles
+from s6mf.plan import Plan
+from s6mf.shard import Shard
+from s6mf.planner import CyclePassPlanner
+from s6mf.umm import file_info
+
+
+# **The search retrieves granules for a set of cycles and passes. 
+# Pass is an optional parameter -- If pass is not provided then all files for the cycles will be used
+# Cycles and passes can be single numbers, lists or ranges, e.g. s6mf_cycle="1-60" and s6mf_pass="1-10,245"
+# s6mf_direction="ascending" (odd passes) or "descending" (even passes) keeps only those passes
 
 ### Define the cycle and pass you need in this section
 s6mf_cycle=2
 s6mf_pass=245
+s6mf_direction=""
+
+if not isdir(data):
+    print("NOTE: Making new data directory at "+data)
+    makedirs(data)
+
+# Only one run at a time works on a data directory, or on one shard of it. The lease is renewed while the script runs and runs out
+# a few minutes after a run that was killed, so the next run can take over.
+
+shard = Shard.parse(shard)
+lease = Lease(data+"/.lease"+shard.suffix)
+try:
+    lease.acquire()
+except LeaseError as e:
+    print("NOTE: Another run is downloading to this data directory, exiting. ("+str(e)+")")
+    raise SystemExit(0)
 
 params = {
-    'scroll': "true",
-    'page_size': 2000,
     'sort_key': "-start_date",
     'ShortName': Short_Name, 
-    'cycle[]':s6mf_cycle ,
-    'passes[0][pass]':s6mf_pass,
-     'token': token
 }
+params.update(granule_name_params(granule_names))
 
 
 
-# Get the query parameters as a string and then the complete search url:
-
-query = urlencode(params)
-url = "https://"+cmr+"/search/granules.umm_json?"+query
-print(url)
-
-
-# Get a new timestamp that represents the UTC time of the search. Then download the records in `umm_json` format for granules that match our search parameters:
-
-
-with urlopen(url) as f:
-    results = loads(f.read().decode())
+# Set up the searches. The planner builds one search per cycle (with up to `passes_per_query` passes each), runs `search_concurrency` searches at a time with no more than `search_rate` requests per second, and merges the granules they return without duplicates. Each search follows the CMR paging, and the files of the first searches start downloading while the others are still running.
+# The search responses are parsed as they arrive and only the parts of the granule records used below are kept (stream=True):
 
-print(str(results['hits'])+" granules available for Cycle:"+str(s6mf_cycle)+" and Pass:"+str(s6mf_pass))
+passes_per_query = 20
+search_concurrency = 4
+search_rate = 5
 
-
-# Neatly print the first granule record (if one was returned):
-
-if len(results['items'])>0:
-    print(dumps(results['items'][0], indent=2))
+planner = CyclePassPlanner("https://"+cmr+"/search/granules."+search_format, params, s6mf_cycle, s6mf_pass, s6mf_direction or None,
+                           passes_per_query=passes_per_query, concurrency=search_concurrency, rate=search_rate, session=session, token=token, stream=True)
+print(str(len(planner.queries()))+" searches for Cycle:"+str(s6mf_cycle)+" and Pass:"+str(s6mf_pass or "all")+" "+s6mf_direction)
+search = planner.granules()
 
 
 # The link for http access can be retrieved from each granule record's `RelatedUrls` field. 
 # The download link is identified by `"Type": "GET DATA"` but there are other data files in EXTENDED METADATA" field.
-# Select the download URL for each of the granule records:
-
-
-downloads_all=[]
-downloads_data = [[u['URL'] for u in r['umm']['RelatedUrls'] if u['Type']=="GET DATA" and ('Subtype' not in u or u['Subtype'] != "OPENDAP DATA")] for r in results['items']]
-downloads_metadata = [[u['URL'] for u in r['umm']['RelatedUrls'] if u['Type']=="EXTENDED METADATA"] for r in results['items']]
-
-for f in downloads_data: downloads_all.append(f)
-for f in downloads_metadata: downloads_all.append(f)
-
-downloads = [item for sublist in downloads_all for item in sublist]
-
-# Finish by downloading the files to the data directory in a loop. 
+# Select the download URLs with the wanted extensions for each granule record as the pages arrive, and neatly print the first granule record (if one was returned):
+
+links = LinkSelector(extensions)
+
+# Every downloaded file is recorded in a manifest in the data directory (`.manifest.sqlite`, `.manifest-0-of-4.sqlite` for shard 0/4). Files that are already there, unchanged in CMR and still on disk are skipped:
+
+manifest = Manifest(data, shard)
+granules = {}
+
+if plan_only:
+    from s6mf.telemetry import measured_rate
+    plan = Plan.build(search, links, data, manifest, shard, cycle=str(s6mf_cycle), passes=str(s6mf_pass or "all"),
+                      direction=s6mf_direction, created=datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"))
+    print(plan.describe(measured_rate(telemetry_file) if telemetry_file else None))
+    if plan_file:
+        plan.save(plan_file)
+        print("Plan saved to "+plan_file)
+    manifest.close()
+    lease.release()
+    raise SystemExit(0)
+plan = Plan.load(plan_file) if plan_file and isfile(plan_file) else None
+
+store = None
+if store_data:
+    from s6mf.store import Store
+    store = Store(store_data)
+new_files = NewFiles(links, manifest, shard, granules)
+hits=0
+
+def records(search):
+    global hits
+    for n, r in enumerate(search):
+        hits = n+1
+        if n == 0:
+            print(dumps(r, indent=2))
+        yield r
+
+# Adding a file to the store takes about a second, so it is done once the downloads are finished rather than as each one finishes.
+stored = []
+
+def finished(result):
+    print_result(result)
+    r = granules.pop(result.url)
+    if result.ok:
+        manifest.add(r, result.url, result.path, result.nbytes)
+        if store and result.path.endswith(".nc"):
+            stored.append(result.path)
+
+# Finish by downloading the files to the data directory with a pool of `workers` downloads running at once. 
 success_cnt=failure_cnt=0
 
-for f in downloads:
+# Each file is checked against the size and checksum listed in its granule record while it downloads, and downloaded again if it does not match.
+
+if plan:
+    print("NOTE: Downloading the "+str(len(plan.pending()))+" files of the plan in "+plan_file+" instead of searching.")
+    jobs = list(plan.jobs(manifest))
+    granules.update((f, plan.item(f)) for f, _, _ in jobs)
+    hits = len(plan.granules)
+    new_files.skipped = len(plan.files)-len(jobs)
+else:
+    jobs = ((f, data+"/"+basename(f), file_info(r, f)) for f, r in new_files(records(search)))
+engine = DownloadEngine(workers=workers, per_host=workers_per_host, chunk_size=chunk_mb*1024*1024 or None, session=session,
+                        buffer_size=int(buffer_mb*1024*1024), memory_limit=int(memory_mb*1024*1024),
+                        preallocate=preallocate, sync_every=int(sync_mb*1024*1024) or None)
+for result in engine.run(jobs, callback=finished):
+    if result.ok:
+        success_cnt=success_cnt+1
+    else:
+        failure_cnt=failure_cnt+1
+for f in stored:
     try:
-        for extension in extensions:
-            if f.lower().endswith((extension)):
-                urlretrieve(f, data+"/"+basename(f))
-                print(datetime.now())
-                print("SUCCESS: "+f+"\n\n")
-                success_cnt=success_cnt+1
+        store.add(f)
     except Exception as e:
-        print(datetime.now())
-        print("FAILURE: "+f+"\n\n")
-        failure_cnt=failure_cnt+1
+        print("FAILURE: adding "+f+" to the store")
         print(e)
+if plan and not failure_cnt:
+    remove(plan_file)
 
 
+print(str(hits)+" granules available for Cycle:"+str(s6mf_cycle)+" and Pass:"+str(s6mf_pass or "all")+" "+s6mf_direction)
 print("Downloaded: "+str(success_cnt)+" files\n")
 print("Files Failed to download:"+str(failure_cnt)+"\n")
-delete_token(token_url,token) 
+print("Skipped (already downloaded): "+str(new_files.skipped)+" files\n")
+manifest.close()
+lease.release()
+print("HTTP: "+str(session.stats)+"\n")
+print(session.telemetry.summary()+"\n")
+# No token was fetched if a saved plan was run:
+if not cache_token:
+	cleared=token.clear()
+	if cleared:
+		delete_token(token_url,cleared,session)
+session.telemetry.close()
 print("END \n\n")
 
 
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+
+# Memory and throughput of the download writer against an unthrottled local
+# data server, each setting in a fresh process so the peak RSS is its own.
+#
+#   iter_content  - what the engine did before s6mf.streaming: a bytes object
+#                   per 64 KB block, written through a buffered file
+#   pool          - the engine with --buffer-kb buffers and a shared limit of
+#                   --limit-mb, with and without preallocation and syncing
+#
+# The pool's buffers stay within the limit however many workers run.
+#
+#   python3 benchmarks/bench_buffers.py --files 32 --size-mb 8 --workers 16
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mock_servers import data_server
+from s6mf.download import DownloadEngine
+from s6mf.session import Session
+
+
+def iter_content(jobs, workers):
+    session = Session(pool_size=workers)
+
+    def fetch(job):
+        url, path = job
+        with session.get(url, stream=True) as src, open(path, "wb") as dst:
+            for block in src.iter_content(64 * 1024):
+                dst.write(block)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(fetch, jobs))
+
+
+def child(args):
+    setting = json.loads(args.child)
+    with tempfile.TemporaryDirectory(dir=args.dir) as data:
+        jobs = [(args.url+"/"+name, data+"/"+name) for name in setting.pop("names")]
+        start = time.monotonic()
+        if setting.pop("mode") == "iter_content":
+            iter_content(jobs, args.workers)
+            buffers = None
+        else:
+            engine = DownloadEngine(args.workers, args.workers, **setting)
+            failed = [r for r in engine.run(jobs) if not r.ok]
+            if failed:
+                sys.exit("{} downloads failed: {}".format(len(failed), failed[0].error))
+            buffers = engine.buffers.allocated*engine.buffers.size
+        elapsed = time.monotonic()-start
+    print(json.dumps({"elapsed": elapsed, "buffers": buffers,
+                      "rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory and throughput of the download writer")
+    parser.add_argument("--files", type=int, default=32)
+    parser.add_argument("--size-mb", type=float, default=8.0)
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--buffer-kb", type=int, default=1024)
+    parser.add_argument("--limit-mb", type=int, default=8)
+    parser.add_argument("--dir", help="write the files here instead of the temporary directory")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--url", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return child(args)
+
+    pool = dict(mode="pool", buffer_size=args.buffer_kb*1024, memory_limit=args.limit_mb*1024*1024)
+    settings = [
+        ("iter_content", dict(mode="iter_content")),
+        ("pool", pool),
+        ("pool+preallocate", dict(pool, preallocate=True)),
+        ("pool+sync 16MB", dict(pool, preallocate=True, sync_every=16*1024*1024)),
+    ]
+    size = int(args.size_mb*1024*1024)
+    total = args.files*size/1024/1024
+    with data_server(args.files, size, 0.0, 0) as server:
+        print("{} files of {:.0f} MB, {} workers".format(args.files, args.size_mb, args.workers))
+        print("{:>18} {:>8} {:>8} {:>12} {:>10}".format("writer", "seconds", "MB/s", "buffers MB", "peak RSS"))
+        for name, setting in settings:
+            command = [sys.executable, os.path.abspath(__file__), "--workers", str(args.workers),
+                       "--child", json.dumps(dict(setting, names=server.names)), "--url", server.url]
+            if args.dir:
+                command += ["--dir", args.dir]
+            out = json.loads(subprocess.run(command, check=True, capture_output=True, text=True).stdout)
+            buffers = "-" if out["buffers"] is None else "{:.1f}".format(out["buffers"]/1024/1024)
+            print("{:>18} {:>8.2f} {:>8.1f} {:>12} {:>8.0f}MB".format(
+                name, out["elapsed"], total/out["elapsed"], buffers, out["rss"]/1024/1024))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+
+# Throughput of the download engine against a local data server.
+# Each connection on the server is throttled, as it is for a single TCP stream
+# to the archive, so the aggregate rate should scale with the worker count
+# until the per-host limit is reached.
+#
+#   python3 benchmarks/bench_download.py --files 32 --size-mb 1
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mock_servers import data_server
+from s6mf.download import DownloadEngine
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Download engine throughput against a local data server")
+    parser.add_argument("--files", type=int, default=32)
+    parser.add_argument("--size-mb", type=float, default=1.0)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds before the first byte")
+    parser.add_argument("--bandwidth-mb", type=float, default=4.0, help="MB/s per connection")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--chunk-mb", type=float, default=0, help="split files into byte ranges of this size")
+    args = parser.parse_args()
+
+    size = int(args.size_mb * 1024 * 1024)
+    with data_server(args.files, size, args.latency, int(args.bandwidth_mb * 1024 * 1024)) as server:
+        print("{:>8} {:>10} {:>10} {:>8}".format("workers", "seconds", "MB/s", "speedup"))
+        baseline = None
+        for workers in args.workers:
+            with tempfile.TemporaryDirectory() as data:
+                jobs = [(server.url+"/"+name, data+"/"+name) for name in server.names]
+                engine = DownloadEngine(workers=workers, per_host=workers,
+                                        chunk_size=int(args.chunk_mb * 1024 * 1024) or None)
+                start = time.monotonic()
+                results = engine.run(jobs)
+                elapsed = time.monotonic() - start
+            failed = [r for r in results if not r.ok]
+            if failed:
+                sys.exit("{} downloads failed: {}".format(len(failed), failed[0].error))
+            rate = sum(r.nbytes for r in results) / elapsed / 1024 / 1024
+            baseline = baseline or elapsed
+            print("{:>8} {:>10.2f} {:>10.1f} {:>7.1f}x".format(workers, elapsed, rate, baseline / elapsed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+# Response bytes and search time of the CMR result formats, against a local
+# CMR stand-in serving copies of the recorded responses in fixtures/ (one
+# Sentinel-6 MF NRT granule in umm_json and in Atom .json).  Every format must
+# produce the same download plan.
+#
+#   full umm_json   - whole records parsed at once, what the scripts used to do
+#   umm_json        - streamed, only umm.GRANULE_FIELDS kept
+#   json (Atom)     - streamed lighter format, no sizes or checksums
+#
+#   python3 benchmarks/bench_formats.py --granules 20000
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mock_servers import cmr_server
+from s6mf.links import LinkSelector
+from s6mf.search import GranuleSearch
+from s6mf.umm import GRANULE_FIELDS
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def load(name):
+    with open(os.path.join(FIXTURES, name)) as f:
+        return json.load(f)
+
+
+def copies(record, name, concept_id, n):
+    """
+    `n` copies of a recorded record with the granule name and concept-id renumbered.
+    """
+    text = json.dumps(record)
+    prefix = name.rsplit("_", 3)[0]
+    records = []
+    for i in range(n):
+        new_name = "{}_{:06d}_F02".format(prefix, i)
+        records.append(json.loads(text.replace(name, new_name).replace(concept_id, "G{:010d}-POCLOUD".format(i))))
+    return records
+
+
+def run(url, stream, fields, page_size):
+    search = GranuleSearch(url, {'ShortName': "JASON_CS_S6A_L2_ALT_LR_STD_OST_NRT_F"}, page_size=page_size,
+                           stream=stream, fields=fields)
+    start = time.perf_counter()
+    plan = LinkSelector(['.nc', '.bin']).plan(search)
+    return {u: r["meta"]["concept-id"] for u, r in plan.items()}, time.perf_counter()-start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bytes and time of the CMR result formats")
+    parser.add_argument("--granules", type=int, default=20000)
+    parser.add_argument("--page-size", type=int, default=2000)
+    args = parser.parse_args()
+
+    item = load("s6_nrt.umm_json")["items"][0]
+    entry = load("s6_nrt.json")["feed"]["entry"][0]
+    name, concept_id = item["umm"]["GranuleUR"], item["meta"]["concept-id"]
+    granules = copies(item, name, concept_id, args.granules)
+    entries = copies(entry, name, concept_id, args.granules)
+
+    with cmr_server(granules, entries=entries) as cmr:
+        print("{:>14} {:>10} {:>10} {:>10}".format("format", "files", "MB", "search"))
+        plans = []
+        for label, endpoint, stream, fields in (
+                ("full umm_json", "granules.umm_json", False, None),
+                ("umm_json", "granules.umm_json", True, GRANULE_FIELDS),
+                ("json (Atom)", "granules.json", True, GRANULE_FIELDS)):
+            sent = cmr.sent
+            plan, elapsed = run(cmr.url+"/search/"+endpoint, stream, fields, args.page_size)
+            plans.append(plan)
+            print("{:>14} {:>10} {:>10.1f} {:>9.3f}s".format(label, len(plan), (cmr.sent-sent)/1e6, elapsed))
+        if any(plan != plans[0] for plan in plans):
+            sys.exit("the formats give different download plans")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+# A subset request split into tiles, against a local Harmony stand-in whose
+# jobs take --job-seconds and produce --outputs files each.
+#
+#   one at a time - submit a job, wait for it to finish, download its outputs,
+#                   then the next tile; what data_subset.py did for one job
+#   batch         - s6mf.harmony.SubsetBatch: --jobs jobs at once, outputs
+#                   downloaded while the jobs run
+#   resume        - the batch interrupted half way and started again
+#
+#   python3 benchmarks/bench_harmony.py --tiles 8 --jobs 4
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mock_servers import harmony_server
+from s6mf.harmony import DONE, SubsetBatch, split
+
+COLLECTION = "C1238543220-POCLOUD"
+
+
+def one_at_a_time(batch):
+    downloaded = 0
+    for tile in batch.tiles:
+        job = batch.submit(tile)
+        while True:
+            status, _, outputs = batch.status(job)
+            if status in DONE:
+                break
+            time.sleep(batch.interval)
+        os.makedirs(os.path.join(batch.data, tile.name), exist_ok=True)
+        results = batch.engine.run((url, batch.path(tile, url)) for url in outputs)
+        downloaded += sum(r.ok for r in results)
+    return downloaded
+
+
+def quiet(func, *args):
+    with open(os.devnull, "w") as devnull:
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            return func(*args)
+        finally:
+            sys.stdout = stdout
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel Harmony jobs against a local stand-in")
+    parser.add_argument("--tiles", type=int, default=8)
+    parser.add_argument("--jobs", type=int, default=4)
+    parser.add_argument("--outputs", type=int, default=8, help="outputs per job")
+    parser.add_argument("--size-kb", type=int, default=512)
+    parser.add_argument("--job-seconds", type=float, default=2.0)
+    parser.add_argument("--bandwidth-kb", type=int, default=2048, help="per connection, KB/s")
+    args = parser.parse_args()
+    tiles = split("0,0,{},10".format(10*args.tiles), degrees=10)
+
+    print("{} tiles, jobs of {:.1f}s with {} outputs of {} KB".format(
+        len(tiles), args.job_seconds, args.outputs, args.size_kb))
+    print("{:>14} {:>6} {:>6} {:>9}".format("mode", "jobs", "files", "time"))
+    for mode in ("one at a time", "batch", "resume"):
+        with harmony_server(COLLECTION, args.job_seconds, args.outputs, args.size_kb*1024,
+                            bandwidth=args.bandwidth_kb*1024) as harmony, tempfile.TemporaryDirectory() as data:
+            batch = SubsetBatch(COLLECTION, tiles, data, harmony.url, jobs=args.jobs, interval=0.2)
+            start = time.monotonic()
+            if mode == "one at a time":
+                files = one_at_a_time(batch)
+            elif mode == "batch":
+                files = sum(r.downloaded for r in quiet(asyncio.run, batch.run()))
+            else:
+                try:
+                    quiet(asyncio.run, asyncio.wait_for(batch.run(), args.job_seconds))
+                except asyncio.TimeoutError:
+                    pass
+                again = SubsetBatch(COLLECTION, tiles, data, harmony.url, jobs=args.jobs, interval=0.2)
+                results = quiet(asyncio.run, again.run())
+                files = sum(r.downloaded+r.skipped for r in results)
+            elapsed = time.monotonic()-start
+            print("{:>14} {:>6} {:>6} {:>8.2f}s".format(mode, len(harmony.jobs), files, elapsed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+# Link selection over large search results.  Compares the original per-page
+# list comprehensions plus per-extension endswith() loop with LinkSelector on
+# synthetic UMM-G records shaped like the PO.DAAC cloud ones (HTTPS and S3 data
+# links, OPeNDAP, checksum and CMR metadata files, documentation).  A second
+# part searches a local CMR stand-in with and without a granule name pattern,
+# to show what is saved by letting CMR drop the unwanted granules.
+#
+#   python3 benchmarks/bench_links.py --items 100000
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mock_servers import cmr_server, granule
+from s6mf.links import LinkSelector, granule_name_params
+from s6mf.search import GranuleSearch
+
+EXTENSIONS = ['.nc', '.bin', '.DBL', '.rnx', '.dat']
+HTTPS = "https://archive.podaac.earthdata.nasa.gov/podaac-ops-cumulus-protected/JASON_CS_S6A_L2_ALT_LR_STD_OST_NRT_F/"
+S3 = "s3://podaac-ops-cumulus-protected/JASON_CS_S6A_L2_ALT_LR_STD_OST_NRT_F/"
+
+
+def record(i):
+    name = "S6A_P4_2__LR_STD__NR_{:03d}_{:03d}_20210712T083428_20210712T093041_F02".format(i // 254 + 1, i % 254 + 1)
+    return {
+        "meta": {"concept-id": "G{:010d}-POCLOUD".format(i)},
+        "umm": {"GranuleUR": name, "RelatedUrls": [
+            {"URL": HTTPS+name+".nc", "Type": "GET DATA", "Description": "Download "+name+".nc"},
+            {"URL": S3+name+".nc", "Type": "GET DATA VIA DIRECT ACCESS"},
+            {"URL": HTTPS+name+".nc.md5", "Type": "EXTENDED METADATA"},
+            {"URL": S3+name+".nc.md5", "Type": "EXTENDED METADATA"},
+            {"URL": HTTPS+name+".cmr.json", "Type": "EXTENDED METADATA"},
+            {"URL": S3+name+".cmr.json", "Type": "EXTENDED METADATA"},
+            {"URL": "https://opendap.earthdata.nasa.gov/collections/C1968980576-POCLOUD/granules/"+name,
+             "Type": "USE SERVICE API", "Subtype": "OPENDAP DATA"},
+            {"URL": "https://opendap.earthdata.nasa.gov/collections/C1968980576-POCLOUD/granules/"+name+".nc",
+             "Type": "GET DATA", "Subtype": "OPENDAP DATA"},
+            {"URL": "https://podaac.jpl.nasa.gov/Sentinel-6", "Type": "VIEW RELATED INFORMATION"},
+        ]},
+    }
+
+
+def original(items, extensions):
+    # As the scripts did it: nested comprehensions per page, flattened, then
+    # one endswith() per extension for every URL.  Duplicates are kept.
+    downloads_all = []
+    downloads_data = [[u['URL'] for u in r['umm']['RelatedUrls'] if u['Type'] == "GET DATA" and ('Subtype' not in u or u['Subtype'] != "OPENDAP DATA")] for r in items]
+    downloads_metadata = [[u['URL'] for u in r['umm']['RelatedUrls'] if u['Type'] == "EXTENDED METADATA"] for r in items]
+    for f in downloads_data:
+        downloads_all.append(f)
+    for f in downloads_metadata:
+        downloads_all.append(f)
+    downloads = [item for sublist in downloads_all for item in sublist]
+    selected = []
+    for f in downloads:
+        for extension in extensions:
+            if f.lower().endswith(extension):
+                selected.append(f)
+    return selected
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter()-start
+
+
+def search(url, params, page_size):
+    s = GranuleSearch(url, params, page_size=page_size)
+    start = time.perf_counter()
+    items = list(s)
+    return items, time.perf_counter()-start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Link selection and server-side granule filtering")
+    parser.add_argument("--items", type=int, default=100000)
+    parser.add_argument("--extensions", nargs="+", default=EXTENSIONS)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--server-granules", type=int, default=20000, help="granules served by the CMR stand-in")
+    args = parser.parse_args()
+
+    items = [record(i) for i in range(args.items)]
+    selector = LinkSelector(args.extensions)
+    print("{} records, {} RelatedUrls each, extensions {}".format(
+        len(items), len(items[0]["umm"]["RelatedUrls"]), " ".join(args.extensions)))
+    print("{:>12} {:>10} {:>10}".format("selection", "links", "time"))
+    best = {}
+    for _ in range(args.repeat):
+        for label, func in (("original", original), ("selector", lambda i, e: list(selector.plan(i)))):
+            links, elapsed = timed(func, items, args.extensions)
+            if elapsed < best.get(label, (None, float("inf")))[1]:
+                best[label] = (len(links), elapsed)
+    for label, (n, elapsed) in best.items():
+        print("{:>12} {:>10} {:>9.3f}s".format(label, n, elapsed))
+    print("speed-up: {:.1f}x".format(best["original"][1]/best["selector"][1]))
+
+    # Half of the served granules are short time critical (ST) ones, which a
+    # user following NRT (NR) files does not want.
+    names = ["S6A_P4_2__LR_STD__{}_{:03d}_{:03d}.nc".format("NR" if i % 2 else "ST", i // 254 + 1, i % 254 + 1)
+             for i in range(args.server_granules)]
+    granules = [granule(name, "https://archive.podaac.earthdata.nasa.gov/MOCK") for name in names]
+    nrt = LinkSelector([".nc"])
+    with cmr_server(granules) as cmr:
+        url = cmr.url+"/search/granules.umm_json"
+        print()
+        print("{:>12} {:>10} {:>10} {:>10}".format("filter", "records", "files", "search"))
+        everything, t_client = search(url, {}, 2000)
+        files = [f for f in nrt.plan(everything) if "_NR_" in f]
+        print("{:>12} {:>10} {:>10} {:>9.3f}s".format("client", len(everything), len(files), t_client))
+        filtered, t_server = search(url, granule_name_params(["*_NR_*"]), 2000)
+        files = list(nrt.plan(filtered))
+        print("{:>12} {:>10} {:>10} {:>9.3f}s".format("CMR", len(filtered), len(files), t_server))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+
+# Lookup cost of the granule manifest as it grows.  The per-file check done
+# before every download should stay flat from thousands to hundreds of
+# thousands of recorded files.
+#
+#   python3 benchmarks/bench_manifest.py --sizes 1000 10000 300000
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from s6mf.manifest import Manifest
+
+
+def record(i, data):
+    name = "S6A_P4_2__LR_STD__ST_{:03d}_{:03d}_{:06d}.nc".format(i // 254 + 1, i % 254 + 1, i)
+    return {
+        "meta": {"concept-id": "G{:010d}-POCLOUD".format(i), "revision-date": "2021-06-01T00:00:00.000Z"},
+        "umm": {
+            "GranuleUR": name[:-3],
+            "SpatialExtent": {"HorizontalSpatialDomain": {"Track": {"Cycle": i // 254 + 1, "Passes": [{"Pass": i % 254 + 1}]}}},
+            "DataGranule": {"ArchiveAndDistributionInformation": [
+                {"Name": name, "SizeInBytes": 1000000 + i, "Checksum": {"Value": "%032x" % i, "Algorithm": "MD5"}}]},
+        },
+    }, "https://archive.podaac.earthdata.nasa.gov/podaac-ops-cumulus-protected/MOCK/"+name, data+"/"+name
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Granule manifest lookup cost")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000, 300000])
+    parser.add_argument("--lookups", type=int, default=20000)
+    args = parser.parse_args()
+
+    print("{:>10} {:>14} {:>16}".format("files", "lookup (us)", "cycle query (ms)"))
+    with tempfile.TemporaryDirectory() as data:
+        with Manifest(data) as manifest:
+            have = 0
+            for size in sorted(args.sizes):
+                rows = []
+                for i in range(have, size):
+                    item, url, path = record(i, data)
+                    rows.append(manifest.row(item, url, path))
+                manifest.add_rows(rows)
+                have = size
+
+                probes = [record(random.randrange(size), data)[:2] for _ in range(args.lookups)]
+                start = time.perf_counter()
+                for item, url in probes:
+                    manifest.get(url)
+                lookup = (time.perf_counter() - start) / args.lookups * 1e6
+                start = time.perf_counter()
+                manifest.cycle(size // 254 // 2 + 1)
+                query = (time.perf_counter() - start) * 1e3
+                print("{:>10} {:>14.1f} {:>16.2f}".format(size, lookup, query))
+
+
+if __name__ == "__main__":
+    main()
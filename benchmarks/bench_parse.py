@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+
+# Peak memory and time of parsing one umm_json search page, by page size.
+# "loads" is what the scripts used to do, `loads(f.read().decode())` on the
+# whole response; "stream" is s6mf.jsonstream.ItemStream reading the same
+# bytes in 64 KiB chunks and keeping only the fields the scripts use.  The
+# records are verbose UMM-G like PO.DAAC's, about 6 KB each.
+#
+#   python3 benchmarks/bench_parse.py --page-sizes 200 2000 10000
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from s6mf.jsonstream import ItemStream
+
+CHUNK = 64 * 1024
+
+
+def record(i):
+    name = "S6A_P4_2__LR_STD__NR_{:03d}_{:03d}_20210712T083428_20210712T093041_F02".format(i // 254 + 1, i % 254 + 1)
+    url = "https://archive.podaac.earthdata.nasa.gov/podaac-ops-cumulus-protected/JASON_CS_S6A_L2_ALT_LR_STD_OST_NRT_F/"+name
+    return {
+        "meta": {"concept-id": "G{:010d}-POCLOUD".format(i), "revision-id": 1, "native-id": name,
+                 "provider-id": "POCLOUD", "format": "application/vnd.nasa.cmr.umm+json",
+                 "revision-date": "2021-07-12T10:12:44.000Z", "created-at": "2021-07-12T10:12:44.000Z"},
+        "umm": {
+            "GranuleUR": name,
+            "TemporalExtent": {"RangeDateTime": {"BeginningDateTime": "2021-07-12T08:34:28.000Z",
+                                                 "EndingDateTime": "2021-07-12T09:30:41.000Z"}},
+            "SpatialExtent": {"HorizontalSpatialDomain": {
+                "Geometry": {"GPolygons": [{"Boundary": {"Points": [
+                    {"Longitude": -180.0+k*3.6, "Latitude": -66.0+(k % 20)*6.6} for k in range(100)]}}]},
+                "Track": {"Cycle": i // 254 + 1, "Passes": [{"Pass": i % 254 + 1}]}}},
+            "DataGranule": {"DayNightFlag": "Unspecified", "ProductionDateTime": "2021-07-12T10:05:00.000Z",
+                            "ArchiveAndDistributionInformation": [
+                                {"Name": name+".nc", "SizeInBytes": 2500000+i,
+                                 "Checksum": {"Value": "%032x" % i, "Algorithm": "MD5"}},
+                                {"Name": name+".nc.md5", "SizeInBytes": 32}]},
+            "Platforms": [{"ShortName": "Sentinel-6A", "Instruments": [
+                {"ShortName": "Poseidon-4"}, {"ShortName": "AMR-C"}, {"ShortName": "DORIS"}, {"ShortName": "GNSS-POD"}]}],
+            "MeasuredParameters": [{"ParameterName": p} for p in (
+                "ssha", "swh", "wind_speed_alt", "sig0", "range", "mean_sea_surface", "geoid", "tide_ocean",
+                "iono_cor_alt", "rad_wet_tropo_cor", "model_dry_tropo_cor", "sea_state_bias")],
+            "AdditionalAttributes": [{"Name": a, "Values": ["value of "+a]} for a in (
+                "Timeliness", "Baseline", "PassDirection", "ProcessingCenter", "OrbitType", "ProductVersion")],
+            "PGEVersionClass": {"PGEName": "Sentinel-6 GPP", "PGEVersion": "F02"},
+            "ProviderDates": [{"Date": "2021-07-12T10:12:44.000Z", "Type": t} for t in ("Insert", "Update")],
+            "CollectionReference": {"ShortName": "JASON_CS_S6A_L2_ALT_LR_STD_OST_NRT_F", "Version": "F"},
+            "RelatedUrls": [
+                {"URL": url+".nc", "Type": "GET DATA", "Description": "Download "+name+".nc"},
+                {"URL": url.replace("https://archive.podaac.earthdata.nasa.gov/", "s3://")+".nc",
+                 "Type": "GET DATA VIA DIRECT ACCESS"},
+                {"URL": url+".nc.md5", "Type": "EXTENDED METADATA"},
+                {"URL": url+".cmr.json", "Type": "EXTENDED METADATA"},
+                {"URL": "https://opendap.earthdata.nasa.gov/collections/C1968980576-POCLOUD/granules/"+name,
+                 "Type": "USE SERVICE API", "Subtype": "OPENDAP DATA"},
+            ],
+        },
+    }
+
+
+def chunks(body):
+    view = memoryview(body)
+    for i in range(0, len(body), CHUNK):
+        yield bytes(view[i:i+CHUNK])
+
+
+def loads(body):
+    # The response is read whole first, as urlopen(...).read() did
+    data = b"".join(chunks(body))
+    results = json.loads(data.decode())
+    return sum(len(r["umm"]["RelatedUrls"]) for r in results["items"])
+
+
+def stream(body):
+    return sum(len(r["umm"]["RelatedUrls"]) for r in ItemStream(chunks(body)))
+
+
+def measure(func, body):
+    start = time.perf_counter()
+    links = func(body)
+    elapsed = time.perf_counter()-start
+    tracemalloc.start()
+    func(body)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return links, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Peak memory and time of parsing a umm_json page")
+    parser.add_argument("--page-sizes", type=int, nargs="+", default=[200, 2000, 10000])
+    args = parser.parse_args()
+
+    print("{:>6} {:>10} {:>8} {:>10} {:>10}".format("page", "MB", "parser", "time", "peak MB"))
+    for size in args.page_sizes:
+        body = json.dumps({"hits": size, "took": 120, "items": [record(i) for i in range(size)]}).encode()
+        results = {}
+        for label, func in (("loads", loads), ("stream", stream)):
+            results[label] = measure(func, body)
+            links, elapsed, peak = results[label]
+            print("{:>6} {:>10.1f} {:>8} {:>9.3f}s {:>10.1f}".format(
+                size, len(body)/1e6, label, elapsed, peak/1e6))
+        if results["loads"][0] != results["stream"][0]:
+            sys.exit("parsers disagree: {} and {} links".format(results["loads"][0], results["stream"][0]))
+
+
+if __name__ == "__main__":
+    main()
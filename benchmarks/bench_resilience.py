@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+# Downloads and searches against local stand-ins that inject failures.
+#
+#   throttling - the data server serves `--capacity` files at once and answers
+#                429 with Retry-After to anything more; a fixed per-host limit
+#                is compared with the adaptive one
+#   outage     - the data server answers 503 to everything for a few seconds;
+#                the circuit breaker holds the workers back until it recovers
+#   search     - CMR refuses the first requests with 503/429
+#   trial      - the half-open trial of an open breaker gets a 404, or never
+#                reports back; the breaker must let requests through again
+#                (exits non-zero if it does not)
+#
+#   python3 benchmarks/bench_resilience.py --workers 16 --capacity 4
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from os.path import basename
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mock_servers import Faults, cmr_server, data_server, granule
+from s6mf.download import DownloadEngine
+from s6mf.resilience import Backoff, HostHealth
+from s6mf.search import GranuleSearch
+from s6mf.session import Session
+
+
+def download(files, workers, adaptive, backoff, reset_after=30.0):
+    session = Session(pool_size=workers)
+    session.health = HostHealth(threshold=5, reset_after=reset_after, adaptive=adaptive)
+    engine = DownloadEngine(workers=workers, per_host=workers, session=session, backoff=backoff)
+    with tempfile.TemporaryDirectory() as data:
+        start = time.monotonic()
+        results = engine.run((files.url+"/"+name, data+"/"+basename(name)) for name in files.names)
+        elapsed = time.monotonic()-start
+    limit = session.health.limit(files.url, workers)
+    breaker = session.health.breaker(files.url)
+    return sum(r.ok for r in results), elapsed, limit, breaker
+
+
+def trial(status, reset_after=0.2):
+    """
+    Open a breaker, let its trial request end with HTTP `status` (None: no
+    outcome recorded at all) and return whether requests get through after
+    another pause.
+    """
+    health = HostHealth(threshold=2, reset_after=reset_after)
+    url = "http://localhost/f.nc"
+    for _ in range(2):
+        health.record(url, 503)
+    breaker = health.breaker(url)
+    if not breaker.wait(reset_after*3):
+        return False
+    if status is not None:
+        health.record(url, status)
+    return breaker.wait(reset_after*3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Retries, backoff, circuit breaker and adaptive concurrency")
+    parser.add_argument("--files", type=int, default=64)
+    parser.add_argument("--size-kb", type=int, default=256)
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--capacity", type=int, default=4, help="files the throttling server serves at once")
+    parser.add_argument("--outage", type=float, default=3.0, help="seconds of 503s in the outage test")
+    args = parser.parse_args()
+    backoff = Backoff(base=0.2, cap=5)
+
+    print("throttling: {} files, {} workers, server capacity {}".format(args.files, args.workers, args.capacity))
+    print("{:>10} {:>6} {:>6} {:>10} {:>10} {:>10}".format("limit", "ok", "429s", "peak", "final", "time"))
+    for adaptive in (False, True):
+        faults = Faults(capacity=args.capacity, retry_after=1)
+        with data_server(args.files, size=args.size_kb*1024, latency=0.02, bandwidth=2*1024*1024,
+                         faults=faults) as files:
+            ok, elapsed, limit, _ = download(files, args.workers, adaptive, backoff)
+        print("{:>10} {:>6} {:>6} {:>10} {:>10.1f} {:>9.2f}s".format(
+            "adaptive" if adaptive else "fixed", ok, faults.refused.get(429, 0), faults.peak, limit.limit, elapsed))
+
+    print()
+    print("outage: every request refused with 503 for the first {:.1f}s".format(args.outage))
+    faults = Faults(outage=(0, args.outage), retry_after=None)
+    with data_server(args.files, size=args.size_kb*1024, latency=0.02, bandwidth=0, faults=faults) as files:
+        ok, elapsed, _, breaker = download(files, args.workers, True, backoff, reset_after=1.0)
+    print("{} of {} files in {:.2f}s, {} requests refused, circuit opened {} times".format(
+        ok, args.files, elapsed, faults.refused.get(503, 0), breaker.opened))
+
+    print()
+    faults = Faults(fail_first=[503, 429, 503], retry_after=1)
+    with cmr_server([granule("f{}.nc".format(i), "http://localhost") for i in range(50)], faults=faults) as cmr:
+        start = time.monotonic()
+        search = GranuleSearch(cmr.url+"/search/granules.umm_json", {}, page_size=20, backoff=backoff)
+        n = len(list(search))
+        print("search: {} of {} granules after {} refusals in {:.2f}s".format(
+            n, search.hits, sum(faults.refused.values()), time.monotonic()-start))
+
+    print()
+    stuck = []
+    for status in (200, 404, 401, 416, None):
+        recovered = trial(status)
+        print("trial {:>4}: breaker {}".format(status or "lost", "recovers" if recovered else "stays open"))
+        if not recovered:
+            stuck.append(status)
+    if stuck:
+        sys.exit("breaker stuck open after a trial with {}".format(stuck))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+
+# Paged CMR search feeding the download engine, against local stand-ins.
+# Compares buffering every search page before downloading with streaming the
+# pages into the engine, and checks that no granule beyond the first page is
+# dropped.
+#
+#   python3 benchmarks/bench_search.py --granules 400 --page-size 50
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from os.path import basename
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mock_servers import cmr_server, data_server, granule
+from s6mf.download import DownloadEngine
+from s6mf.search import GranuleSearch
+
+
+def links(items):
+    for r in items:
+        for u in r['umm']['RelatedUrls']:
+            if u['Type'] == "GET DATA" and u.get('Subtype') != "OPENDAP DATA":
+                yield u['URL']
+
+
+def run(cmr_url, page_size, workers, streaming):
+    search = GranuleSearch(cmr_url+"/search/granules.umm_json", {'ShortName': "MOCK"}, page_size=page_size)
+    with tempfile.TemporaryDirectory() as data:
+        start = time.monotonic()
+        items = iter(search) if streaming else list(search)
+        jobs = ((f, data+"/"+basename(f)) for f in links(items))
+        first = []
+        results = DownloadEngine(workers=workers, per_host=workers).run(
+            jobs, callback=lambda r: first or first.append(time.monotonic()-start))
+        return search.hits, results, first[0], time.monotonic()-start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Paged search and download against local stand-ins")
+    parser.add_argument("--granules", type=int, default=400)
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--page-latency", type=float, default=0.25, help="seconds per search page")
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    with data_server(args.granules, size=64 * 1024, latency=0.02) as files:
+        granules = [granule(name, files.url) for name in files.names]
+        with cmr_server(granules, args.page_latency) as cmr:
+            print("{:>10} {:>6} {:>10} {:>12} {:>10}".format("mode", "hits", "files", "first file", "total"))
+            for streaming in (False, True):
+                hits, results, first, total = run(cmr.url, args.page_size, args.workers, streaming)
+                ok = sum(r.ok for r in results)
+                if ok != hits:
+                    sys.exit("downloaded {} files for {} hits".format(ok, hits))
+                print("{:>10} {:>6} {:>10} {:>11.2f}s {:>9.2f}s".format(
+                    "streaming" if streaming else "buffered", hits, ok, first, total))
+
+
+if __name__ == "__main__":
+    main()
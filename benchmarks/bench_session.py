@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+
+# Connection reuse of the pooled session against the urllib opener the scripts
+# used before, both downloading one file at a time through an Earthdata Login
+# style redirect.  Every new connection to the data server costs
+# --connect-latency seconds, standing in for the TCP and TLS handshakes.
+#
+#   python3 benchmarks/bench_session.py --files 50 --connect-latency 0.05
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from http.cookiejar import CookieJar
+from urllib import request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mock_servers import data_server, edl_server
+from s6mf.download import DownloadEngine
+from s6mf.session import Session
+
+CREDENTIALS = ("user", "password")
+
+
+def urllib_opener(edl):
+    manager = request.HTTPPasswordMgrWithDefaultRealm()
+    manager.add_password(None, edl.login_url, *CREDENTIALS)
+    return request.build_opener(request.HTTPBasicAuthHandler(manager),
+                                request.HTTPCookieProcessor(CookieJar()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pooled session vs. one connection per request")
+    parser.add_argument("--files", type=int, default=50)
+    parser.add_argument("--size-kb", type=int, default=256)
+    parser.add_argument("--connect-latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    print("{:>9} {:>12} {:>7} {:>9}".format("client", "connections", "logins", "seconds"))
+    for client in ("urllib", "session"):
+        with edl_server(CREDENTIALS) as edl, \
+                data_server(args.files, args.size_kb * 1024, latency=0, bandwidth=0,
+                            connect_latency=args.connect_latency, login_url=edl.login_url) as files, \
+                tempfile.TemporaryDirectory() as data:
+            urls = [files.url+"/"+name for name in files.names]
+            start = time.monotonic()
+            if client == "urllib":
+                request.install_opener(urllib_opener(edl))
+                for url in urls:
+                    request.urlretrieve(url, data+"/"+os.path.basename(url))
+            else:
+                session = Session(pool_size=1, auth_host=edl.host, credentials=CREDENTIALS)
+                results = DownloadEngine(workers=1, session=session).run(
+                    (url, data+"/"+os.path.basename(url)) for url in urls)
+                assert all(r.ok for r in results), [r.error for r in results if not r.ok]
+            elapsed = time.monotonic() - start
+            print("{:>9} {:>12} {:>7} {:>9.2f}".format(client, files.connections, edl.logins, elapsed))
+            if client == "session":
+                print("session: "+str(session.stats))
+
+
+if __name__ == "__main__":
+    main()
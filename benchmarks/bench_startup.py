@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+
+# Startup cost of the s6mf package and of calling a sync from another
+# program.  The first table times fresh interpreters importing the package or
+# running a command, best of --runs, next to an empty interpreter; the second
+# lists the packages that take longest to import for a sync (python -X
+# importtime).  The last one compares an orchestrator running
+# `python -m s6mf sync` for every update with one calling s6mf.sync.sync()
+# in-process with a shared session, against local CMR and data stand-ins
+# where nothing new turns up after the first update.
+#
+#   python3 benchmarks/bench_startup.py --runs 10 --syncs 20
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from mock_servers import cmr_server, data_server, granule
+
+COMMANDS = [
+    ("python (nothing)", ["-c", "pass"]),
+    ("import s6mf", ["-c", "import s6mf"]),
+    ("import s6mf.links", ["-c", "import s6mf.links"]),
+    ("import s6mf.sync", ["-c", "import s6mf.sync"]),
+    ("-m s6mf --help", ["-m", "s6mf", "--help"]),
+    ("-m s6mf sync --help", ["-m", "s6mf", "sync", "--help"]),
+    ("-m s6mf plan --help", ["-m", "s6mf", "plan", "--help"]),
+]
+SHORT_NAME = "MOCK"
+
+
+def best(argv, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable]+argv, cwd=ROOT, check=True, stdout=subprocess.DEVNULL)
+        times.append(time.perf_counter()-start)
+    return min(times)
+
+
+def imports(code):
+    """
+    Cumulative import time in seconds of the top level packages that running
+    `code` imports, from python -X importtime.
+    """
+    err = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT, check=True,
+                         capture_output=True, text=True).stderr
+    times = {}
+    for line in err.splitlines()[1:]:
+        _, cumulative, name = line.split("|")
+        name = name.strip()
+        if "." not in name:
+            times[name] = max(times.get(name, 0), int(cumulative)/1e6)
+    return times
+
+
+def slowest_imports(module, count):
+    """
+    The packages outside s6mf that importing `module` loads on top of those of
+    an empty interpreter, slowest first.
+    """
+    startup = imports("pass")
+    rows = [(seconds, name) for name, seconds in imports("import "+module).items()
+            if name not in startup and not name.startswith(("s6mf", "_"))]
+    return sorted(rows, reverse=True)[:count]
+
+
+def in_process(cmr, data, syncs):
+    from s6mf.collection import Collection
+    from s6mf.download import DownloadEngine
+    from s6mf.session import Session
+    from s6mf.sync import sync
+
+    session = Session()
+    engine = DownloadEngine(8, session=session)
+    collection = Collection(SHORT_NAME, data, mins=10**7)
+    first = time.perf_counter()
+    result = sync(collection, cmr.url, session, engine=engine)
+    first = time.perf_counter()-first
+    start = time.perf_counter()
+    for _ in range(syncs):
+        sync(collection, cmr.url, session, engine=engine)
+    return first, (time.perf_counter()-start)/syncs, result.downloaded
+
+
+def subprocesses(cmr, data, syncs):
+    command = [sys.executable, "-m", "s6mf", "sync", data, SHORT_NAME, "--cmr", cmr.url, "--mins", str(10**7)]
+    first = time.perf_counter()
+    subprocess.run(command, cwd=ROOT, check=True, stdout=subprocess.DEVNULL)
+    first = time.perf_counter()-first
+    start = time.perf_counter()
+    for _ in range(syncs):
+        subprocess.run(command, cwd=ROOT, check=True, stdout=subprocess.DEVNULL)
+    return first, (time.perf_counter()-start)/syncs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import, command line and repeated sync cost of the s6mf package")
+    parser.add_argument("--runs", type=int, default=10, help="interpreters started per command, the fastest counts")
+    parser.add_argument("--syncs", type=int, default=20, help="syncs after the first one")
+    parser.add_argument("--files", type=int, default=16)
+    args = parser.parse_args()
+
+    print("{:<22} {:>9}".format("started", "ms"))
+    for name, argv in COMMANDS:
+        print("{:<22} {:>9.1f}".format(name, best(argv, args.runs)*1000))
+
+    print("\nslowest packages imported by s6mf.sync:")
+    for seconds, name in slowest_imports("s6mf.sync", 8):
+        print("  {:<30} {:>7.1f} ms".format(name, seconds*1000))
+
+    with data_server(args.files, 256*1024, latency=0.0, bandwidth=0) as files:
+        granules = [granule(name, files.url, files.payload) for name in files.names]
+        with cmr_server(granules, latency=0.005) as cmr:
+            print("\n{} granules, then {} syncs with nothing new".format(args.files, args.syncs))
+            print("{:<22} {:>12} {:>15}".format("orchestrator", "first (ms)", "each next (ms)"))
+            with tempfile.TemporaryDirectory() as data:
+                first, each = subprocesses(cmr, data, args.syncs)
+                print("{:<22} {:>12.1f} {:>15.1f}".format("python -m s6mf sync", first*1000, each*1000))
+            with tempfile.TemporaryDirectory() as data:
+                first, each, downloaded = in_process(cmr, data, args.syncs)
+                print("{:<22} {:>12.1f} {:>15.1f}".format("s6mf.sync.sync()", first*1000, each*1000))
+            if downloaded != args.files:
+                sys.exit("only {} of {} files downloaded".format(downloaded, args.files))
+
+
+if __name__ == "__main__":
+    main()
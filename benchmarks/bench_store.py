@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+
+# Reading one along-track variable over a cycle from the per-pass granules
+# against reading it from the columnar store (s6mf.store), for synthetic
+# Sentinel-6 MF granules as written by bench_subset.py.  The store is built
+# incrementally, one file at a time, as a sync would.  Needs the netCDF4
+# package.
+#
+#   python3 benchmarks/bench_store.py --passes 32 --variables 20
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from netCDF4 import Dataset
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_subset import PASS_SECONDS, write_granule
+from s6mf.store import Store
+
+CYCLE = 12
+VARIABLE = "ku/var_03"
+
+
+def read_files(paths, group):
+    values = []
+    for path in paths:
+        with Dataset(path) as nc:
+            values.append(nc[group.strip("/")+"/"+VARIABLE][:])
+    return np.ma.concatenate(values)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Whole-cycle reads from granules and from the columnar store")
+    parser.add_argument("--passes", type=int, default=32)
+    parser.add_argument("--variables", type=int, default=20, help="variables per band subgroup")
+    parser.add_argument("--group", default="/data_20")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for p in range(1, args.passes+1):
+            path = os.path.join(tmp, "S6A_P4_2__LR_STD__ST_{:03d}_{:03d}_x.nc".format(CYCLE, p))
+            write_granule(path, args.variables, t0=6.6e8+p*PASS_SECONDS, lon0=140+p*180, cycle=CYCLE, pass_number=p)
+            paths.append(path)
+        size = sum(os.path.getsize(p) for p in paths)
+        print("{} granules of cycle {}, {:.1f} MB".format(len(paths), CYCLE, size/1e6))
+
+        store = Store(os.path.join(tmp, "s6mf.zarr"))
+        start = time.perf_counter()
+        for path in paths:
+            store.add(path)
+        elapsed = time.perf_counter()-start
+        print("store built one file at a time: {:.2f}s ({:.3f}s per file)".format(elapsed, elapsed/len(paths)))
+
+        start = time.perf_counter()
+        from_files = read_files(paths, args.group)
+        files_time = time.perf_counter()-start
+        start = time.perf_counter()
+        from_store = store.read(CYCLE, VARIABLE, args.group)
+        store_time = time.perf_counter()-start
+        print("{} {} over the cycle ({} records):".format(args.group, VARIABLE, len(from_store)))
+        print("  open every granule: {:.3f}s".format(files_time))
+        print("  store.read:         {:.3f}s ({:.0f}x)".format(store_time, files_time/store_time))
+        same = np.ma.allclose(from_files, from_store) and len(from_files) == len(from_store)
+        print("same values: "+str(same))
+        if not same:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
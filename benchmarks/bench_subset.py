@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+
+# Local subsetting of a synthetic Sentinel-6 MF granule laid out like the L2
+# products (data_01 and data_20 groups with ku and c subgroups, packed
+# integer variables), compared with reading every variable whole and masking
+# in memory.  A slice only costs the compressed chunks it touches, so the
+# gain depends on how the granule is chunked (--chunk records, 0 = one chunk
+# per variable).  Needs the netCDF4 package.
+#
+#   python3 benchmarks/bench_subset.py --bbox -10,30,10,50 --variables 40 --chunk 4096
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from netCDF4 import Dataset
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from s6mf.subset import bbox_mask, subset_file
+
+# One pass: half an orbit of 6745 s, 1 Hz and 20 Hz records
+PASS_SECONDS = 3372
+
+
+def write_granule(path, variables, chunk=4096, t0=6.6e8, lon0=140, cycle=12, pass_number=245):
+    """
+    An ascending pass starting at `t0` (seconds since 2000) whose equator
+    crossing is at longitude `lon0`-180.
+    """
+    with Dataset(path, "w", format="NETCDF4") as nc:
+        nc.setncatts({"title": "Synthetic Sentinel-6 MF L2 granule", "cycle_number": cycle,
+                      "pass_number": pass_number})
+        for name, hz in (("data_01", 1), ("data_20", 20)):
+            n = PASS_SECONDS*hz
+            group = nc.createGroup(name)
+            group.createDimension("time", n)
+            chunks = dict(chunksizes=(min(chunk, n),)) if chunk else {}
+            phase = np.linspace(-np.pi/2, np.pi/2, n)
+            lat = np.degrees(np.arcsin(np.sin(np.radians(66.04))*np.sin(phase)))
+            lon = np.mod(np.degrees(phase)+lon0, 360)-180
+            time_var = group.createVariable("time", "f8", ("time",), zlib=True)
+            time_var.units = "seconds since 2000-01-01 00:00:00.0"
+            time_var[:] = t0+np.arange(n)/hz
+            for var, values in (("latitude", lat), ("longitude", lon)):
+                v = group.createVariable(var, "i4", ("time",), zlib=True, fill_value=2147483647)
+                v.scale_factor = 1e-6
+                v.units = "degrees_north" if var == "latitude" else "degrees_east"
+                v[:] = values
+            for band in ("ku", "c"):
+                sub = group.createGroup(band)
+                for i in range(variables):
+                    v = sub.createVariable("var_{:02d}".format(i), "i4", ("time",), zlib=True, fill_value=2147483647,
+                                           **chunks)
+                    v.scale_factor = 1e-4
+                    v[:] = np.random.default_rng(i).normal(size=n)
+
+
+def read_all(path, bbox):
+    """
+    Read every along-track variable whole and keep the records inside `bbox`.
+    """
+    kept = 0
+    with Dataset(path) as nc:
+        for name in ("data_01", "data_20"):
+            group = nc.groups[name]
+            mask = bbox_mask(group["latitude"][:], group["longitude"][:], bbox)
+            for sub in group.groups.values():
+                for v in sub.variables.values():
+                    kept += v[:][mask].size
+    return kept
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local subsetting against reading whole granules")
+    parser.add_argument("--bbox", default="-10,30,10,50")
+    parser.add_argument("--variables", type=int, default=40, help="variables per band subgroup")
+    parser.add_argument("--chunk", type=int, default=4096, help="records per chunk of the granule's variables")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        granule = os.path.join(tmp, "S6A_P4_2__LR_STD__ST_012_245.nc")
+        write_granule(granule, args.variables, args.chunk)
+        print("granule: {:.1f} MB, bbox {}".format(os.path.getsize(granule)/1e6, args.bbox))
+
+        start = time.perf_counter()
+        read_all(granule, args.bbox)
+        print("read whole and mask: {:.3f}s (nothing written)".format(time.perf_counter()-start))
+
+        out = os.path.join(tmp, "subset.nc")
+        start = time.perf_counter()
+        kept = subset_file(granule, out, args.bbox)
+        elapsed = time.perf_counter()-start
+        if kept is None:
+            sys.exit("no records inside "+args.bbox)
+        print("subset_file:         {:.3f}s, {} records kept, {:.2f} MB written (compressed)".format(
+            elapsed, kept, os.path.getsize(out)/1e6))
+
+        with Dataset(granule) as src, Dataset(out) as dst:
+            mask = bbox_mask(src["data_20/latitude"][:], src["data_20/longitude"][:], args.bbox)
+            same = np.array_equal(src["data_20/ku/var_00"][:][mask], dst["data_20/ku/var_00"][:])
+            print("subset matches the masked source: "+str(same))
+            if not same:
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+
+# The search and download flow of the scripts, end to end, against the local
+# stand-ins for CMR, its token service, Earthdata Login and the archive, so a
+# change anywhere on that path can be measured without NASA systems.  Every
+# scenario creates a CMR token, pages through a created_at or cycle/pass
+# search, logs in through the Earthdata Login redirects, and downloads and
+# verifies the files as the search pages arrive:
+#
+#   created_at - new granules since a timestamp, as the usingshortname script
+#   cycle_pass - one search per cycle for a set of passes, as the other script
+#   faults     - created_at with slow pages, dropped and corrupted transfers,
+#                and a share of 503s from both CMR and the archive
+#   chunked    - a few large files as parallel byte ranges
+#
+# Each scenario is run --repeat times and the median of every measure kept.
+# --save writes them to a JSON file; --baseline compares the run with such a
+# file and exits with status 1 if the throughput dropped, or a time or latency
+# grew, by more than --tolerance.  Retries back off for at most a
+# second here, instead of the minute the scripts allow.
+#
+#   python3 benchmarks/bench_suite.py --save baseline.json
+#   python3 benchmarks/bench_suite.py --baseline baseline.json --repeat 5
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mock_servers import TOKEN_PATH, Faults, cmr_server, data_server, edl_server, granule
+from s6mf.download import DownloadEngine
+from s6mf.links import LinkSelector
+from s6mf.planner import CyclePassPlanner, parse_numbers
+from s6mf.resilience import Backoff
+from s6mf.search import GranuleSearch
+from s6mf.session import Session
+from s6mf.telemetry import Telemetry
+from s6mf.tokens import TokenCache
+from s6mf.umm import file_info
+
+CREDENTIALS = ("user", "password")
+TOKEN_XML = "<token><username>user</username><password>password</password><client_id>bench</client_id></token>"
+EXTENSIONS = (".nc", ".bin")
+CREATED = datetime(2021, 6, 1)
+
+BASE = dict(search="created_at", files=96, size_kb=512, latency=0.02, bandwidth_mb=8.0, cmr_latency=0.02,
+            page_size=16, workers=8, per_host=4, retries=5, chunk_mb=0, drops=0, corruptions=0, error_rate=0.0,
+            cmr_error_rate=0.0)
+SCENARIOS = {
+    "created_at": BASE,
+    "cycle_pass": dict(BASE, search="cycle_pass", files=508, cycles="1-2", passes="1-40"),
+    "faults": dict(BASE, cmr_latency=0.1, retries=10, drops=6, corruptions=3, error_rate=0.05, cmr_error_rate=0.1),
+    "chunked": dict(BASE, files=4, size_kb=16384, bandwidth_mb=16.0, chunk_mb=2),
+}
+
+# name, format, True if larger is better
+MEASURES = [
+    ("MB/s", "{:.2f}", True),
+    ("seconds", "{:.3f}", False),
+    ("token", "{:.3f}", False),
+    ("search p50", "{:.3f}", False),
+    ("ttfb p50", "{:.3f}", False),
+    ("file p95", "{:.3f}", False),
+]
+# Differences in seconds too small to count as a regression however large
+# they are relatively
+SLACK = 0.01
+
+
+def records(files, s):
+    """
+    UMM-G records of the data server's files, one pass each (its name ends in
+    _CCC_PPP) and created a minute apart.
+    """
+    out = []
+    for i, name in enumerate(files.names):
+        cycle, number = name.rsplit(".", 1)[0].split("_")[-2:]
+        created = (CREATED+timedelta(minutes=i)).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+        out.append(granule(name, files.url, files.payload, int(cycle), [int(number)], created))
+    return out
+
+
+def since(s):
+    """
+    The created_at of the middle granule, so a created_at search finds the
+    second half of them.
+    """
+    return CREATED+timedelta(minutes=s["files"]//2)
+
+
+def wanted(s, granules):
+    """
+    The number of granules the search of scenario `s` should find.
+    """
+    if s["search"] == "cycle_pass":
+        cycles, passes = set(parse_numbers(s["cycles"])), set(parse_numbers(s["passes"]))
+        return sum(g["umm"]["SpatialExtent"]["HorizontalSpatialDomain"]["Track"]["Cycle"] in cycles and
+                   g["umm"]["SpatialExtent"]["HorizontalSpatialDomain"]["Track"]["Passes"][0]["Pass"] in passes
+                   for g in granules)
+    return sum(g["meta"]["created-at"] >= since(s).strftime("%Y-%m-%dT%H:%M:%S") for g in granules)
+
+
+def search(s, cmr, session, token, backoff):
+    url = cmr.url+"/search/granules.umm_json"
+    params = {"ShortName": "MOCK"}
+    if s["search"] == "cycle_pass":
+        planner = CyclePassPlanner(url, params, s["cycles"], s["passes"], page_size=s["page_size"], rate=0,
+                                   session=session, token=token, stream=True)
+        return planner.granules()
+    params["created_at"] = since(s).strftime("%Y-%m-%dT%H:%M:%SZ")
+    return GranuleSearch(url, params, page_size=s["page_size"], session=session, token=token, stream=True,
+                         backoff=backoff)
+
+
+def run(s):
+    """
+    One run of scenario `s`; its measures and the files it should have got.
+    """
+    backoff = Backoff(base=0.05, cap=1.0, max_retry_after=1.0)
+    data_faults = Faults(error_rate=s["error_rate"], retry_after=None, seed=1) if s["error_rate"] else None
+    cmr_faults = Faults(error_rate=s["cmr_error_rate"], retry_after=None, seed=2) if s["cmr_error_rate"] else None
+    size = s["size_kb"]*1024
+    with edl_server(CREDENTIALS) as edl, \
+            data_server(s["files"], size, s["latency"], int(s["bandwidth_mb"]*1024*1024), EXTENSIONS,
+                        drop_after=size//3, drops=s["drops"], corruptions=s["corruptions"],
+                        login_url=edl.login_url, faults=data_faults) as files, \
+            tempfile.TemporaryDirectory() as tmp:
+        granules = records(files, s)
+        expected = wanted(s, granules)
+        with cmr_server(granules, s["cmr_latency"], require_token=True, faults=cmr_faults) as cmr:
+            session = Session(pool_size=s["per_host"]*4, auth_host=edl.host, credentials=CREDENTIALS)
+            session.telemetry = telemetry = Telemetry()
+            token_url = cmr.url+TOKEN_PATH
+            token = TokenCache(lambda: session.post(token_url, data=TOKEN_XML).json()["token"]["id"],
+                               token_url+" bench", tmp+"/tokens.json", telemetry=telemetry)
+            links = LinkSelector(EXTENSIONS)
+            engine = DownloadEngine(s["workers"], s["per_host"], chunk_size=int(s["chunk_mb"]*1024*1024) or None,
+                                    retries=s["retries"], session=session, backoff=backoff)
+            start = time.monotonic()
+            jobs = ((url, tmp+"/"+os.path.basename(url), file_info(item, url))
+                    for item in search(s, cmr, session, token, backoff) for url in links.links(item))
+            results = engine.run(jobs)
+            elapsed = time.monotonic()-start
+        phase = telemetry.phase
+        measures = {
+            "MB/s": telemetry.bytes/1e6/elapsed,
+            "seconds": elapsed,
+            "token": phase("token")["seconds"],
+            "search p50": phase("search_page")["p50"] or 0.0,
+            "ttfb p50": phase("ttfb")["p50"] or 0.0,
+            "file p95": phase("file")["p95"] or 0.0,
+        }
+        ok = sum(r.ok for r in results)
+        failed = [r for r in results if not r.ok]
+        return measures, ok, expected, failed, edl.logins
+
+
+def regressions(name, now, baseline, tolerance):
+    rows = []
+    for measure, fmt, higher in MEASURES:
+        before = baseline.get(measure)
+        value = now[measure]
+        if before is None:
+            rows.append((name, measure, "-", fmt.format(value), "", ""))
+            continue
+        change = (value-before)/before if before else 0.0
+        worse = -change if higher else change
+        flag = "REGRESSION" if worse > tolerance and (higher or value-before > SLACK) else ""
+        rows.append((name, measure, fmt.format(before), fmt.format(value), "{:+.0%}".format(change), flag))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end search and download benchmarks against local stand-ins")
+    parser.add_argument("scenarios", nargs="*", help="scenarios to run, all by default: "+", ".join(SCENARIOS))
+    parser.add_argument("--repeat", type=int, default=3, help="runs per scenario, the median is kept")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare with the results saved in this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.3,
+                        help="relative change of a measure that counts as a regression")
+    args = parser.parse_args()
+
+    unknown = set(args.scenarios)-set(SCENARIOS)
+    if unknown:
+        parser.error("no scenario "+", ".join(sorted(unknown)))
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["scenarios"]
+    results = {}
+    rows = []
+    broken = False
+    for name in args.scenarios or list(SCENARIOS):
+        runs = []
+        for _ in range(max(1, args.repeat)):
+            measures, ok, expected, failed, logins = run(SCENARIOS[name])
+            if failed or ok != expected:
+                print("{}: {} of {} files downloaded{}".format(
+                    name, ok, expected, ", first error: "+str(failed[0].error) if failed else ""))
+                broken = True
+            runs.append(measures)
+        results[name] = {m: statistics.median(r[m] for r in runs) for m, _, _ in MEASURES}
+        print("{}: {} files, {} logins, {:.2f} MB/s".format(name, expected, logins, results[name]["MB/s"]))
+        rows += regressions(name, results[name], baseline.get(name, {}), args.tolerance)
+
+    print("{:<11} {:<11} {:>10} {:>10} {:>7}".format("scenario", "measure", "baseline", "now", "change"))
+    for row in rows:
+        print("{:<11} {:<11} {:>10} {:>10} {:>7} {}".format(*row).rstrip())
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"time": datetime.utcnow().isoformat()+"Z", "python": platform.python_version(),
+                       "machine": platform.node(), "repeat": args.repeat, "scenarios": results}, f, indent=1)
+    regressed = [row for row in rows if row[-1]]
+    if regressed:
+        print("{} regressions beyond {:.0%}".format(len(regressed), args.tolerance))
+    if broken or regressed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
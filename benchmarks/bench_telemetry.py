@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+# A whole run against local stand-ins for Earthdata Login, the CMR token
+# service, CMR search and the data server, with telemetry written as JSON
+# lines and in the Prometheus text format.  Prints the run summary, the events
+# per phase found in the JSON lines and the run time with and without the
+# JSON lines file, i.e. what writing them costs.
+#
+#   python3 benchmarks/bench_telemetry.py --files 200 --workers 8
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mock_servers import TOKEN_PATH, cmr_server, data_server, edl_server, granule
+from s6mf.download import DownloadEngine
+from s6mf.links import LinkSelector
+from s6mf.search import GranuleSearch
+from s6mf.session import Session
+from s6mf.telemetry import Telemetry
+from s6mf.tokens import TokenCache
+from s6mf.umm import file_info
+
+CREDENTIALS = ("user", "password")
+
+
+def run(args, jsonl=None, prometheus=None):
+    with edl_server(CREDENTIALS) as edl, \
+            data_server(args.files, args.size_kb*1024, latency=0.01, bandwidth=0, login_url=edl.login_url) as files, \
+            tempfile.TemporaryDirectory() as data:
+        granules = [granule(name, files.url, files.payload) for name in files.names]
+        with cmr_server(granules, require_token=True) as cmr:
+            session = Session(pool_size=args.workers, auth_host=edl.host, credentials=CREDENTIALS)
+            session.telemetry = Telemetry(jsonl, prometheus)
+            token = TokenCache(lambda: session.post(cmr.url+TOKEN_PATH, data="").json()["token"]["id"],
+                               "bench", path=data+"/tokens.json", telemetry=session.telemetry)
+            start = time.monotonic()
+            search = GranuleSearch(cmr.url+"/search/granules.umm_json", {}, page_size=args.page_size,
+                                   session=session, token=token, stream=True)
+            plan = LinkSelector([".nc", ".bin"]).plan(search)
+            engine = DownloadEngine(workers=args.workers, session=session)
+            results = engine.run((url, data+"/"+os.path.basename(url), file_info(r, url)) for url, r in plan.items())
+            elapsed = time.monotonic()-start
+            session.telemetry.close()
+    assert all(r.ok for r in results), [r.error for r in results if not r.ok]
+    return session.telemetry, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Telemetry of a run against local stand-in servers")
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--size-kb", type=int, default=256)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--page-size", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as out:
+        jsonl, prometheus = out+"/telemetry.jsonl", out+"/s6mf.prom"
+        telemetry, with_file = run(args, jsonl, prometheus)
+        print(telemetry.summary())
+        print()
+        with open(jsonl) as f:
+            phases = Counter(json.loads(line)["phase"] for line in f)
+        print("JSON lines: "+", ".join("{} {}".format(n, phase) for phase, n in phases.items()))
+        with open(prometheus) as f:
+            print("Prometheus: {} samples".format(sum(1 for line in f if not line.startswith("#"))))
+    _, without_file = run(args)
+    print("run time: {:.2f}s with the JSON lines file, {:.2f}s without".format(with_file, without_file))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+
+# Token round trips of repeated runs against a local CMR stand-in: creating and
+# deleting a token in every run, as the scripts used to, versus sharing one
+# cached token.  Halfway through, CMR forgets all tokens to show that a
+# rejected token is replaced once.  Runs are executed by --processes
+# concurrent processes, like overlapping cron jobs on one host.
+#
+#   python3 benchmarks/bench_token.py --runs 24 --processes 4
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mock_servers import TOKEN_PATH, cmr_server, granule
+from s6mf.search import GranuleSearch
+from s6mf.session import Session
+from s6mf.tokens import TokenCache
+
+
+def run(cmr_url, cache_path, cached):
+    session = Session()
+    token_url = cmr_url+TOKEN_PATH
+    create = lambda: session.post(token_url, data="<token/>").json()["token"]["id"]
+    token = TokenCache(create, token_url+" bench", cache_path, max_age=3600 if cached else 0)
+    search = GranuleSearch(cmr_url+"/search/granules.umm_json", {"ShortName": "MOCK"}, session=session, token=token)
+    list(search)
+    if not cached:
+        session.delete(token_url+"/"+token.clear())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CMR token round trips with and without the cache")
+    parser.add_argument("--runs", type=int, default=24)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per CMR request")
+    args = parser.parse_args()
+
+    granules = [granule("g{}.nc".format(i), "http://localhost") for i in range(10)]
+    print("{:>8} {:>6} {:>15} {:>9}".format("mode", "runs", "token requests", "seconds"))
+    for cached in (False, True):
+        with cmr_server(granules, args.latency, require_token=True) as cmr, \
+                tempfile.TemporaryDirectory() as cache, \
+                ProcessPoolExecutor(args.processes) as pool:
+            cache_path = cache+"/tokens.json"
+            start = time.monotonic()
+            for half in (0, 1):
+                futures = [pool.submit(run, cmr.url, cache_path, cached) for _ in range(args.runs // 2)]
+                for f in futures:
+                    f.result()
+                cmr.tokens.clear()
+            elapsed = time.monotonic() - start
+            print("{:>8} {:>6} {:>15} {:>9.2f}".format("cached" if cached else "per-run", args.runs,
+                                                       cmr.token_requests, elapsed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+# Queries of the along-track index over a directory of synthetic granules
+# (see bench_subset.py), against opening every file and computing the
+# distance of each record.  Also times building the index, an update with
+# nothing new and an update after one more granule arrived.  Needs netCDF4.
+#
+#   python3 benchmarks/bench_trackindex.py --cycles 30 --passes 4
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+from netCDF4 import Dataset
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_subset import write_granule
+from s6mf.trackindex import TrackIndex, distance_km
+
+# Marseille tide gauge
+GAUGE = (43.28, 5.35)
+# Seconds of one Sentinel-6 MF cycle
+CYCLE_SECONDS = 9.9156*86400
+
+
+def granule_path(data, cycle, pass_number):
+    return os.path.join(data, "S6A_P4_2__LR_STD__ST_{:03d}_{:03d}.nc".format(cycle, pass_number))
+
+
+def write(data, cycle, pass_number):
+    # The passes of a cycle are spread evenly in longitude; pass 1 crosses the gauge
+    write_granule(granule_path(data, cycle, pass_number), 2, t0=6.6e8+cycle*CYCLE_SECONDS+pass_number*3372,
+                  lon0=136.75+(pass_number-1)*360/4, cycle=cycle, pass_number=pass_number)
+
+
+def scan_all(paths, lat, lon, radius, cycles):
+    records = 0
+    for path in paths:
+        with Dataset(path) as nc:
+            if not cycles[0] <= nc.cycle_number <= cycles[1]:
+                continue
+            group = nc["data_20"]
+            records += int((distance_km(lat, lon, group["latitude"][:], group["longitude"][:]) <= radius).sum())
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Along-track index queries against scanning every file")
+    parser.add_argument("--cycles", type=int, default=30)
+    parser.add_argument("--passes", type=int, default=4, help="passes per cycle")
+    parser.add_argument("--radius", type=float, default=50, help="km")
+    args = parser.parse_args()
+    cycles = (10, 40)
+
+    with tempfile.TemporaryDirectory() as data:
+        for cycle in range(1, args.cycles+1):
+            for pass_number in range(1, args.passes+1):
+                write(data, cycle, pass_number)
+        paths = sorted(p for p in os.listdir(data) if p.endswith(".nc"))
+        print("{} granules".format(len(paths)))
+
+        with TrackIndex(data) as index:
+            start = time.perf_counter()
+            added, _ = index.update()
+            print("build index:      {:8.3f}s  ({} files, {:.1f} MB)".format(
+                time.perf_counter()-start, added, os.path.getsize(index.path)/1e6))
+            start = time.perf_counter()
+            index.update()
+            print("update, no change {:8.3f}s".format(time.perf_counter()-start))
+            write(data, args.cycles+1, 1)
+            start = time.perf_counter()
+            added, _ = index.update()
+            print("update, {} new     {:8.3f}s".format(added, time.perf_counter()-start))
+
+            start = time.perf_counter()
+            segments = index.near(*GAUGE, args.radius, group="/data_20", cycles=cycles)
+            print("index lookup      {:8.3f}s  ({} segments)".format(time.perf_counter()-start, len(segments)))
+            start = time.perf_counter()
+            found = index.records_near(*GAUGE, args.radius, group="/data_20", cycles=cycles)
+            n = sum(len(r) for _, r in found)
+            print("records_near      {:8.3f}s  ({} records)".format(time.perf_counter()-start, n))
+
+        start = time.perf_counter()
+        expected = scan_all([os.path.join(data, p) for p in os.listdir(data) if p.endswith(".nc")],
+                            *GAUGE, args.radius, cycles)
+        print("scan every file   {:8.3f}s  ({} records)".format(time.perf_counter()-start, expected))
+        if n != expected:
+            sys.exit("the index found {} records, scanning {}".format(n, expected))
+
+
+if __name__ == "__main__":
+    main()
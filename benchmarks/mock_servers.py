@@ -0,0 +1,719 @@
+"""
+Local stand-ins for the remote services used by the scripts.
+
+The servers run in a background thread on 127.0.0.1 and an ephemeral port, so
+benchmarks can point the download code at them without touching NASA systems.
+"""
+
+import base64
+import hashlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+from fnmatch import fnmatchcase
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+SEARCH_AFTER = "CMR-Search-After"
+COOKIE = "accessToken"
+TOKEN_PATH = "/legacy-services/rest/tokens"
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients hanging up early (e.g. after a refusal) are not errors here
+        if not isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            super().handle_error(request, client_address)
+
+
+class MockServer:
+    """
+    Run a ThreadingHTTPServer for `handler` in a daemon thread.  Use as a
+    context manager; `url` is the base URL of the running server.
+    """
+
+    def __init__(self, handler):
+        self.httpd = _HTTPServer(("127.0.0.1", 0), handler)
+        self.httpd.mock = self
+        self.lock = threading.Lock()
+        self.etags = {}
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return "http://{}:{}".format(host, port)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+###############################################################################
+# FAULT INJECTION
+###############################################################################
+class Faults:
+    """
+    Failures injected into the responses of a mock server.
+
+    capacity    - requests served at once; further ones are refused with 429
+    error_rate  - fraction of requests answered with 503
+    outage      - (start, end) in seconds after creation during which every
+                  request is answered with 503
+    fail_first  - statuses returned to the first requests, in order
+    retry_after - Retry-After seconds sent with every refusal (None = no header)
+
+    `refused` counts the refusals by status and `peak` the most requests served
+    at once.
+    """
+
+    def __init__(self, capacity=None, error_rate=0.0, outage=None, fail_first=(), retry_after=1, seed=0):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.outage = outage
+        self.fail_first = list(fail_first)
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.started = time.monotonic()
+        self.active = 0
+        self.peak = 0
+        self.refused = {}
+        self.lock = threading.Lock()
+
+    def enter(self):
+        """
+        The status to refuse a request with, or None to serve it; a served
+        request must be followed by leave().
+        """
+        with self.lock:
+            elapsed = time.monotonic()-self.started
+            if self.fail_first:
+                status = self.fail_first.pop(0)
+            elif self.outage and self.outage[0] <= elapsed < self.outage[1]:
+                status = 503
+            elif self.capacity is not None and self.active >= self.capacity:
+                status = 429
+            elif self.random.random() < self.error_rate:
+                status = 503
+            else:
+                self.active += 1
+                self.peak = max(self.peak, self.active)
+                return None
+            self.refused[status] = self.refused.get(status, 0)+1
+            return status
+
+    def leave(self):
+        with self.lock:
+            self.active -= 1
+
+
+class FaultMixin:
+    """
+    Request handler methods to serve a request through `faults`.
+    """
+
+    faults = None
+
+    def refused(self):
+        """
+        Send the refusal if `faults` refuses the request; True if it did.
+        """
+        status = self.faults.enter() if self.faults else None
+        if status is None:
+            return False
+        body = json.dumps({"errors": ["injected failure"]}).encode()
+        self.send_response(status)
+        if self.faults.retry_after is not None:
+            self.send_header("Retry-After", str(self.faults.retry_after))
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        return True
+
+    def served(self):
+        if self.faults:
+            self.faults.leave()
+
+
+###############################################################################
+# DATA SERVER
+###############################################################################
+class DataHandler(FaultMixin, BaseHTTPRequestHandler):
+    """
+    Serve synthetic granule files.  Any path ending in one of the configured
+    extensions returns `size` bytes of deterministic content after `latency`
+    seconds, throttled to `bandwidth` bytes/s per connection (0 = unthrottled).
+
+    Single byte ranges are honoured like the archive does, and so is an
+    If-Range with the file's ETag (the MD5 of its content).  With `drop_after`
+    set, the first `drops` responses are cut off after that many bytes to
+    simulate dropped connections; the first `corruptions` responses have one
+    byte flipped.  Every new connection waits `connect_latency`
+    seconds, standing in for the TCP and TLS handshakes.
+
+    With `login_url` set, requests without the session cookie are redirected to
+    that Earthdata Login stand-in first, which sends them back to /callback
+    where the cookie is set, as the archive's download endpoint does.
+
+    File requests go through `faults` (see Faults) when it is set.
+    """
+
+    protocol_version = "HTTP/1.1"
+    # Headers and body are separate writes; without TCP_NODELAY a small body
+    # waits for the client's delayed ACK of the headers (~40 ms on Linux)
+    disable_nagle_algorithm = True
+    files = {}
+    latency = 0.0
+    bandwidth = 0
+    chunk = 64 * 1024
+    drop_after = None
+    drops = 0
+    corruptions = 0
+    connect_latency = 0.0
+    login_url = None
+
+    def log_message(self, *args):
+        pass
+
+    def setup(self):
+        time.sleep(self.connect_latency)
+        with self.server.mock.lock:
+            self.server.mock.connections += 1
+        super().setup()
+
+    def logged_in(self):
+        """
+        Handle the login redirects; True if the request can be served.
+        """
+        url = urlsplit(self.path)
+        if self.login_url is None:
+            return True
+        # A callback can arrive with the cookie already set by a concurrent
+        # login on the same session
+        if url.path == "/callback":
+            state = parse_qs(url.query).get("state", ["/"])[0]
+            self.redirect(state, [("Set-Cookie", COOKIE+"=1; Path=/")])
+        elif COOKIE in self.headers.get("Cookie", ""):
+            return True
+        else:
+            callback = "http://"+self.headers["Host"]+"/callback"
+            self.redirect(self.login_url+"?"+urlencode({"redirect_uri": callback, "state": self.path}))
+        return False
+
+    def redirect(self, location, headers=()):
+        self.send_response(302)
+        self.send_header("Location", location)
+        self.send_header("Content-Length", "0")
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+
+    def body(self):
+        return self.files.get(self.path.rsplit("/", 1)[-1])
+
+    def etag(self, body):
+        mock = self.server.mock
+        with mock.lock:
+            if id(body) not in mock.etags:
+                mock.etags[id(body)] = '"{}"'.format(hashlib.md5(body).hexdigest())
+            return mock.etags[id(body)]
+
+    def byte_range(self, size, etag=None):
+        """
+        (start, end) of a `Range: bytes=a-b` header, None without one or if
+        an If-Range header does not match `etag`.
+        """
+        spec = self.headers.get("Range", "")
+        if not spec.startswith("bytes="):
+            return None
+        if self.headers.get("If-Range") not in (None, etag):
+            return None
+        start, _, end = spec[6:].partition("-")
+        return int(start), min(int(end), size-1) if end else size-1
+
+    def do_GET(self):
+        if not self.logged_in():
+            return
+        body = self.body()
+        if body is None:
+            self.send_error(404)
+            return
+        if self.refused():
+            return
+        try:
+            self.send_file(body)
+        finally:
+            self.served()
+
+    def send_file(self, body):
+        time.sleep(self.latency)
+        etag = self.etag(body)
+        byte_range = self.byte_range(len(body), etag)
+        if byte_range and byte_range[0] >= len(body):
+            self.send_response(416)
+            self.send_header("Content-Range", "bytes */{}".format(len(body)))
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if byte_range:
+            start, end = byte_range
+            self.send_response(206)
+            self.send_header("Content-Range", "bytes {}-{}/{}".format(start, end, len(body)))
+            body = body[start:end+1]
+        else:
+            self.send_response(200)
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+
+        limit = len(body)
+        with self.server.mock.lock:
+            if self.drop_after is not None and self.server.mock.drops < self.drops:
+                self.server.mock.drops += 1
+                limit = min(limit, self.drop_after)
+            if self.server.mock.corrupted < self.corruptions and body:
+                self.server.mock.corrupted += 1
+                body = bytes([body[0] ^ 0xff])+body[1:]
+            self.server.mock.sent += limit
+        for i in range(0, limit, self.chunk):
+            self.wfile.write(body[i:min(i+self.chunk, limit)])
+            if self.bandwidth:
+                time.sleep(self.chunk / self.bandwidth)
+        if limit < len(body):
+            self.close_connection = True
+
+
+def data_server(nfiles=32, size=1024 * 1024, latency=0.05, bandwidth=4 * 1024 * 1024,
+                extensions=(".nc", ".bin"), drop_after=None, drops=0, corruptions=0,
+                connect_latency=0.0, login_url=None, faults=None):
+    """
+    Return a MockServer with `nfiles` synthetic granules, alternating between
+    the given extensions.  The file names are in `server.names`, the number of
+    body bytes sent so far in `server.sent` and the number of connections
+    accepted in `server.connections`.  `faults` is a Faults instance.
+    """
+    payload = os.urandom(size)
+    names = ["S6A_P4_2__LR_STD__ST_{:03d}_{:03d}{}".format(i // 254 + 1, i % 254 + 1,
+                                                         extensions[i % len(extensions)])
+             for i in range(nfiles)]
+    handler = type("Handler", (DataHandler,), {
+        "files": {name: payload for name in names},
+        "latency": latency,
+        "bandwidth": bandwidth,
+        "drop_after": drop_after,
+        "drops": drops,
+        "corruptions": corruptions,
+        "connect_latency": connect_latency,
+        "login_url": login_url,
+        "faults": faults,
+    })
+    server = MockServer(handler)
+    server.names = names
+    server.payload = payload
+    server.sent = 0
+    server.drops = 0
+    server.corrupted = 0
+    server.connections = 0
+    return server
+
+
+###############################################################################
+# EARTHDATA LOGIN
+###############################################################################
+class EDLHandler(BaseHTTPRequestHandler):
+    """
+    Earthdata Login stand-in: /oauth/authorize checks HTTP basic credentials
+    and redirects back to `redirect_uri` with an authorization code.
+    """
+
+    protocol_version = "HTTP/1.1"
+    credentials = ("user", "password")
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        expected = "Basic "+base64.b64encode(":".join(self.credentials).encode()).decode()
+        if url.path != "/oauth/authorize" or self.headers.get("Authorization") != expected:
+            self.send_response(401)
+            self.send_header("WWW-Authenticate", 'Basic realm="Please enter your Earthdata Login credentials"')
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        with self.server.mock.lock:
+            self.server.mock.logins += 1
+        query = parse_qs(url.query)
+        state = query.get("state", ["/"])[0]
+        self.send_response(302)
+        self.send_header("Location", query["redirect_uri"][0]+"?"+urlencode({"code": "mock", "state": state}))
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+def edl_server(credentials=("user", "password")):
+    """
+    Return a MockServer for Earthdata Login.  Its `login_url` is reached by a
+    different host name than the data server (localhost vs. 127.0.0.1), so
+    credentials are only sent to it the way they are to the real EDL host.
+    The number of successful logins is in `server.logins`.
+    """
+    server = MockServer(type("Handler", (EDLHandler,), {"credentials": credentials}))
+    server.logins = 0
+    server.host = "localhost"
+    server.login_url = "http://localhost:{}/oauth/authorize".format(server.httpd.server_address[1])
+    return server
+
+
+###############################################################################
+# CMR SEARCH
+###############################################################################
+class CMRHandler(FaultMixin, BaseHTTPRequestHandler):
+    """
+    Serve `granules` from /search/granules.umm_json in pages of `page_size`.
+    Paging works like CMR search-after: every response that is not the last
+    one carries a CMR-Search-After header that must be sent back to get the
+    next page, and every response a CMR-Hits header.  Each page takes
+    `latency` seconds.
+
+    /search/granules.json serves the same granules in the Atom format: the
+    `entries` given for them (e.g. recorded from CMR), or ones made from the
+    UMM-G records by atom_entry().
+
+    The `cycle[]` and `passes[n][pass]` parameters filter on the granules'
+    Track, `created_at` on their meta.created-at and `readable_granule_name[]`
+    on their GranuleUR (with `*`/`?` wildcards when
+    `options[readable_granule_name][pattern]` is true), as they do in CMR.
+
+    Tokens are created and deleted at /legacy-services/rest/tokens.  With
+    `require_token` set, searches without a live token are rejected with 401.
+    Searches go through `faults` (see Faults) when it is set.
+    """
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    granules = []
+    entries = None
+    latency = 0.0
+    require_token = False
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        if self.path != TOKEN_PATH:
+            self.send_error(404)
+            return
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(self.latency)
+        mock = self.server.mock
+        with mock.lock:
+            mock.token_requests += 1
+            token = "TOKEN-{:06d}".format(mock.token_requests)
+            mock.tokens.add(token)
+        self.send_json(201, {"token": {"id": token}})
+
+    def do_DELETE(self):
+        if not self.path.startswith(TOKEN_PATH+"/"):
+            self.send_error(404)
+            return
+        time.sleep(self.latency)
+        mock = self.server.mock
+        with mock.lock:
+            mock.token_requests += 1
+            mock.tokens.discard(self.path.rsplit("/", 1)[1])
+        self.send_response(204)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def send_json(self, status, obj, headers=()):
+        body = json.dumps(obj).encode()
+        with self.server.mock.lock:
+            self.server.mock.sent += len(body)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path not in ("/search/granules.umm_json", "/search/granules.json"):
+            self.send_error(404)
+            return
+        query = parse_qs(url.query)
+        if self.require_token and query.get("token", [""])[0] not in self.server.mock.tokens:
+            self.send_json(401, {"errors": ["Token does not exist"]})
+            return
+        if "scroll" in query and SEARCH_AFTER in self.headers:
+            self.send_json(400, {"errors": ["scroll and search-after are mutually exclusive"]})
+            return
+        if self.refused():
+            return
+        try:
+            self.search(url, query)
+        finally:
+            self.served()
+
+    def search(self, url, query):
+        page_size = int(query.get("page_size", ["10"])[0])
+        start = int(json.loads(self.headers.get(SEARCH_AFTER, "[0]"))[0])
+        time.sleep(self.latency)
+        with self.server.mock.lock:
+            self.server.mock.requests += 1
+        matching = self.matching(query)
+        page = matching[start:start+page_size]
+        headers = [("CMR-Hits", str(len(matching)))]
+        if start + page_size < len(matching):
+            headers.append((SEARCH_AFTER, json.dumps([start+page_size])))
+        if url.path.endswith(".umm_json"):
+            self.send_json(200, {"hits": len(matching), "took": 1, "items": [self.granules[i] for i in page]}, headers)
+            return
+        entries = [self.entries[i] if self.entries else atom_entry(self.granules[i]) for i in page]
+        self.send_json(200, {"feed": {"updated": "2021-07-12T10:20:03.113Z", "id": "http://localhost"+self.path,
+                                      "title": "ECHO granule metadata", "entry": entries}}, headers)
+
+    def matching(self, query):
+        """
+        Indexes of the granules that match the query.
+        """
+        cycles = {int(c) for c in query.get("cycle[]", [])}
+        passes = {int(v[0]) for k, v in query.items() if k.startswith("passes[")}
+        created_at = query.get("created_at", [""])[0]
+        names = query.get("readable_granule_name[]", [])
+        pattern = query.get("options[readable_granule_name][pattern]", [""])[0] == "true"
+        if passes and len(cycles) != 1:
+            return []
+        matching = []
+        for i, g in enumerate(self.granules):
+            t = g["umm"].get("SpatialExtent", {}).get("HorizontalSpatialDomain", {}).get("Track", {})
+            if cycles and t.get("Cycle") not in cycles:
+                continue
+            if passes and not passes & {p["Pass"] for p in t.get("Passes", [])}:
+                continue
+            # Compared to the second, as "...:00.000Z" and "...:00Z" are the same time
+            if created_at and g["meta"].get("created-at", "")[:19] < created_at[:19]:
+                continue
+            ur = g["umm"].get("GranuleUR", "")
+            if names and not any(fnmatchcase(ur, n) if pattern else ur == n for n in names):
+                continue
+            matching.append(i)
+        return matching
+
+
+def granule(name, data_url, payload=None, cycle=None, passes=(), created_at="2021-06-01T00:00:00.000Z"):
+    """
+    A minimal UMM-G record for the file `name` on the data server at `data_url`,
+    with an OPeNDAP link and a metadata link next to the data link.  With the
+    file's `payload` the record also lists its size and MD5 checksum.
+    """
+    files = []
+    if payload is not None:
+        files.append({"Name": name, "SizeInBytes": len(payload),
+                      "Checksum": {"Value": hashlib.md5(payload).hexdigest(), "Algorithm": "MD5"}})
+    return {
+        "meta": {"concept-id": "G{:010d}-POCLOUD".format(zlib.crc32(name.encode())),
+                 "revision-date": created_at, "created-at": created_at},
+        "umm": {
+            "GranuleUR": name.rsplit(".", 1)[0],
+            "SpatialExtent": {"HorizontalSpatialDomain": {"Track": {
+                "Cycle": cycle, "Passes": [{"Pass": p} for p in passes]}}},
+            "DataGranule": {"ArchiveAndDistributionInformation": files},
+            "RelatedUrls": [
+                {"URL": data_url+"/"+name, "Type": "GET DATA"},
+                {"URL": data_url.replace("http", "opendap", 1)+"/"+name, "Type": "GET DATA", "Subtype": "OPENDAP DATA"},
+                {"URL": data_url+"/"+name+".xml", "Type": "EXTENDED METADATA"},
+            ],
+        },
+    }
+
+
+ATOM_RELS = {
+    "GET DATA": "http://esipfed.org/ns/fedsearch/1.1/data#",
+    "GET DATA VIA DIRECT ACCESS": "http://esipfed.org/ns/fedsearch/1.1/s3#",
+    "EXTENDED METADATA": "http://esipfed.org/ns/fedsearch/1.1/metadata#",
+    "USE SERVICE API": "http://esipfed.org/ns/fedsearch/1.1/service#",
+    "VIEW RELATED INFORMATION": "http://esipfed.org/ns/fedsearch/1.1/documentation#",
+}
+
+
+def atom_updated(revision_date):
+    """
+    The `updated` time of an Atom entry, which in CMR's results precedes the
+    revision date of the UMM-G record by a few seconds.
+    """
+    if not revision_date:
+        return revision_date
+    updated = datetime.strptime(revision_date, "%Y-%m-%dT%H:%M:%S.%fZ")-timedelta(seconds=2.665)
+    return updated.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3]+"Z"
+
+
+def atom_entry(g):
+    """
+    The Atom (.json) entry CMR gives for the UMM-G record `g`.
+    """
+    umm = g["umm"]
+    links = []
+    for u in umm.get("RelatedUrls", []):
+        rel = ATOM_RELS["USE SERVICE API" if u.get("Subtype") == "OPENDAP DATA" else u["Type"]]
+        links.append({"rel": rel, "title": "OPeNDAP request URL" if u.get("Subtype") else u.get("Description", ""),
+                      "hreflang": "en-US", "href": u["URL"]})
+    time_range = umm.get("TemporalExtent", {}).get("RangeDateTime", {})
+    return {
+        "producer_granule_id": umm["GranuleUR"],
+        "time_start": time_range.get("BeginningDateTime", "2021-06-01T00:00:00.000Z"),
+        "time_end": time_range.get("EndingDateTime", "2021-06-01T01:00:00.000Z"),
+        "updated": atom_updated(g["meta"].get("revision-date")),
+        "data_center": "POCLOUD",
+        "title": umm["GranuleUR"],
+        "coordinate_system": "GEODETIC",
+        "id": g["meta"]["concept-id"],
+        "original_format": "UMM_JSON",
+        "online_access_flag": True,
+        "links": links,
+    }
+
+
+def cmr_server(granules, latency=0.0, require_token=False, entries=None, faults=None):
+    """
+    Return a MockServer for CMR search and tokens.  `server.requests` counts
+    search requests, `server.sent` the bytes of the JSON responses,
+    `server.token_requests` token creations and deletions; `server.tokens` is
+    the set of live tokens.  `entries` are the Atom entries of `granules`, in
+    the same order.  `faults` is a Faults instance.
+    """
+    handler = type("Handler", (CMRHandler,), {"granules": granules, "latency": latency,
+                                              "require_token": require_token, "entries": entries,
+                                              "faults": faults})
+    server = MockServer(handler)
+    server.requests = 0
+    server.sent = 0
+    server.token_requests = 0
+    server.tokens = set()
+    return server
+
+
+###############################################################################
+# HARMONY
+###############################################################################
+class HarmonyHandler(DataHandler):
+    """
+    Harmony stand-in.  A request to
+    /<collection>/ogc-api-coverages/1.0.0/collections/all/coverage/rangeset
+    starts an asynchronous job and returns its status, as Harmony does with
+    forceAsync.  The job runs for `job_seconds`, producing its `outputs`
+    files evenly over that time; /jobs/<id> returns its status with links
+    (rel "data") to the outputs produced so far, `limit` links per page with a
+    rel "next" link to the rest.  The outputs are served from /results/ like
+    DataHandler serves files, so byte ranges, drops and faults work the same.
+
+    Jobs whose number (counting from 0) is in `fail_jobs` end with status
+    "failed" and no outputs; those in `pause_jobs` stay "paused".
+    """
+
+    collection = None
+    job_seconds = 1.0
+    outputs = 4
+    payload = b""
+    fail_jobs = ()
+    pause_jobs = ()
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        parts = url.path.strip("/").split("/")
+        if url.path.endswith("/coverage/rangeset") and parts[0] == self.collection:
+            self.submit(query)
+        elif len(parts) == 2 and parts[0] == "jobs":
+            job = self.server.mock.jobs.get(parts[1])
+            if job is None:
+                self.send_error(404)
+                return
+            self.send_status(job, int(query.get("page", ["1"])[0]), int(query.get("limit", ["2000"])[0]))
+        elif parts[0] == "results" and len(parts) == 3 and parts[1] in self.server.mock.jobs:
+            if self.refused():
+                return
+            try:
+                self.send_file(self.payload)
+            finally:
+                self.served()
+        else:
+            self.send_error(404)
+
+    def submit(self, query):
+        mock = self.server.mock
+        with mock.lock:
+            number = len(mock.jobs)
+            job_id = "{:08x}-0000-4000-8000-{:012x}".format(zlib.crc32(self.path.encode()), number)
+            mock.jobs[job_id] = {"id": job_id, "number": number, "started": time.monotonic(),
+                                 "subset": query.get("subset", []), "failed": number in self.fail_jobs,
+                                 "paused": number in self.pause_jobs}
+        self.send_status(mock.jobs[job_id], 1, 2000)
+
+    def send_status(self, job, page, limit):
+        job_id = job["id"]
+        with self.server.mock.lock:
+            self.server.mock.status_requests += 1
+        progress = min(1.0, (time.monotonic()-job["started"])/self.job_seconds) if self.job_seconds else 1.0
+        if job["paused"]:
+            status, produced = "paused", 0
+        elif job["failed"]:
+            status, produced = ("failed" if progress >= 1.0 else "running"), 0
+        else:
+            status, produced = ("successful" if progress >= 1.0 else "running"), int(progress*self.outputs)
+        base = "http://"+self.headers["Host"]
+        names = ["S6A_P4_2__LR_STD__ST_{:03d}_{:03d}_subsetted.nc4".format(job["number"], i) for i in range(produced)]
+        links = [{"title": "Job Status", "href": base+"/jobs/"+job_id, "rel": "self", "type": "application/json"}]
+        links += [{"title": name, "href": base+"/results/"+job_id+"/"+name, "rel": "data",
+                   "type": "application/x-netcdf4"} for name in names[(page-1)*limit:page*limit]]
+        if page*limit < len(names):
+            links.append({"title": "Next page", "href": base+"/jobs/"+job_id+"?"+urlencode({"page": page+1, "limit": limit}),
+                          "rel": "next", "type": "application/json"})
+        body = json.dumps({"jobID": job_id, "status": status, "progress": int(progress*100),
+                           "message": "injected failure" if status == "failed" else "The job is being processed",
+                           "request": job["subset"], "links": links}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def harmony_server(collection="C1238543220-POCLOUD", job_seconds=1.0, outputs=4, size=256 * 1024,
+                   latency=0.0, bandwidth=0, drop_after=None, drops=0, fail_jobs=(), pause_jobs=(), faults=None):
+    """
+    Return a MockServer for Harmony jobs on `collection`.  `server.jobs` maps
+    the job IDs to the jobs, in submission order, and `server.status_requests`
+    counts job status responses; `server.sent` counts the bytes of outputs
+    sent.  Every output is `size` bytes, `server.payload`.
+    """
+    payload = os.urandom(size)
+    handler = type("Handler", (HarmonyHandler,), {
+        "collection": collection, "job_seconds": job_seconds, "outputs": outputs, "payload": payload,
+        "latency": latency, "bandwidth": bandwidth, "drop_after": drop_after, "drops": drops,
+        "fail_jobs": fail_jobs, "pause_jobs": pause_jobs, "faults": faults,
+    })
+    server = MockServer(handler)
+    server.payload = payload
+    server.jobs = {}
+    server.status_requests = 0
+    server.sent = 0
+    server.drops = 0
+    server.corrupted = 0
+    server.connections = 0
+    return server
@@ -13,10 +13,11 @@
 #pip3 install python-dotenv
 
 
-import helper
 import netrc
+import asyncio
 import datetime as dt
-from harmony import BBox, Client, Collection, Request
+from s6mf.harmony import SubsetBatch, split
+from s6mf.session import earthdata_session
 
 
 ###################
@@ -37,26 +38,54 @@ def harmony_client_login_auth(endpoint):
     return Client(auth=(username, password))
 ###################
 edl="urs.earthdata.nasa.gov"
-collection = Collection(id='C1238543220-POCLOUD')
 
-harmony_client=harmony_client_login_auth(edl)
+# Batch mode splits a large request into tiles of `tile_degrees` and time windows of `window_days` and submits them as separate Harmony jobs,
+# `parallel_jobs` at a time. The jobs are polled together and every output is downloaded to data/<tile> as soon as Harmony lists it.
+# If the run is interrupted, run it again: the jobs already submitted are picked up again (their IDs are kept in data/.harmony_jobs.json)
+# and finished outputs are not downloaded twice. With batch = False a single job is submitted with the harmony-py client.
+batch = False
+data = "/path/to/data"
+bounding_box = "-10,-10,10,10"
+start = "2020-12-01T00:00:00Z"
+stop = "2020-12-31T00:00:00Z"
+tile_degrees = 10
+window_days = 10
+parallel_jobs = 4
+workers = 8
+
+if batch:
+    session = earthdata_session(edl, pool_size=workers)
+    tiles = split(bounding_box, start, stop, tile_degrees, window_days)
+    subset = SubsetBatch('C1238543220-POCLOUD', tiles, data, jobs=parallel_jobs, workers=workers, session=session)
+    for result in asyncio.run(subset.run()):
+        print(result.tile.name+": "+str(result.status)+", "+str(result.downloaded)+" downloaded, "
+              +str(result.failed)+" failed, "+str(result.skipped)+" already there")
+    print(session.telemetry.summary())
+else:
+    # Only the single job needs the harmony-py client and its dependencies
+    import helper
+    from harmony import BBox, Client, Collection, Request
+
+    collection = Collection(id='C1238543220-POCLOUD')
+
+    harmony_client=harmony_client_login_auth(edl)
+
+    request = Request(
+        collection=collection,
+        spatial=BBox(-10, -10, 10, 10)
+    )
+
+    request.is_valid()
+
+    job1_id = harmony_client.submit(request)
+    print(harmony_client.status(job1_id))
+    print(harmony_client.result_json(job1_id, show_progress=False))
+
+    futures = harmony_client.download_all(job1_id)
+    for f in futures:
+        print(f.result())
 
-request = Request(
-    collection=collection,
-    spatial=BBox(-10, -10, 10, 10)
-)
-
-request.is_valid()
-
-job1_id = harmony_client.submit(request)
-print(harmony_client.status(job1_id))
-print(harmony_client.result_json(job1_id, show_progress=False))
 
-futures = harmony_client.download_all(job1_id)
-for f in futures:
-    print(f.result())
-    
-    
 ''' Other subset request examples 
 
 request = Request(
@@ -0,0 +1,58 @@
+"""
+Shared helpers for the Sentinel-6 MF access scripts.
+
+The scripts in the top level of this repository are meant to be read and edited
+by users; the pieces that are the same in all of them live here so they can be
+reused from other scripts as well.
+
+The main pieces can be imported from the package itself.  They are loaded on
+first use, so `import s6mf` costs next to nothing and a program only pays for
+requests (or numpy and netCDF4) once it uses something that needs them:
+
+    import s6mf
+
+    session = s6mf.setup_earthdata_login_auth("urs.earthdata.nasa.gov")
+    for item in s6mf.GranuleSearch(url, params, session=session):
+        ...
+
+s6mf.sync.sync() runs a whole update of a collection in-process, and
+`python3 -m s6mf` is the command line of the package (see s6mf/__main__.py).
+"""
+
+import importlib
+
+# name: module it is defined in
+_EXPORTS = {
+    "Session": "session",
+    "earthdata_session": "session",
+    "setup_earthdata_login_auth": "session",
+    "TokenCache": "tokens",
+    "create_token": "tokens",
+    "get_token": "tokens",
+    "delete_token": "tokens",
+    "GranuleSearch": "search",
+    "CyclePassPlanner": "planner",
+    "LinkSelector": "links",
+    "granule_name_params": "links",
+    "DownloadEngine": "download",
+    "DownloadResult": "download",
+    "Manifest": "manifest",
+    "Collection": "collection",
+    "SyncResult": "sync",
+    "Plan": "plan",
+    "Telemetry": "telemetry",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    value = getattr(importlib.import_module("."+_EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
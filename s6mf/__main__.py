@@ -0,0 +1,52 @@
+"""
+The command line of the s6mf package.
+
+    python3 -m s6mf COMMAND [ARGUMENTS]
+    python3 -m s6mf sync /data/lr JASON_CS_S6A_L2_ALT_LR_STD_OST_NRT_F
+    python3 -m s6mf daemon --config collections.json
+    python3 -m s6mf COMMAND --help
+
+Each command is the main() of one module, which is only imported when its
+command runs, so listing the commands loads neither requests nor netCDF4.
+"""
+
+import importlib
+import os
+import sys
+
+# command: (module, description)
+COMMANDS = {
+    "sync": ("sync", "download what is new in one collection, once"),
+    "daemon": ("daemon", "keep several collections up to date"),
+    "plan": ("plan", "show what a saved download plan would transfer"),
+    "manifest": ("manifest", "list the files recorded in a data directory"),
+    "harmony": ("harmony", "subset a collection with parallel Harmony jobs"),
+    "subset": ("subset", "cut downloaded granules down to a region (needs netCDF4)"),
+    "index": ("trackindex", "index and query the tracks of downloaded granules (needs netCDF4)"),
+    "store": ("store", "consolidate downloaded granules by cycle (needs netCDF4)"),
+}
+
+
+def usage() -> str:
+    lines = ["usage: python3 -m s6mf COMMAND [ARGUMENTS]", "", "commands:"]
+    lines += ["  {:<10} {}".format(name, description) for name, (_, description) in COMMANDS.items()]
+    lines += ["", "python3 -m s6mf COMMAND --help describes the arguments of a command."]
+    return "\n".join(lines)
+
+
+def main(argv=None) -> None:
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if not argv or argv[0] in ("-h", "--help"):
+        print(usage())
+        return
+    command = argv[0]
+    if command not in COMMANDS:
+        sys.exit(usage()+"\n\nno command "+command)
+    module = importlib.import_module("."+COMMANDS[command][0], __package__ or "s6mf")
+    # The command's parser reads sys.argv and names itself after argv[0]
+    sys.argv = [os.path.basename(sys.executable)+" -m s6mf "+command]+argv[1:]
+    module.main()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Incremental checksums for the algorithms UMM-G lists in
+DataGranule.ArchiveAndDistributionInformation.Checksum.Algorithm.
+"""
+
+import hashlib
+import zlib
+from typing import Optional
+
+
+class VerificationError(Exception):
+    """
+    A downloaded file does not match the size or checksum advertised by CMR.
+    """
+
+
+class _ZlibChecksum:
+    def __init__(self, func, start):
+        self.func = func
+        self.value = start
+
+    def update(self, data) -> None:
+        self.value = self.func(data, self.value)
+
+    def hexdigest(self) -> str:
+        return "{:08x}".format(self.value & 0xffffffff)
+
+
+def new_hasher(algorithm: Optional[str]):
+    """
+    A hashlib-style object (update/hexdigest) for a UMM-G algorithm name such as
+    "MD5", "SHA-256" or "Adler-32", or None if the algorithm is not supported.
+    """
+    name = (algorithm or "").lower().replace("-", "")
+    if name == "adler32":
+        return _ZlibChecksum(zlib.adler32, 1)
+    if name == "crc32":
+        return _ZlibChecksum(zlib.crc32, 0)
+    if name in ("md5", "sha1", "sha224", "sha256", "sha384", "sha512"):
+        return hashlib.new(name)
+    return None
+
+
+def hash_file(path: str, hasher, size: Optional[int] = None, block_size: int = 1024 * 1024) -> None:
+    """
+    Feed the first `size` bytes of `path` (all of it by default) to `hasher`.
+    """
+    with open(path, "rb") as f:
+        remaining = size
+        while remaining is None or remaining > 0:
+            block = f.read(block_size if remaining is None else min(block_size, remaining))
+            if not block:
+                break
+            hasher.update(block)
+            if remaining is not None:
+                remaining -= len(block)
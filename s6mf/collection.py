@@ -0,0 +1,147 @@
+"""
+A collection to keep in sync with a local data directory.
+
+Collection holds what the access scripts configure as module level variables
+(`Short_Name`, `data`, `extensions`, `bounding_extent`, `mins`) and the
+`.update` checkpoint kept in the data directory.  load_collections() reads a
+list of them from a JSON file:
+
+    {
+      "data": "/data/s6",
+      "extensions": [".nc"],
+      "collections": [
+        {"short_name": "JASON_CS_S6A_L2_ALT_LR_STD_OST_NRT_F"},
+        {"short_name": "JASON_CS_S6A_L2_ALT_HR_STD_OST_NRT_F", "bounding_box": "-30,20,10,60"},
+        {"short_name": "JASON_CS_S6A_L1_ALT_LR_NRT_F", "data": "/scratch/l1", "extensions": [".nc", ".bin"]}
+      ]
+    }
+
+Top level settings are defaults for every collection.  A collection without
+its own `data` is kept in a subdirectory of the top level `data` named after
+its short name.  `"shard": "0/4"` keeps only the first of four shards of the
+granules (s6mf.shard), with its own checkpoint.
+"""
+
+import json
+import os
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from os.path import basename
+from typing import Dict, List, Optional, Sequence
+
+from .links import LinkSelector, granule_name_params
+from .shard import Shard
+
+TIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+
+def utcnow() -> str:
+    return datetime.utcnow().strftime(TIME_FORMAT)
+
+
+def read_checkpoint(path: str) -> Optional[str]:
+    """
+    The timestamp in the checkpoint file `path`, None if there is none.
+    """
+    try:
+        with open(path) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def write_checkpoint(path: str, timestamp: str) -> None:
+    """
+    Replace the checkpoint file `path` atomically, so a crash never leaves it
+    half written and a reader never sees it half written.
+    """
+    tmp = "{}.{}.tmp".format(path, os.getpid())
+    with open(tmp, "w") as f:
+        f.write(timestamp)
+    os.replace(tmp, path)
+
+
+@dataclass
+class Collection:
+    short_name: str
+    data: str
+    extensions: Sequence[str] = (".nc", ".bin")
+    bounding_box: str = "-180,-90,180,90"
+    # Granules ingested during the last `mins` minutes are fetched on the first run
+    mins: int = 60
+    # Granule name patterns (`*` and `?` wildcards) applied by CMR, e.g. ["*_NR_*_F08"]
+    granule_names: Sequence[str] = ()
+    shard: Shard = Shard()
+    selector: LinkSelector = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        self.selector = LinkSelector(self.extensions)
+        if isinstance(self.shard, str):
+            self.shard = Shard.parse(self.shard)
+
+    def params(self, since: str) -> Dict:
+        """
+        CMR search parameters for the granules ingested since `since`.
+        """
+        return dict({
+            'sort_key': "-start_date",
+            'ShortName': self.short_name,
+            'created_at': since,
+            'bounding_box': self.bounding_box,
+        }, **granule_name_params(self.granule_names))
+
+    def links(self, item: Dict) -> List[str]:
+        """
+        The data and extended metadata links of a granule record that match
+        `extensions`, the same selection the access scripts make.
+        """
+        return self.selector.links(item)
+
+    def path(self, url: str) -> str:
+        return os.path.join(self.data, basename(url))
+
+    @property
+    def update_file(self) -> str:
+        return os.path.join(self.data, ".update"+self.shard.suffix)
+
+    @property
+    def lease_file(self) -> str:
+        return os.path.join(self.data, ".lease"+self.shard.suffix)
+
+    def read_checkpoint(self) -> Optional[str]:
+        """
+        Timestamp of the last complete update, from `.update` in the data
+        directory; a shard without a checkpoint of its own starts from it too.
+        """
+        return read_checkpoint(self.update_file) or read_checkpoint(os.path.join(self.data, ".update"))
+
+    def since(self) -> str:
+        """
+        Where the next search starts: the checkpoint, or `mins` minutes ago.
+        """
+        return self.read_checkpoint() or (datetime.utcnow()-timedelta(minutes=self.mins)).strftime(TIME_FORMAT)
+
+    def write_checkpoint(self, timestamp: str) -> None:
+        """
+        Replace `.update` atomically, so a crash never leaves it half written.
+        """
+        os.makedirs(self.data, exist_ok=True)
+        write_checkpoint(self.update_file, timestamp)
+
+
+def load_collections(path: str) -> List[Collection]:
+    """
+    The collections listed in the JSON configuration file at `path`.
+    """
+    with open(path) as f:
+        config = json.load(f)
+    defaults = {k: v for k, v in config.items() if k not in ("collections", "data")}
+    collections = []
+    for entry in config["collections"]:
+        settings = dict(defaults, **entry)
+        if "data" not in settings:
+            if "data" not in config:
+                raise ValueError(path+": no data directory for "+settings["short_name"])
+            settings["data"] = os.path.join(config["data"], settings["short_name"])
+        collections.append(Collection(**settings))
+    return collections
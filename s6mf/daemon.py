@@ -0,0 +1,348 @@
+"""
+Long running near-real-time sync.
+
+Instead of starting the access script from cron every hour, the daemon stays
+up and polls CMR for granules ingested (`created_at`) since its last poll,
+for several collections at once.  The HTTP session, CMR token and manifests
+stay open between polls, and new files are handed to the download workers as
+soon as a search page lists them.
+
+Each collection's `.update` checkpoint only moves forward once every file of
+a poll - and of all polls before it - has been downloaded.  When a download
+fails, the next poll searches again from the checkpoint; the manifest keeps
+files that did download from being fetched twice.  SIGINT/SIGTERM stop the
+polling, let running downloads finish, write the checkpoints and exit.
+
+All collections share the session and the download workers.  Files wait in a
+queue that serves the collections round-robin (s6mf.scheduler), so a
+collection with a large backlog cannot hold up the others.  With `once` the
+daemon polls every collection a single time, downloads what it found and
+exits, for running from cron.
+
+Each collection's data directory is leased (s6mf.locking.Lease) while the
+daemon runs, so a second daemon or an overlapping cron run on the same
+directory leaves it alone instead of downloading the same files.  With a
+shard (s6mf.shard) several daemons split the granules of one directory, each
+with its own lease, checkpoint and manifest.
+
+    python3 -m s6mf.daemon /path/to/data SHORT_NAME [SHORT_NAME ...] --interval 300
+    python3 -m s6mf.daemon --config collections.json --once
+    python3 -m s6mf.daemon /path/to/data SHORT_NAME --shard 1/4
+"""
+
+import argparse
+import asyncio
+import os
+import signal
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Deque, List, Optional
+
+from .collection import Collection, load_collections, utcnow
+from .download import DownloadEngine, DownloadResult, print_result
+from .locking import Lease, LeaseError
+from .manifest import Manifest, NewFiles
+from .scheduler import AsyncFairQueue
+from .search import CMR, GranuleSearch, granule_search_url, token_url
+from .session import Session
+from .shard import Shard
+from .umm import file_info
+
+
+class _Poll:
+    def __init__(self, since: str, timestamp: str):
+        self.since = since
+        self.timestamp = timestamp
+        self.searched = False
+        self.outstanding = 0
+        self.failed = False
+
+
+class _State:
+    """
+    Poll bookkeeping of one collection.
+    """
+
+    def __init__(self, collection: Collection, track_index: bool = False, lease_wait: float = 0,
+                 store: bool = False):
+        self.collection = collection
+        os.makedirs(collection.data, exist_ok=True)
+        self.lease = Lease(collection.lease_file).acquire(lease_wait)
+        self.checkpoint = collection.since()
+        self.since = self.checkpoint
+        self.polls: Deque[_Poll] = deque()
+        self.downloaded = self.failed = 0
+        self.manifest = Manifest(collection.data, collection.shard)
+        # The files queued or downloading are in files.pending
+        self.files = NewFiles(collection, self.manifest, collection.shard)
+        self.index = None
+        if track_index:
+            from .trackindex import TrackIndex
+            self.index = TrackIndex(collection.data)
+        self.store = None
+        if store:
+            from .store import STORE_NAME, Store
+            self.store = Store(os.path.join(collection.data, STORE_NAME))
+
+
+class Daemon:
+    """
+    Poll `collections` every `interval` seconds and download what is new.
+
+    cmr           - CMR host, or a base URL such as http://localhost:8080 for testing
+    workers       - downloads running at once, shared by all collections
+    once          - poll each collection only once and return when its files are done
+    search_format - "umm_json" or the lighter "json" (Atom), see s6mf.search
+    session       - s6mf.session.Session shared by searches and downloads
+    token         - optional s6mf.tokens.TokenCache for the searches
+    engine        - DownloadEngine; by default one using `session`
+    track_index   - add every downloaded .nc file to the along-track index of
+                    its collection (s6mf.trackindex, needs netCDF4)
+    lease_wait    - seconds to wait for another process to release the data
+                    directory of a collection; after that it is left out
+    store         - append every downloaded .nc file to the columnar store of
+                    its collection, s6mf.zarr in its data directory
+                    (s6mf.store, needs netCDF4)
+    """
+
+    def __init__(self, collections: List[Collection], cmr: str = CMR, interval: float = 300,
+                 workers: int = 8, per_host: int = 4, session: Optional[Session] = None,
+                 token=None, engine: Optional[DownloadEngine] = None, page_size: int = 2000,
+                 once: bool = False, search_format: str = "umm_json", track_index: bool = False,
+                 lease_wait: float = 0, store: bool = False):
+        self.collections = collections
+        self.search_url = granule_search_url(cmr, search_format)
+        self.interval = interval
+        self.workers = max(1, workers)
+        self.session = session or Session()
+        self.token = token
+        self.engine = engine or DownloadEngine(self.workers, per_host, session=self.session)
+        self.page_size = page_size
+        self.once = once
+        self.track_index = track_index
+        self.lease_wait = lease_wait
+        self.store = store
+        self._stop: Optional[asyncio.Event] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._executor = ThreadPoolExecutor(max_workers=self.workers+len(collections))
+
+    def stop(self) -> None:
+        """
+        Ask the daemon to shut down; safe to call from a signal handler.
+        """
+        if self._stop is not None:
+            self._stop.set()
+
+    async def _in_thread(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def _poll(self, state: _State) -> None:
+        c = state.collection
+        while not self._stop.is_set():
+            poll = _Poll(state.since, utcnow())
+            state.polls.append(poll)
+            state.since = poll.timestamp
+            found = 0
+            try:
+                search = GranuleSearch(self.search_url, c.params(poll.since), self.page_size,
+                                       session=self.session, token=self.token)
+                pages = search.pages()
+                while True:
+                    page = await self._in_thread(next, pages, None)
+                    if page is None:
+                        break
+                    found += len(page)
+                    for url, item in state.files(page):
+                        poll.outstanding += 1
+                        self._queue.put_nowait((state, poll, item, url))
+                print(utcnow()+" "+str(found)+" new granules ingested for "+c.short_name+" since "+poll.since)
+            except Exception as e:
+                print(utcnow()+" FAILURE: search for "+c.short_name+" since "+poll.since)
+                print(e)
+                poll.failed = True
+            poll.searched = True
+            self._advance(state)
+            self.session.telemetry.write_prometheus()
+            if self.once:
+                break
+            try:
+                await asyncio.wait_for(self._stop.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _download(self) -> None:
+        while True:
+            state, poll, item, url = await self._queue.get()
+            try:
+                result: DownloadResult = await self._in_thread(
+                    self.engine.download, url, state.collection.path(url), file_info(item, url))
+                print_result(result)
+                state.files.pending.pop(url, None)
+                if result.ok:
+                    state.downloaded += 1
+                    state.manifest.add(item, url, result.path, result.nbytes)
+                    if state.index is not None and result.path.endswith(".nc"):
+                        await self._index(state, result.path)
+                    if state.store is not None and result.path.endswith(".nc"):
+                        await self._consolidate(state, result.path)
+                else:
+                    state.failed += 1
+                self._finish(state, poll, result.ok)
+            finally:
+                self._queue.task_done()
+
+    async def _index(self, state: _State, path: str) -> None:
+        from .trackindex import scan
+        try:
+            state.index.add(path, await self._in_thread(scan, path))
+        except Exception as e:
+            print(utcnow()+" FAILURE: indexing "+path)
+            print(e)
+
+    async def _consolidate(self, state: _State, path: str) -> None:
+        try:
+            await self._in_thread(state.store.add, path)
+        except Exception as e:
+            print(utcnow()+" FAILURE: adding "+path+" to the store")
+            print(e)
+
+    def _finish(self, state: _State, poll: _Poll, ok: bool) -> None:
+        poll.outstanding -= 1
+        poll.failed |= not ok
+        self._advance(state)
+
+    def _advance(self, state: _State) -> None:
+        """
+        Move the checkpoint over the completed polls at the front of the queue.
+        A poll only counts if it searched from the checkpoint onwards; after a
+        failure the next poll starts at the checkpoint again.
+        """
+        while state.polls and state.polls[0].searched and state.polls[0].outstanding == 0:
+            poll = state.polls.popleft()
+            if poll.failed:
+                state.since = state.checkpoint
+            elif poll.since <= state.checkpoint:
+                try:
+                    state.lease.check()
+                except LeaseError as e:
+                    # Another process works on the directory now: its checkpoint wins
+                    print(utcnow()+" FAILURE: "+str(e))
+                    self.stop()
+                    return
+                state.checkpoint = poll.timestamp
+                state.collection.write_checkpoint(poll.timestamp)
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        self._queue = AsyncFairQueue()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.stop)
+            except (NotImplementedError, RuntimeError):
+                pass
+
+        states = []
+        for c in self.collections:
+            try:
+                states.append(_State(c, self.track_index, self.lease_wait, self.store))
+            except LeaseError as e:
+                print(utcnow()+" SKIP: "+c.short_name+", "+str(e))
+        if not states:
+            self._executor.shutdown(wait=False)
+            return
+        pollers = [asyncio.create_task(self._poll(s)) for s in states]
+        downloaders = [asyncio.create_task(self._download()) for _ in range(self.workers)]
+        finished = asyncio.create_task(self._run_once(pollers)) if self.once else None
+        try:
+            await self._stop.wait()
+        finally:
+            print(utcnow()+" Shutting down")
+            for task in pollers+([finished] if finished else []):
+                task.cancel()
+            await asyncio.gather(*pollers, return_exceptions=True)
+            # Queued files are dropped; their polls fail so the checkpoints stay
+            # before them and the next start finds them again.
+            while not self._queue.empty():
+                state, poll, item, url = self._queue.get_nowait()
+                state.files.pending.pop(url, None)
+                self._finish(state, poll, False)
+                self._queue.task_done()
+            await self._queue.join()
+            for task in downloaders:
+                task.cancel()
+            await asyncio.gather(*downloaders, return_exceptions=True)
+            for state in states:
+                self._advance(state)
+                state.manifest.close()
+                if state.index is not None:
+                    state.index.close()
+                state.lease.release()
+                print("Checkpoint for "+state.collection.short_name+": "+state.checkpoint
+                      +" ("+str(state.downloaded)+" downloaded, "+str(state.failed)+" failed, "
+                      +str(state.files.skipped)+" skipped)")
+            print(self.session.telemetry.summary())
+            self.session.telemetry.close()
+            self._executor.shutdown(wait=False)
+
+    async def _run_once(self, pollers) -> None:
+        await asyncio.gather(*pollers)
+        await self._queue.join()
+        self.stop()
+
+
+def main():
+    from .session import earthdata_session
+    from .telemetry import Telemetry
+    from .tokens import TokenCache, create_token
+
+    parser = argparse.ArgumentParser(description="Keep local copies of Sentinel-6 MF collections up to date")
+    parser.add_argument("data", nargs="?", help="data directory; each collection is kept in a subdirectory")
+    parser.add_argument("short_names", nargs="*", metavar="SHORT_NAME")
+    parser.add_argument("--config", help="JSON file listing the collections and their settings, see s6mf/collection.py")
+    parser.add_argument("--once", action="store_true", help="poll once, download and exit")
+    parser.add_argument("--interval", type=float, default=300, help="seconds between polls")
+    parser.add_argument("--extensions", nargs="+", default=[".nc", ".bin"])
+    parser.add_argument("--bbox", default="-180,-90,180,90", help="W,S,E,N")
+    parser.add_argument("--mins", type=int, default=60, help="minutes to look back on the first run")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--cmr", default=CMR)
+    parser.add_argument("--format", default="umm_json", choices=["umm_json", "json"],
+                        help="CMR result format; json (Atom) is lighter but has no checksums")
+    parser.add_argument("--token", action="store_true", help="send a (cached) CMR token with the searches")
+    parser.add_argument("--shard", type=Shard.parse, default=Shard(), metavar="INDEX/COUNT",
+                        help="download only this share of the granules, e.g. 0/4 (s6mf/shard.py)")
+    parser.add_argument("--lease-wait", type=float, default=0,
+                        help="seconds to wait for another process working on a data directory")
+    parser.add_argument("--index", action="store_true",
+                        help="keep an along-track index of the downloaded files (needs netCDF4)")
+    parser.add_argument("--store", action="store_true",
+                        help="append the downloaded files to a store partitioned by cycle (needs netCDF4)")
+    parser.add_argument("--telemetry", help="append the timing of every request and file to this file as JSON lines")
+    parser.add_argument("--prometheus", help="keep the timing totals in this file in the Prometheus text format")
+    args = parser.parse_args()
+
+    collections = load_collections(args.config) if args.config else []
+    if args.short_names:
+        collections += [Collection(name, args.data+"/"+name, args.extensions, args.bbox, args.mins)
+                        for name in args.short_names]
+    if not collections:
+        parser.error("give a data directory and short names, or --config")
+    if args.shard.count > 1:
+        for c in collections:
+            c.shard = args.shard
+    session = earthdata_session(pool_size=args.workers)
+    session.telemetry = Telemetry(args.telemetry, args.prometheus)
+    token = None
+    if args.token:
+        tokens = token_url(args.cmr)
+        token = TokenCache(lambda: create_token(tokens, 'Sentinel-6MF', session=session),
+                           tokens+" Sentinel-6MF", telemetry=session.telemetry)
+    daemon = Daemon(collections, args.cmr, args.interval, args.workers, session=session, token=token,
+                    once=args.once, search_format=args.format, track_index=args.index,
+                    lease_wait=args.lease_wait, store=args.store)
+    asyncio.run(daemon.run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,481 @@
+"""
+Concurrent download engine for granule files.
+
+Files are fetched by a bounded pool of worker threads.  On top of the pool size
+each host gets its own limit so a single data server is never hit by more than
+`per_host` simultaneous transfers, no matter how many workers are configured.
+Every file produces a DownloadResult; the caller decides how to report them.
+
+Downloads are written to a `.part` file next to the destination, resumed with
+HTTP Range requests after a dropped connection and renamed into place when
+they are complete.  The ETag (or Last-Modified date) of the file is kept next
+to the partial file and sent as If-Range, so a file that changed on the
+server since is downloaded afresh instead of appended to the old part.  When the granule record advertises a size and checksum
+for the file, the data is hashed while it is written and verified before the
+rename, so verification costs no second read of the file.
+
+Failed transfers are retried with jittered exponential backoff, waiting as long
+as a Retry-After header asks.  The per-host limit adapts: it shrinks when the
+host answers 429/503 and grows back as transfers succeed, and no transfer is
+started against a host whose circuit breaker is open (s6mf.resilience).
+
+The data is read into buffers from a pool shared by all transfers and written
+straight to the file descriptor (s6mf.streaming), so the memory held in
+buffers is capped however many transfers run.  Files can be preallocated from
+their advertised size and flushed to disk as they are written.
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime
+from http.client import HTTPException, IncompleteRead
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from requests import HTTPError, Response
+
+from .checksum import VerificationError, hash_file, new_hasher
+from .resilience import RETRY_STATUS, AdaptiveLimit, Backoff, CircuitOpenError
+from .session import Session
+from .streaming import BUFFER_SIZE, MEMORY_LIMIT, BufferPool, preallocate, write_body
+from .umm import ArchiveInfo
+
+PART_SUFFIX = ".part"
+# Next to a preallocated partial file while it is written; holds the offset
+# up to which the data is known to be on disk
+ALLOC_SUFFIX = ".alloc"
+# Next to a partial file downloaded in chunks; lists the chunks that are done
+CHUNKS_SUFFIX = ".chunks"
+# Next to a partial file; the validator of the version of the file it holds
+VALIDATOR_SUFFIX = ".validator"
+
+
+@dataclass
+class DownloadResult:
+    url: str
+    path: str
+    ok: bool
+    nbytes: int = 0
+    elapsed: float = 0.0
+    error: Optional[BaseException] = None
+
+
+def _total_size(headers) -> Optional[int]:
+    """
+    Full size of the file from a `Content-Range: bytes a-b/size` header.
+    """
+    total = (headers.get("Content-Range") or "").rpartition("/")[2]
+    return int(total) if total.isdigit() else None
+
+
+def _range_covers(headers, offset: int) -> bool:
+    """
+    True if the `Content-Range` of a 206 response runs from `offset` to the
+    end of the file.
+    """
+    spec, _, total = (headers.get("Content-Range") or "").partition(" ")[2].partition("/")
+    start, _, end = spec.partition("-")
+    if not (start.isdigit() and end.isdigit()):
+        return False
+    return int(start) == offset and (not total.isdigit() or int(end) == int(total)-1)
+
+
+def _validator(headers) -> Optional[str]:
+    """
+    What an If-Range can name the version of a response by: its ETag unless
+    that is weak, else its Last-Modified date.
+    """
+    etag = headers.get("ETag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return headers.get("Last-Modified")
+
+
+def _stored_validator(part: str) -> Optional[str]:
+    """
+    The validator kept next to the partial file `part`, None without one.
+    """
+    if not os.path.exists(part+VALIDATOR_SUFFIX):
+        return None
+    with open(part+VALIDATOR_SUFFIX) as f:
+        return f.read().strip() or None
+
+
+def _keep_validator(part: str, validator: Optional[str]) -> None:
+    if validator:
+        with open(part+VALIDATOR_SUFFIX, "w") as f:
+            f.write(validator)
+    else:
+        _discard(part+VALIDATOR_SUFFIX)
+
+
+def _discard(*paths: str) -> None:
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _resume_offset(part: str) -> int:
+    """
+    Bytes of the partial file `part` that can be kept.
+    """
+    if not os.path.exists(part):
+        return 0
+    marker = part+ALLOC_SUFFIX
+    if not os.path.exists(marker):
+        return os.path.getsize(part)
+    # Preallocated and cut off before it was trimmed: its size says nothing
+    with open(marker) as f:
+        text = f.read().strip()
+    offset = int(text) if text.isdigit() else 0
+    os.truncate(part, offset)
+    os.remove(marker)
+    return offset
+
+
+def _mark(marker: str, offset: int) -> None:
+    with open(marker, "w") as f:
+        f.write(str(offset))
+
+
+def _verify(url: str, expected: Optional[ArchiveInfo], nbytes: int, hasher) -> None:
+    if expected is None:
+        return
+    if expected.size_exact and expected.size is not None and nbytes != expected.size:
+        raise VerificationError("{}: {} bytes, CMR lists {}".format(url, nbytes, expected.size))
+    if hasher and hasher.hexdigest().lower() != expected.checksum.lower():
+        raise VerificationError("{}: {} {}, CMR lists {}".format(
+            url, expected.algorithm, hasher.hexdigest(), expected.checksum))
+
+
+@contextmanager
+def _timed(timing: Dict[str, float], phase: str):
+    """
+    Add the time spent in the `with` block to timing[phase].
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing[phase] = timing.get(phase, 0.0)+time.perf_counter()-start
+
+
+def print_result(result: DownloadResult) -> None:
+    """
+    Print a result the same way the download loop in the scripts always has.
+    """
+    print(datetime.now())
+    if result.ok:
+        print("SUCCESS: "+result.url+"\n\n")
+    else:
+        print("FAILURE: "+result.url+"\n\n")
+        print(result.error)
+
+
+class DownloadEngine:
+    """
+    Download (url, path) jobs with a bounded worker pool.
+
+    workers       - total number of transfers in flight
+    per_host      - maximum number of transfers in flight against one host; lowered
+                    automatically while the host pushes back
+    timeout       - socket timeout in seconds for each request
+    retries       - how many times a failed transfer is retried (a dropped one
+                    resumed) before giving up
+    backoff       - s6mf.resilience.Backoff timing the retries
+    breaker_wait  - seconds a transfer waits for an open circuit breaker to let
+                    requests through again before it fails
+    chunk_size    - if set, files larger than this many bytes are fetched as
+                    parallel byte-range chunks
+    chunk_workers - number of parallel chunks per file
+    buffer_size   - bytes read from a response and written to disk at a time
+    memory_limit  - bytes of buffers shared by all transfers; a transfer waits
+                    for a free buffer once they are all in use
+    preallocate   - reserve the whole file on disk before writing it, from the
+                    size listed in the granule metadata or else the response
+    sync_every    - if set, flush every this many bytes written to disk and
+                    drop them from the page cache
+    session       - s6mf.session.Session to download with; by default one is
+                    created with a connection pool large enough for all workers
+    """
+
+    def __init__(self, workers: int = 4, per_host: int = 4, timeout: float = 60,
+                 retries: int = 5, chunk_size: Optional[int] = None, chunk_workers: int = 4,
+                 session: Optional[Session] = None, backoff: Optional[Backoff] = None,
+                 breaker_wait: float = 300, buffer_size: int = BUFFER_SIZE, memory_limit: int = MEMORY_LIMIT,
+                 preallocate: bool = False, sync_every: Optional[int] = None):
+        self.workers = max(1, workers)
+        self.per_host = max(1, per_host)
+        self.timeout = timeout
+        self.retries = max(0, retries)
+        self.chunk_size = chunk_size
+        self.chunk_workers = max(1, chunk_workers)
+        self.session = session or Session(pool_size=self.per_host*(self.chunk_workers if chunk_size else 1))
+        self.backoff = backoff or Backoff()
+        self.breaker_wait = breaker_wait
+        self.buffers = BufferPool(buffer_size, memory_limit)
+        self.preallocate = preallocate
+        self.sync_every = sync_every
+
+    def _slot(self, url: str) -> AdaptiveLimit:
+        return self.session.health.limit(url, self.per_host)
+
+    def fetch(self, url: str, path: str, expected: Optional[ArchiveInfo] = None,
+              timing: Optional[Dict[str, float]] = None) -> int:
+        """
+        Download one URL to `path` and return its size in bytes.
+
+        The data goes to `path`.part first and is renamed into place once it is
+        complete, so `path` is never left truncated.  A dropped connection is
+        resumed from the end of the partial file, and so is a partial file left
+        behind by an earlier run.
+
+        With `expected` (the UMM-G size and checksum of the file) the data is
+        hashed as it is written and checked before the rename; a file that does
+        not match is discarded and downloaded again.  Its size is also what the
+        file is preallocated to.
+
+        `timing`, if given, is filled with the phases of the download in
+        seconds: `ttfb` (until the first response), `transfer` (receiving data)
+        and `verify` (checksums), and the number of `attempts`.
+        """
+        timing = {} if timing is None else timing
+        part = path+PART_SUFFIX
+        size = expected.size if expected and expected.size_exact else None
+        breaker = self.session.health.breaker(url)
+        for attempt in range(self.retries+1):
+            if not breaker.wait(self.breaker_wait):
+                raise CircuitOpenError(urlsplit(url).netloc+" keeps failing, not trying "+url)
+            response = None
+            hasher = new_hasher(expected.algorithm) if expected and expected.checksum else None
+            timing["attempts"] = attempt+1
+            try:
+                if self.chunk_size:
+                    nbytes = self._fetch_chunked(url, part, hasher, timing, size)
+                else:
+                    nbytes = self._fetch_resume(url, part, hasher, timing, size)
+                with _timed(timing, "verify"):
+                    _verify(url, expected, nbytes, hasher)
+                break
+            except HTTPError as e:
+                if e.response.status_code not in RETRY_STATUS or attempt == self.retries:
+                    raise
+                response = e.response
+            except VerificationError:
+                _discard(part, part+VALIDATOR_SUFFIX, part+CHUNKS_SUFFIX)
+                if attempt == self.retries:
+                    raise
+            except (OSError, HTTPException):
+                if attempt == self.retries:
+                    raise
+            self.backoff.sleep(attempt, response)
+        os.replace(part, path)
+        _discard(part+VALIDATOR_SUFFIX)
+        return nbytes
+
+    def _get(self, url: str, headers: Dict[str, str], timing: Optional[Dict[str, float]] = None) -> Response:
+        # Byte ranges, sizes and checksums are all of the file as stored, not
+        # of a compressed transfer of it
+        headers = dict(headers, **{"Accept-Encoding": "identity"})
+        response = self.session.get(url, headers=headers, stream=True, timeout=self.timeout)
+        if timing is not None:
+            timing.setdefault("ttfb", response.response_time)
+        return response
+
+    def _fetch_resume(self, url: str, part: str, hasher=None, timing: Optional[Dict[str, float]] = None,
+                      size: Optional[int] = None) -> int:
+        timing = {} if timing is None else timing
+        offset = _resume_offset(part)
+        validator = _stored_validator(part) if offset else None
+        # Without a validator only a checksum can tell that the partial file
+        # holds the start of the same version of the file
+        if validator is None and hasher is None:
+            offset = 0
+        headers = {}
+        if offset:
+            headers["Range"] = "bytes={}-".format(offset)
+            if validator:
+                headers["If-Range"] = validator
+        with self._get(url, headers, timing) as src:
+            if src.status_code == 416 and offset:
+                # The partial file already holds the whole file
+                if _total_size(src.headers) == offset:
+                    if hasher:
+                        with _timed(timing, "verify"):
+                            hash_file(part, hasher)
+                    return offset
+                # It is longer than the file is now
+                restart = True
+            else:
+                src.raise_for_status()
+                restart = bool(offset) and src.status_code == 206 and not _range_covers(src.headers, offset)
+            if not restart:
+                return self._write_response(src, part, offset, hasher, timing, size)
+        _discard(part, part+VALIDATOR_SUFFIX)
+        return self._fetch_resume(url, part, hasher, timing, size)
+
+    def _write_response(self, src: Response, part: str, offset: int, hasher, timing: Dict[str, float],
+                        size: Optional[int]) -> int:
+        """
+        Write the body of `src`, a 200 response or a 206 one from `offset`, to
+        `part` and return the size of the file.
+        """
+        if src.status_code != 206:
+            offset = 0
+            _keep_validator(part, _validator(src.headers))
+        if offset and hasher:
+            with _timed(timing, "verify"):
+                hash_file(part, hasher, offset)
+        # Should a server compress the body anyway, its length says nothing
+        # about the size of the file
+        length = -1 if src.headers.get("Content-Encoding", "identity") != "identity" else \
+            int(src.headers.get("Content-Length", -1))
+        expected = offset+length
+        with _timed(timing, "transfer"):
+            nbytes = self._write(src, part, offset, hasher, (size or expected) if self.preallocate else None)
+        if expected > offset and nbytes != expected:
+            raise IncompleteRead(b"", expected-nbytes)
+        return nbytes
+
+    def _write(self, src: Response, part: str, offset: int, hasher=None, size: Optional[int] = None) -> int:
+        """
+        Write the body of `src` to `part` from `offset` and return the size of
+        the file, preallocated to `size` bytes while it is written if given.
+        """
+        fd = os.open(part, os.O_WRONLY | os.O_CREAT | (0 if offset else os.O_TRUNC), 0o666)
+        marker = part+ALLOC_SUFFIX
+        allocated = False
+        try:
+            os.lseek(fd, offset, os.SEEK_SET)
+            if size and size > offset:
+                _mark(marker, offset)
+                allocated = preallocate(fd, offset, size-offset)
+                if not allocated:
+                    os.remove(marker)
+            synced = (lambda position: _mark(marker, position)) if allocated else None
+            return offset+write_body(src, fd, self.buffers, hasher, self.sync_every, synced)
+        finally:
+            if allocated:
+                os.ftruncate(fd, os.lseek(fd, 0, os.SEEK_CUR))
+                os.remove(marker)
+            os.close(fd)
+
+    def _fetch_chunked(self, url: str, part: str, hasher=None, timing: Optional[Dict[str, float]] = None,
+                       size: Optional[int] = None) -> int:
+        timing = {} if timing is None else timing
+        with self._get(url, {"Range": "bytes=0-0"}, timing) as src:
+            src.raise_for_status()
+            total = _total_size(src.headers) if src.status_code == 206 else None
+            validator = _validator(src.headers)
+        if total is None or total <= self.chunk_size:
+            return self._fetch_resume(url, part, hasher, timing, size)
+
+        # Finished chunks are listed in a side file so a later attempt only
+        # fetches the missing ones.  A partial file without one was written
+        # sequentially and is valid up to its current size.  Either is only
+        # kept if it is of the same version of the file, as far as the
+        # validator (or else the checksum at the end) can tell.
+        done_file = part+CHUNKS_SUFFIX
+        if os.path.exists(part) and (_stored_validator(part) != validator or (validator is None and hasher is None)):
+            _discard(part, done_file, part+ALLOC_SUFFIX)
+        _keep_validator(part, validator)
+        chunks = [(start, min(start+self.chunk_size, total)-1) for start in range(0, total, self.chunk_size)]
+        if os.path.exists(done_file):
+            with open(done_file) as f:
+                done = {int(line) for line in f if line.strip()}
+        else:
+            have = os.path.getsize(part) if os.path.exists(part) else 0
+            done = {i for i, (start, end) in enumerate(chunks) if end < have}
+        # The side file goes first: a full-size file without one would pass
+        # for a finished one
+        with open(done_file, "w") as f:
+            f.writelines("{}\n".format(i) for i in sorted(done))
+        with open(part, "r+b" if os.path.exists(part) else "wb") as f:
+            f.truncate(total)
+            if self.preallocate:
+                preallocate(f.fileno(), 0, total)
+
+        lock = threading.Lock()
+
+        def fetch_chunk(i: int) -> None:
+            start, end = chunks[i]
+            headers = {"Range": "bytes={}-{}".format(start, end)}
+            if validator:
+                headers["If-Range"] = validator
+            with self._get(url, headers) as src:
+                src.raise_for_status()
+                # A 200 to an If-Range: the file changed, and the next attempt
+                # starts it over
+                if src.status_code != 206:
+                    raise HTTPException("server ignored the byte range of "+url)
+                fd = os.open(part, os.O_WRONLY)
+                try:
+                    os.lseek(fd, start, os.SEEK_SET)
+                    nbytes = write_body(src, fd, self.buffers, sync_every=self.sync_every)
+                finally:
+                    os.close(fd)
+                if nbytes != end+1-start:
+                    raise IncompleteRead(b"", end+1-start-nbytes)
+            with lock, open(done_file, "a") as f:
+                f.write("{}\n".format(i))
+
+        with ThreadPoolExecutor(max_workers=self.chunk_workers) as pool, _timed(timing, "transfer"):
+            for future in [pool.submit(fetch_chunk, i) for i in range(len(chunks)) if i not in done]:
+                future.result()
+        if os.path.exists(done_file):
+            os.remove(done_file)
+        # Chunks arrive out of order, so the checksum needs one pass over the file
+        if hasher:
+            with _timed(timing, "verify"):
+                hash_file(part, hasher)
+        return total
+
+    def download(self, url: str, path: str, expected: Optional[ArchiveInfo] = None) -> DownloadResult:
+        start = time.monotonic()
+        timing: Dict[str, float] = {}
+        with self._slot(url):
+            try:
+                nbytes = self.fetch(url, path, expected, timing)
+                result = DownloadResult(url, path, True, nbytes, time.monotonic()-start)
+            except Exception as e:
+                result = DownloadResult(url, path, False, elapsed=time.monotonic()-start, error=e)
+        self.session.telemetry.file(result, timing.get("ttfb"), timing.get("transfer"), timing.get("verify"),
+                                    int(timing.get("attempts", 1)))
+        return result
+
+    def run(self, jobs: Iterable[Tuple],
+            callback: Optional[Callable[[DownloadResult], None]] = None) -> List[DownloadResult]:
+        """
+        Download every (url, path) or (url, path, expected) in `jobs` and return
+        the results in completion order, where `expected` is the ArchiveInfo to
+        verify the file against.  `callback` is called from the calling thread as
+        each file finishes.
+
+        `jobs` may be a lazy iterable, e.g. one fed by a paged CMR search: files are
+        submitted as they are produced, so earlier files download while later ones
+        are still being looked up.
+        """
+        results: List[DownloadResult] = []
+        done: "queue.SimpleQueue[Future]" = queue.SimpleQueue()
+
+        def collect(future: Future) -> None:
+            result = future.result()
+            if callback is not None:
+                callback(result)
+            results.append(result)
+
+        submitted = 0
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for job in jobs:
+                pool.submit(self.download, *job).add_done_callback(done.put)
+                submitted += 1
+                while not done.empty():
+                    collect(done.get())
+            while len(results) < submitted:
+                collect(done.get())
+        return results
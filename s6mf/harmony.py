@@ -0,0 +1,351 @@
+"""
+Batch subsetting with Harmony.
+
+A subset request over a large area or a long time range is one long Harmony
+job whose outputs are only fetched once it is done.  SubsetBatch splits the
+request into tiles and time windows (split()) and submits each as its own
+asynchronous job through the Harmony OGC Coverages API, at most `jobs` at a
+time.  The jobs are polled concurrently and every output is downloaded as
+soon as Harmony lists it, while the job is still running.
+
+The IDs of the submitted jobs are kept in `.harmony_jobs.json` in the data
+directory.  A batch that is interrupted and started again polls the jobs it
+had submitted instead of submitting them again, skips the outputs that are
+already there and resumes the partial ones (s6mf.download).  Jobs that
+failed, were canceled or have expired are submitted again.  A job that
+Harmony holds for the user (paused, or previewing a large request) is not
+waited for: its tile is reported with that status, and the next run picks the
+job up again once it has been resumed, e.g. in the Harmony jobs page.
+
+    python3 -m s6mf.harmony C1238543220-POCLOUD /path/to/data --bbox -10,-10,10,10 \\
+        --start 2020-12-01T00:00:00Z --stop 2020-12-31T00:00:00Z --tile 5 --days 7
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from os.path import basename
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlencode, urlsplit
+
+from requests import HTTPError, RequestException
+
+from .collection import TIME_FORMAT
+from .download import DownloadEngine, DownloadResult, print_result
+from .resilience import RETRY_STATUS, Backoff, CircuitOpenError
+from .session import Session
+
+HARMONY = "https://harmony.earthdata.nasa.gov"
+STATE_FILE = ".harmony_jobs.json"
+# Job states after which Harmony produces no more outputs
+DONE = frozenset(("successful", "complete_with_errors", "failed", "canceled"))
+# Job states that wait for the user to resume the job; polling stops there
+WAITING = frozenset(("paused", "previewing"))
+# Jobs in these states are submitted again by the next run
+RESUBMIT = frozenset(("failed", "canceled"))
+
+
+def _time(value: str) -> datetime:
+    return datetime.fromisoformat(value.rstrip("Z"))
+
+
+@dataclass(frozen=True)
+class Tile:
+    """
+    One part of a subset request: a bounding box and an optional time range
+    (`start`/`stop` as %Y-%m-%dT%H:%M:%SZ).
+    """
+
+    west: float
+    south: float
+    east: float
+    north: float
+    start: Optional[str] = None
+    stop: Optional[str] = None
+
+    @property
+    def name(self) -> str:
+        """
+        Name of the tile, used for the directory its outputs go to.
+        """
+        name = "lon{:g}_{:g}_lat{:g}_{:g}".format(self.west, self.east, self.south, self.north)
+        if self.start or self.stop:
+            name += "_"+(self.start or "").replace("-", "").replace(":", "")
+            name += "_"+(self.stop or "").replace("-", "").replace(":", "")
+        return name
+
+    def params(self) -> List[Tuple[str, str]]:
+        """
+        The `subset` parameters of the tile for the OGC Coverages API.
+        """
+        params = [("subset", "lat({:g}:{:g})".format(self.south, self.north)),
+                  ("subset", "lon({:g}:{:g})".format(self.west, self.east))]
+        if self.start or self.stop:
+            params.append(("subset", 'time("{}":"{}")'.format(self.start or "*", self.stop or "*")))
+        return params
+
+
+def split(bbox: str, start: Optional[str] = None, stop: Optional[str] = None,
+          degrees: Optional[float] = None, days: Optional[float] = None) -> List[Tile]:
+    """
+    Split the bounding box `bbox` ("W,S,E,N") into tiles of at most `degrees`
+    on each side and the time range `start`-`stop` into windows of `days`.
+    Without `degrees` or `days` that dimension is not split.
+    """
+    west, south, east, north = (float(v) for v in bbox.split(","))
+    lons = _steps(west, east, degrees)
+    lats = _steps(south, north, degrees)
+    windows: List[Tuple[Optional[str], Optional[str]]] = [(start, stop)]
+    if days and start and stop:
+        t, end, windows = _time(start), _time(stop), []
+        while t < end:
+            t_next = min(t+timedelta(days=days), end)
+            windows.append((t.strftime(TIME_FORMAT), t_next.strftime(TIME_FORMAT)))
+            t = t_next
+    return [Tile(w, s, e, n, t0, t1) for t0, t1 in windows for s, n in lats for w, e in lons]
+
+
+def _steps(low: float, high: float, step: Optional[float]) -> List[Tuple[float, float]]:
+    if not step:
+        return [(low, high)]
+    steps = []
+    while low < high:
+        steps.append((low, min(low+step, high)))
+        low += step
+    return steps
+
+
+@dataclass
+class TileResult:
+    tile: Tile
+    job: Optional[str] = None
+    status: Optional[str] = None
+    message: str = ""
+    downloaded: int = 0
+    failed: int = 0
+    skipped: int = 0
+
+
+class SubsetBatch:
+    """
+    Subset `collection` (a concept id) over `tiles` with one Harmony job per
+    tile and download the outputs to `data`/<tile name>/.
+
+    harmony     - Harmony base URL
+    jobs        - jobs submitted and polled at once
+    workers     - outputs downloaded at once, over all jobs
+    interval    - seconds between two status requests of a job
+    max_results - optional limit on the granules each job subsets
+    format      - optional output format, e.g. "application/x-netcdf4"
+    session     - s6mf.session.Session logging in to Earthdata Login
+    engine      - DownloadEngine; by default one using `session`
+    """
+
+    def __init__(self, collection: str, tiles: List[Tile], data: str, harmony: str = HARMONY,
+                 jobs: int = 4, workers: int = 8, interval: float = 10, max_results: Optional[int] = None,
+                 format: Optional[str] = None, session: Optional[Session] = None,
+                 engine: Optional[DownloadEngine] = None, retries: int = 5, backoff: Optional[Backoff] = None):
+        self.collection = collection
+        self.tiles = tiles
+        self.data = data
+        self.harmony = harmony.rstrip("/")
+        self.jobs = max(1, jobs)
+        self.workers = max(1, workers)
+        self.interval = interval
+        self.max_results = max_results
+        self.format = format
+        self.session = session or Session(pool_size=self.workers)
+        self.engine = engine or DownloadEngine(self.workers, self.workers, session=self.session)
+        self.retries = max(0, retries)
+        self.backoff = backoff or Backoff()
+        self._state: Dict[str, Dict] = {}
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._requests: Optional[ThreadPoolExecutor] = None
+        self._downloads: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def state_file(self) -> str:
+        return os.path.join(self.data, STATE_FILE)
+
+    def _load_state(self) -> Dict[str, Dict]:
+        try:
+            with open(self.state_file) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _save_state(self) -> None:
+        tmp = self.state_file+".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self._state, f, indent=1)
+        os.replace(tmp, self.state_file)
+
+    def url(self, tile: Tile) -> str:
+        """
+        The request that starts the job of `tile`.
+        """
+        params = tile.params()+[("forceAsync", "true")]
+        if self.max_results:
+            params.append(("maxResults", str(self.max_results)))
+        if self.format:
+            params.append(("format", self.format))
+        return (self.harmony+"/"+self.collection+"/ogc-api-coverages/1.0.0/collections/all/coverage/rangeset?"
+                + urlencode(params))
+
+    def path(self, tile: Tile, url: str) -> str:
+        return os.path.join(self.data, tile.name, basename(urlsplit(url).path))
+
+    def _get_json(self, url: str) -> Dict:
+        """
+        GET a Harmony response, retrying throttled or failed requests.
+        """
+        breaker = self.session.health.breaker(url)
+        for attempt in range(self.retries+1):
+            if not breaker.wait(self.backoff.max_retry_after):
+                raise CircuitOpenError(urlsplit(url).netloc+" keeps failing")
+            try:
+                response = self.session.get(url, timeout=60)
+            except RequestException:
+                if attempt == self.retries:
+                    raise
+                self.backoff.sleep(attempt)
+                continue
+            if response.status_code not in RETRY_STATUS or attempt == self.retries:
+                response.raise_for_status()
+                return response.json()
+            self.backoff.sleep(attempt, response)
+
+    def submit(self, tile: Tile) -> str:
+        """
+        Start the job of `tile` and return its ID.
+        """
+        return self._get_json(self.url(tile))["jobID"]
+
+    def status(self, job: str) -> Tuple[str, str, List[str]]:
+        """
+        State, message and output URLs so far of `job`, over all pages of its links.
+        """
+        url: Optional[str] = self.harmony+"/jobs/"+job
+        outputs: List[str] = []
+        while url:
+            status = self._get_json(url)
+            links = status.get("links", [])
+            outputs += [link["href"] for link in links if link.get("rel") == "data"]
+            url = next((link["href"] for link in links if link.get("rel") == "next"), None)
+        return status["status"], status.get("message", ""), outputs
+
+    async def _in_thread(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._requests, func, *args)
+
+    async def _download(self, tile: Tile, url: str, result: TileResult) -> None:
+        path = self.path(tile, url)
+        if os.path.exists(path):
+            result.skipped += 1
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        done: DownloadResult = await asyncio.get_running_loop().run_in_executor(
+            self._downloads, self.engine.download, url, path)
+        print_result(done)
+        if done.ok:
+            result.downloaded += 1
+        else:
+            result.failed += 1
+
+    async def _job(self, tile: Tile) -> TileResult:
+        key = self.url(tile)
+        result = TileResult(tile)
+        downloads: List[asyncio.Task] = []
+        async with self._slots:
+            start = time.monotonic()
+            try:
+                job = self._state.get(key)
+                if job is not None and job["status"] not in RESUBMIT:
+                    try:
+                        await self._in_thread(self.status, job["id"])
+                    except HTTPError as e:
+                        # Harmony forgets jobs after a while
+                        if e.response.status_code != 404:
+                            raise
+                        job = None
+                if job is None or job["status"] in RESUBMIT:
+                    job = {"id": await self._in_thread(self.submit, tile), "status": "accepted"}
+                    self._state[key] = job
+                    self._save_state()
+                    print("Submitted job "+job["id"]+" for "+tile.name)
+                result.job = job["id"]
+                seen = set()
+                while True:
+                    status, result.message, outputs = await self._in_thread(self.status, job["id"])
+                    for url in outputs:
+                        if url not in seen:
+                            seen.add(url)
+                            downloads.append(asyncio.create_task(self._download(tile, url, result)))
+                    if status in DONE or status in WAITING:
+                        break
+                    await asyncio.sleep(self.interval)
+                result.status = job["status"] = status
+                self._save_state()
+                print("Job "+job["id"]+" for "+tile.name+": "+status+" ("+str(len(seen))+" outputs)")
+                if status != "successful":
+                    print(result.message)
+            except Exception as e:
+                print("FAILURE: job for "+tile.name)
+                print(e)
+                result.message = str(e)
+            self.session.telemetry.record("harmony_job", time.monotonic()-start, job=result.job,
+                                          tile=tile.name, status=result.status)
+        await asyncio.gather(*downloads)
+        return result
+
+    async def run(self) -> List[TileResult]:
+        """
+        Run the jobs of all tiles and download their outputs; one TileResult per tile.
+        """
+        os.makedirs(self.data, exist_ok=True)
+        self._state = self._load_state()
+        self._slots = asyncio.Semaphore(self.jobs)
+        self._requests = ThreadPoolExecutor(max_workers=self.jobs)
+        self._downloads = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            return await asyncio.gather(*[self._job(tile) for tile in self.tiles])
+        finally:
+            self._requests.shutdown(wait=False)
+            self._downloads.shutdown(wait=True)
+
+
+def main():
+    from .session import earthdata_session
+
+    parser = argparse.ArgumentParser(description="Subset a collection with parallel Harmony jobs")
+    parser.add_argument("collection", help="collection concept id, e.g. C1238543220-POCLOUD")
+    parser.add_argument("data", help="directory the outputs are downloaded to, one subdirectory per tile")
+    parser.add_argument("--bbox", default="-180,-90,180,90", help="W,S,E,N")
+    parser.add_argument("--start", help="start time, e.g. 2020-12-01T00:00:00Z")
+    parser.add_argument("--stop", help="stop time")
+    parser.add_argument("--tile", type=float, help="split the bounding box into tiles of this many degrees")
+    parser.add_argument("--days", type=float, help="split the time range into windows of this many days")
+    parser.add_argument("--jobs", type=int, default=4, help="Harmony jobs running at once")
+    parser.add_argument("--workers", type=int, default=8, help="outputs downloaded at once")
+    parser.add_argument("--interval", type=float, default=10, help="seconds between status requests of a job")
+    parser.add_argument("--max-results", type=int, help="granules subset per job at most")
+    parser.add_argument("--format", help="output format, e.g. application/x-netcdf4")
+    parser.add_argument("--harmony", default=HARMONY)
+    args = parser.parse_args()
+
+    tiles = split(args.bbox, args.start, args.stop, args.tile, args.days)
+    batch = SubsetBatch(args.collection, tiles, args.data, args.harmony, args.jobs, args.workers,
+                        args.interval, args.max_results, args.format, earthdata_session(pool_size=args.workers))
+    results = asyncio.run(batch.run())
+    for r in results:
+        print(r.tile.name+": "+str(r.status)+", "+str(r.downloaded)+" downloaded, "+str(r.failed)+" failed, "
+              + str(r.skipped)+" skipped")
+    print(batch.session.telemetry.summary())
+
+
+if __name__ == "__main__":
+    main()
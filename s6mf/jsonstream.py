@@ -0,0 +1,145 @@
+"""
+Incremental parsing of CMR search responses.
+
+A search page of 2000 verbose UMM-G records is tens of MB of JSON.  Reading it
+with `response.json()` holds the raw bytes, the decoded text and the complete
+object tree at the same time before the first record can be used.  ItemStream
+instead decodes the response as it arrives and yields the records of the
+`items` array (`feed.entry` for the Atom .json format) one at a time, each
+passed through a transform such as umm.project(), so only one network chunk
+and one record are held in memory however large the page is.  The JSON is
+parsed by the standard library decoder, one record per call.
+"""
+
+import codecs
+import json
+import re
+from typing import Callable, Dict, Iterable, Iterator, Optional
+
+_SEPARATOR = re.compile(r'[\s,]*')
+
+
+def _close_object(head: str) -> Dict:
+    """
+    Parse the start of a JSON document up to the records array, such as
+    `{"hits": 12, "took": 40,` or `{"feed": {"id": "...",`, by closing the
+    objects still open.  Nested objects are merged into one dict.
+    """
+    depth, in_string, escaped = 0, False, False
+    for c in head:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif c == "\\":
+                escaped = True
+            elif c == '"':
+                in_string = False
+        elif c == '"':
+            in_string = True
+        elif c == "{":
+            depth += 1
+        elif c == "}":
+            depth -= 1
+    header = json.loads(head.rstrip().rstrip(",")+"}"*depth)
+    flat: Dict = {}
+    while isinstance(header, dict):
+        nested = None
+        for key, value in header.items():
+            if isinstance(value, dict):
+                nested = value
+            else:
+                flat[key] = value
+        header = nested
+    return flat
+
+
+class ItemStream:
+    """
+    The records of one search response, read from `chunks` of bytes (e.g.
+    `response.iter_content(65536)`).  The scalar values before the records,
+    such as `hits`, are read on creation and kept in `header`.
+
+    The records can be iterated over once.  len() is the number of records
+    read so far.  `close` is called when the iteration ends or is abandoned.
+
+    array     - name of the array holding the records: "items" for umm_json,
+                "entry" for Atom
+    transform - function applied to every record, e.g. umm.project
+    """
+
+    def __init__(self, chunks: Iterable[bytes], array: str = "items",
+                 transform: Optional[Callable[[Dict], Dict]] = None,
+                 close: Optional[Callable[[], None]] = None):
+        self._chunks = iter(chunks)
+        self.array = array
+        self._array = re.compile(r'"'+re.escape(array)+r'"\s*:\s*\[')
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._pos = 0
+        self._count = 0
+        self._close = close
+        self.transform = transform
+        self.header = self._read_header()
+
+    @property
+    def hits(self) -> Optional[int]:
+        return self.header.get("hits")
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _more(self) -> bool:
+        """
+        Append the next chunk to the unparsed text; False at the end of the response.
+        """
+        chunk = next(self._chunks, None)
+        text = self._text.decode(chunk or b"", final=chunk is None)
+        self._buffer = self._buffer[self._pos:]+text
+        self._pos = 0
+        return chunk is not None or bool(text)
+
+    def _read_header(self) -> Dict:
+        while True:
+            match = self._array.search(self._buffer)
+            if match:
+                break
+            if not self._more():
+                self.close()
+                raise ValueError("no "+self.array+" array in the search response")
+        self._pos = match.end()
+        return _close_object(self._buffer[:match.start()])
+
+    def _read_trailer(self) -> None:
+        # Read to the end so the connection can be reused
+        while self._more():
+            self._pos = len(self._buffer)
+
+    def __iter__(self) -> Iterator[Dict]:
+        try:
+            while True:
+                self._pos = _SEPARATOR.match(self._buffer, self._pos).end()
+                if self._pos == len(self._buffer):
+                    if not self._more():
+                        raise ValueError("search response ends inside the items array")
+                    continue
+                if self._buffer[self._pos] == "]":
+                    self._pos += 1
+                    self._read_trailer()
+                    return
+                try:
+                    item, self._pos = self._decoder.raw_decode(self._buffer, self._pos)
+                except json.JSONDecodeError:
+                    # The record continues in the next chunk
+                    if not self._more():
+                        raise
+                    continue
+                self._count += 1
+                yield item if self.transform is None else self.transform(item)
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        if self._close is not None:
+            self._close()
+            self._close = None
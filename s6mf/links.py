@@ -0,0 +1,71 @@
+"""
+Selection of the files to download from granule records.
+
+Each UMM-G record lists its files in `RelatedUrls`.  The scripts keep the
+"GET DATA" links (except OPeNDAP) and the "EXTENDED METADATA" links whose name
+ends in one of the wanted extensions.  LinkSelector applies those rules in one
+pass over `RelatedUrls`, with the extensions lower-cased once up front, and
+plan() turns a stream of records into the de-duplicated list of downloads.
+
+Whole granules can be left out by CMR itself: granule_name_params() gives the
+search parameters for `readable_granule_name` wildcard patterns, see
+https://cmr.earthdata.nasa.gov/search/site/docs/search/api.html#g-granule-ur-or-producer-granule-id
+"""
+
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Sequence
+
+DATA = "GET DATA"
+METADATA = "EXTENDED METADATA"
+OPENDAP = "OPENDAP DATA"
+
+
+class LinkSelector:
+    """
+    Pick the download links out of granule records.
+
+    extensions       - file name endings to keep, case-insensitive; empty keeps every file
+    types            - RelatedUrls types to keep
+    exclude_subtypes - RelatedUrls subtypes to drop, OPeNDAP by default
+    """
+
+    def __init__(self, extensions: Sequence[str] = (), types: Sequence[str] = (DATA, METADATA),
+                 exclude_subtypes: Sequence[str] = (OPENDAP,)):
+        self.extensions = tuple(e.lower() for e in extensions)
+        self.types = frozenset(types)
+        self.exclude_subtypes = frozenset(exclude_subtypes)
+
+    def links(self, item: Dict) -> List[str]:
+        """
+        The links of one granule record that pass the rules, in record order.
+        """
+        types, exclude, extensions = self.types, self.exclude_subtypes, self.extensions
+        return [u['URL'] for u in item['umm'].get('RelatedUrls', ())
+                if u.get('Type') in types and u.get('Subtype') not in exclude
+                and (not extensions or u['URL'].lower().endswith(extensions))]
+
+    def plan(self, items: Iterable[Dict]) -> "OrderedDict[str, Dict]":
+        """
+        url -> granule record for every selected link of `items`.  A link listed
+        more than once (by one record or several) is kept the first time.
+        """
+        plan: "OrderedDict[str, Dict]" = OrderedDict()
+        for item in items:
+            for url in self.links(item):
+                if url not in plan:
+                    plan[url] = item
+        return plan
+
+
+def granule_name_params(patterns: Sequence[str]) -> Dict:
+    """
+    CMR search parameters that only match granules whose name (granule UR or
+    producer granule id) matches one of `patterns`, where `*` and `?` are
+    wildcards, e.g. ["*_NR_*_F08"].
+    """
+    if not patterns:
+        return {}
+    return {
+        'readable_granule_name[]': list(patterns),
+        'options[readable_granule_name][pattern]': "true",
+    }
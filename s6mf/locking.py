@@ -0,0 +1,156 @@
+"""
+Advisory file locks shared between processes on one host, and leases shared
+between processes on any host that sees the same file system.
+"""
+
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from typing import Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class LeaseError(Exception):
+    """
+    A lease is held by someone else, or was lost to them.
+    """
+
+
+class FileLock:
+    """
+    Exclusive lock on `path`, held while the context is entered.  The lock file
+    is created if needed and left in place afterwards.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd = None
+
+    def __enter__(self):
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        if fcntl:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        else:
+            msvcrt.locking(self._fd, msvcrt.LK_LOCK, 1)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        else:
+            os.lseek(self._fd, 0, os.SEEK_SET)
+            msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+        os.close(self._fd)
+        self._fd = None
+
+
+class Lease:
+    """
+    Exclusive use of whatever `path` stands for (e.g. a data directory), for
+    one process at a time.
+
+    flock() does not reach across hosts on every network file system, so the
+    lease is a small JSON file naming its holder and when the lease runs out.
+    It is changed under a FileLock and replaced atomically.  The holder renews
+    it every `ttl`/3 seconds from a background thread; a holder that dies or
+    hangs loses it `ttl` seconds later and the next process can take it over.
+    Expiry is compared in wall-clock time, so hosts sharing a lease need
+    clocks that agree to well within `ttl`.
+    """
+
+    def __init__(self, path: str, ttl: float = 300):
+        self.path = path
+        self.ttl = ttl
+        self.owner = "{}:{}:{}".format(socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _load(self) -> Dict:
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _save(self, holder: Dict) -> None:
+        tmp = "{}.{}.tmp".format(self.path, os.getpid())
+        with open(tmp, "w") as f:
+            json.dump(holder, f)
+        os.replace(tmp, self.path)
+
+    def _claim(self, renew: bool = False) -> Optional[Dict]:
+        """
+        Take or renew the lease; returns the holder instead if it is someone
+        else's.
+        """
+        with FileLock(self.path+".lock"):
+            holder = self._load()
+            mine = holder.get("owner") == self.owner
+            if not mine and (renew or holder.get("expires", 0) > time.time()):
+                return holder
+            self._save({"owner": self.owner, "expires": time.time()+self.ttl,
+                        "acquired": holder["acquired"] if mine else time.time()})
+        return None
+
+    def acquire(self, wait: float = 0) -> "Lease":
+        """
+        Take the lease, waiting up to `wait` seconds for the holder to let go.
+        Raises LeaseError if it does not.
+        """
+        deadline = time.monotonic()+wait
+        while True:
+            holder = self._claim()
+            if holder is None:
+                break
+            if time.monotonic() >= deadline:
+                raise LeaseError("{} is held by {} until {}".format(
+                    self.path, holder.get("owner"), time.strftime("%Y-%m-%dT%H:%M:%SZ",
+                                                                 time.gmtime(holder.get("expires", 0)))))
+            time.sleep(min(5.0, max(0.0, deadline-time.monotonic())))
+        self.lost = False
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._renew, name="lease", daemon=True)
+        self._thread.start()
+        return self
+
+    def _renew(self) -> None:
+        while not self._stop.wait(self.ttl/3):
+            try:
+                self.lost = self._claim(renew=True) is not None
+            except OSError:
+                continue
+            if self.lost:
+                return
+
+    def check(self) -> None:
+        """
+        Raise LeaseError if the lease was taken over since it was acquired,
+        e.g. before writing something only the holder may write.
+        """
+        if self.lost or self._load().get("owner") != self.owner:
+            self.lost = True
+            raise LeaseError(self.path+" was taken over by "+str(self._load().get("owner")))
+
+    def release(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with FileLock(self.path+".lock"):
+            if self._load().get("owner") == self.owner:
+                os.remove(self.path)
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *exc):
+        self.release()
@@ -0,0 +1,225 @@
+"""
+Local manifest of downloaded granule files.
+
+The manifest is a SQLite database in the data directory with one row per
+downloaded file, keyed by its URL; every shard of a directory (s6mf.shard)
+has its own.  Before a file is downloaded the scripts
+look it up by primary key: files that are already on disk with the same CMR
+revision are skipped, so a rerun after a partial failure only fetches what is
+new or revised.  The manifest also answers "what do I have for cycle X"
+without a CMR search:
+
+    python3 -m s6mf.manifest /path/to/data --cycle 12
+"""
+
+import argparse
+import glob
+import os
+import re
+import sqlite3
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from . import umm
+from .shard import Shard
+
+MANIFEST_NAME = ".manifest{}.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS granules (
+    url                TEXT PRIMARY KEY,
+    concept_id         TEXT,
+    granule_ur         TEXT,
+    revision_date      TEXT,
+    path               TEXT NOT NULL,
+    size               INTEGER,
+    checksum           TEXT,
+    checksum_algorithm TEXT,
+    cycle              INTEGER,
+    pass               INTEGER,
+    downloaded_at      TEXT,
+    -- Search result format revision_date comes from, see umm.revision()
+    revision_format    TEXT
+);
+CREATE INDEX IF NOT EXISTS granules_concept_id ON granules (concept_id);
+CREATE INDEX IF NOT EXISTS granules_cycle_pass ON granules (cycle, pass);
+"""
+
+
+def revised(row: sqlite3.Row, item: Dict) -> bool:
+    """
+    True if the granule record `item` is a later revision than the one the
+    manifest `row` was downloaded from.  A revision time from the other search
+    result format says nothing either way, so it does not count as one.
+    """
+    revision_format, revision_date = umm.revision(item)
+    if (row["revision_format"] or "umm_json") != revision_format:
+        return False
+    return row["revision_date"] != revision_date
+
+
+class Manifest:
+    """
+    Open (or create) the manifest of `shard` of the data directory `data`.
+    """
+
+    def __init__(self, data: str, shard: Shard = Shard()):
+        self.path = os.path.join(data, MANIFEST_NAME.format(shard.suffix))
+        unsharded = os.path.join(data, MANIFEST_NAME.format(""))
+        split = shard.count > 1 and not os.path.exists(self.path) and os.path.exists(unsharded)
+        self.db = sqlite3.connect(self.path, timeout=60)
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript(SCHEMA)
+        if "revision_format" not in self._columns():
+            # Manifests from before search formats could be mixed hold UMM-G revision dates
+            try:
+                with self.db:
+                    self.db.execute("ALTER TABLE granules ADD COLUMN revision_format TEXT")
+            except sqlite3.OperationalError:
+                # Another process added it first
+                pass
+        if split:
+            self._take_over(unsharded, shard)
+
+    def _take_over(self, unsharded: str, shard: Shard) -> None:
+        """
+        Copy the rows of the granules of `shard` from the manifest of the
+        directory before it was split.
+        """
+        columns = self._columns()
+        with Manifest(os.path.dirname(unsharded)) as before:
+            rows = [tuple(row[k] for k in columns) for row in before.db.execute("SELECT * FROM granules")
+                    if shard.owns_key(row["concept_id"] or row["granule_ur"] or "")]
+        self.add_rows(rows)
+
+    def _columns(self) -> List[str]:
+        return [row["name"] for row in self.db.execute("PRAGMA table_info(granules)")]
+
+    def close(self) -> None:
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def get(self, url: str) -> Optional[sqlite3.Row]:
+        return self.db.execute("SELECT * FROM granules WHERE url = ?", (url,)).fetchone()
+
+    def is_new(self, item: Dict, url: str) -> bool:
+        """
+        True if the file behind `url` of the granule record `item` still has to
+        be downloaded: it is not in the manifest, its CMR revision changed, or the
+        local copy has gone missing.
+        """
+        row = self.get(url)
+        return row is None or revised(row, item) or not os.path.exists(row["path"])
+
+    def row(self, item: Dict, url: str, path: str, size: Optional[int] = None) -> tuple:
+        info = umm.file_info(item, url)
+        cycle, passes = umm.track(item)
+        revision_format, revision_date = umm.revision(item)
+        return (url, umm.concept_id(item), umm.granule_ur(item), revision_date, path,
+                size if size is not None else info.size, info.checksum, info.algorithm,
+                cycle, passes[0] if passes else None,
+                datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"), revision_format)
+
+    def add(self, item: Dict, url: str, path: str, size: Optional[int] = None) -> None:
+        """
+        Record a completed download of `url` from granule record `item` to `path`.
+        """
+        self.add_rows([self.row(item, url, path, size)])
+
+    def add_rows(self, rows: List[tuple]) -> None:
+        with self.db:
+            self.db.executemany("INSERT OR REPLACE INTO granules VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def cycle(self, cycle: int, passes: Optional[List[int]] = None) -> List[sqlite3.Row]:
+        """
+        All files of a cycle, optionally restricted to some passes.
+        """
+        sql = "SELECT * FROM granules WHERE cycle = ?"
+        args = [cycle]
+        if passes:
+            sql += " AND pass IN ({})".format(",".join("?" * len(passes)))
+            args += passes
+        return self.db.execute(sql+" ORDER BY pass, url", args).fetchall()
+
+
+class NewFiles:
+    """
+    Pick the files to download out of a stream of granule records: every
+    link that `links` (a LinkSelector, or a Collection) selects from the
+    records of `shard`, once, unless `manifest` has it already.  Without a
+    manifest every file is picked.
+
+    pending  - url -> granule record of the files picked; a link in it is not
+               picked again, so callers take out the files that are done if a
+               later record listing them should count
+    skipped  - files left out because they are downloaded already
+    """
+
+    def __init__(self, links, manifest: Optional[Manifest] = None, shard: Shard = Shard(),
+                 pending: Optional[Dict[str, Dict]] = None):
+        self.links = links
+        self.manifest = manifest
+        self.shard = shard
+        self.pending = {} if pending is None else pending
+        self.skipped = 0
+
+    def __call__(self, items: Iterable[Dict]) -> Iterator[Tuple[str, Dict]]:
+        """
+        (url, granule record) of every file picked from `items`, as they arrive.
+        """
+        for item in items:
+            if not self.shard.owns(item):
+                continue
+            for url in self.links.links(item):
+                if url in self.pending:
+                    continue
+                if self.manifest is not None and not self.manifest.is_new(item, url):
+                    self.skipped += 1
+                    continue
+                self.pending[url] = item
+                yield url, item
+
+
+def shards(data: str) -> List[Shard]:
+    """
+    The shards of the data directory `data` that have a manifest, the whole
+    directory (Shard()) among them if it has one or none has.
+    """
+    found = []
+    for path in glob.glob(os.path.join(glob.escape(data), MANIFEST_NAME.format("*"))):
+        match = re.search(r"(?:-(\d+)-of-(\d+))?\.sqlite$", os.path.basename(path))
+        if match.group(1):
+            found.append(Shard(int(match.group(1)), int(match.group(2))))
+        elif os.path.basename(path) == MANIFEST_NAME.format(""):
+            found.append(Shard())
+    return sorted(found, key=lambda s: (s.count, s.index)) or [Shard()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List the granule files recorded in a data directory")
+    parser.add_argument("data", help="data directory of the download scripts")
+    parser.add_argument("--cycle", type=int, required=True)
+    parser.add_argument("--pass", dest="passes", type=int, nargs="*")
+    args = parser.parse_args()
+    if not os.path.isdir(args.data):
+        parser.error("no such directory: "+args.data)
+
+    # A file can be in the manifest of the directory and, once it was split,
+    # in that of its shard as well
+    found = {}
+    for shard in shards(args.data):
+        with Manifest(args.data, shard) as manifest:
+            found.update((row["url"], row) for row in manifest.cycle(args.cycle, args.passes))
+    rows = sorted(found.values(), key=lambda row: (row["pass"] is not None, row["pass"], row["url"]))
+    for row in rows:
+        print("{}\t{}\t{}\t{}".format(row["cycle"], row["pass"], row["size"], row["path"]))
+    print(str(len(rows))+" files for Cycle:"+str(args.cycle))
+
+
+if __name__ == "__main__":
+    main()
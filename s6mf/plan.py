@@ -0,0 +1,217 @@
+"""
+Download plans: what a run would fetch, before it fetches anything.
+
+Plan.build() pages through a search and selects the links the way the
+scripts do, then looks every file up in the manifest and on disk: `new`
+files are not there yet (or only as a `.part` file, `partial`), `revised`
+ones changed in CMR since they were downloaded, `missing` ones are in the
+manifest but gone from disk, and `present` ones need nothing.  The sizes come
+from the UMM-G records, so the plan says how many bytes a run will transfer,
+by file extension and link type, and how long that takes at the throughput
+measured in earlier runs (s6mf.telemetry.measured_rate).
+
+A plan is saved as JSON with the granule records of its files, so a later
+run can download exactly the files of the plan without searching again, and
+verify them against the same sizes and checksums.
+
+    python3 -m s6mf.plan plan.json --telemetry telemetry.jsonl
+"""
+
+import argparse
+import json
+import os
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from os.path import basename, splitext
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from . import umm
+from .links import LinkSelector
+from .manifest import Manifest, NewFiles, revised
+from .shard import Shard
+
+PLAN_VERSION = 1
+NEW, PARTIAL, REVISED, MISSING, PRESENT = "new", "partial", "revised", "missing", "present"
+
+
+@dataclass
+class PlannedFile:
+    url: str
+    path: str
+    granule: str
+    type: str
+    status: str
+    size: Optional[int] = None
+    # Bytes already on disk in a partial file, resumed rather than fetched again
+    have: int = 0
+
+    @property
+    def extension(self) -> str:
+        name = basename(self.url).lower()
+        stem, ext = splitext(name)
+        return splitext(stem)[1]+ext if ext == ".bin" else ext
+
+    @property
+    def transfer(self) -> Optional[int]:
+        """
+        Bytes left to download, None if the size is not known.
+        """
+        if self.status == PRESENT:
+            return 0
+        return None if self.size is None else max(0, self.size-self.have)
+
+
+def _status(manifest: Optional[Manifest], item: Dict, url: str, path: str) -> Tuple[str, int]:
+    # Not at the top, so showing a saved plan does not load requests
+    from .download import PART_SUFFIX
+
+    row = manifest.get(url) if manifest is not None else None
+    if row is not None:
+        if revised(row, item):
+            return REVISED, 0
+        return (PRESENT, 0) if os.path.exists(row["path"]) else (MISSING, 0)
+    if os.path.exists(path+PART_SUFFIX):
+        return PARTIAL, os.path.getsize(path+PART_SUFFIX)
+    return NEW, 0
+
+
+class Plan:
+    """
+    The files of a run and the granule records they come from.  `meta` holds
+    what the run needs to carry on where the plan leaves off, e.g. the search
+    URL and the checkpoint timestamp.
+    """
+
+    def __init__(self, files: List[PlannedFile], granules: Dict[str, Dict], meta: Optional[Dict] = None):
+        self.files = files
+        self.granules = granules
+        self.meta = meta or {}
+        self._by_url = {f.url: f for f in files}
+
+    @classmethod
+    def build(cls, items: Iterable[Dict], links: LinkSelector, data: str, manifest: Optional[Manifest] = None,
+              shard: Shard = Shard(), **meta) -> "Plan":
+        """
+        Plan the downloads of the granule records `items` into the directory
+        `data`, comparing them with `manifest` and the files on disk.
+        """
+        files: List[PlannedFile] = []
+        granules: Dict[str, Dict] = OrderedDict()
+        # Files already downloaded are planned too, as present
+        for url, item in NewFiles(links, shard=shard)(items):
+            key = umm.concept_id(item) or umm.granule_ur(item)
+            kind = next(("metadata" if u.get("Type") == "EXTENDED METADATA" else "data"
+                         for u in item["umm"].get("RelatedUrls", ()) if u["URL"] == url), "data")
+            path = os.path.join(data, basename(url))
+            status, have = _status(manifest, item, url, path)
+            files.append(PlannedFile(url, path, key, kind, status, umm.file_info(item, url).size, have))
+            granules[key] = item
+        return cls(files, granules, meta)
+
+    def item(self, url: str) -> Dict:
+        """
+        The granule record of a file of the plan.
+        """
+        return self.granules[self._by_url[url].granule]
+
+    def pending(self) -> List[PlannedFile]:
+        return [f for f in self.files if f.status != PRESENT]
+
+    def jobs(self, manifest: Optional[Manifest] = None) -> Iterator[Tuple[str, str, umm.ArchiveInfo]]:
+        """
+        (url, path, expected) of every file still to download, as
+        DownloadEngine.run() takes them.  Files that `manifest` has had since
+        the plan was made, e.g. from an interrupted run of it, are left out.
+        """
+        for f in self.pending():
+            item = self.item(f.url)
+            if manifest is None or manifest.is_new(item, f.url):
+                yield f.url, f.path, umm.file_info(item, f.url)
+
+    def summary(self) -> Dict[str, Dict[str, int]]:
+        """
+        Files and bytes in all, and to download, per "type extension" and in
+        `total`.  Bytes of files without a listed size are left out and the
+        files counted in `unsized`.
+        """
+        summary: Dict[str, Dict[str, int]] = OrderedDict()
+        for f in sorted(self.files, key=lambda f: (f.type, f.extension)):
+            for key in (f.type+" "+(f.extension or "(none)"), "total"):
+                s = summary.setdefault(key, dict(files=0, bytes=0, download_files=0, download_bytes=0, unsized=0))
+                s["files"] += 1
+                s["bytes"] += f.size or 0
+                s["unsized"] += f.size is None
+                if f.status != PRESENT:
+                    s["download_files"] += 1
+                    s["download_bytes"] += f.transfer or 0
+        summary.setdefault("total", dict(files=0, bytes=0, download_files=0, download_bytes=0, unsized=0))
+        summary.move_to_end("total")
+        return summary
+
+    def describe(self, rate: Optional[float] = None) -> str:
+        """
+        A table of the summary and, at `rate` bytes/s, the transfer time.
+        """
+        lines = ["{:<20} {:>8} {:>12} {:>12} {:>12}".format("", "files", "MB", "to download", "MB")]
+        for key, s in self.summary().items():
+            lines.append("{:<20} {:>8} {:>12.1f} {:>12} {:>12.1f}".format(
+                key, s["files"], s["bytes"]/1e6, s["download_files"], s["download_bytes"]/1e6))
+        counts = OrderedDict((status, 0) for status in (NEW, PARTIAL, REVISED, MISSING, PRESENT))
+        for f in self.files:
+            counts[f.status] += 1
+        lines.append(", ".join("{} {}".format(n, status) for status, n in counts.items() if n))
+        total = self.summary()["total"]
+        if total["unsized"]:
+            lines.append("{} files list no size in their granule record and are not counted".format(total["unsized"]))
+        if rate:
+            seconds = total["download_bytes"]/rate
+            lines.append("about {} at {:.2f} MB/s".format(_duration(seconds), rate/1e6))
+        else:
+            lines.append("no measured throughput to estimate the transfer time from")
+        return "\n".join(lines)
+
+    def save(self, path: str) -> None:
+        """
+        Write the plan to `path` atomically, readable by the owner only.
+        """
+        plan = {"version": PLAN_VERSION, "meta": self.meta, "summary": self.summary(),
+                "files": [asdict(f) for f in self.files], "granules": self.granules}
+        tmp = path+".tmp"
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump(plan, f, indent=1)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "Plan":
+        with open(path) as f:
+            plan = json.load(f)
+        if plan.get("version") != PLAN_VERSION:
+            raise ValueError("{}: plan version {}, expected {}".format(path, plan.get("version"), PLAN_VERSION))
+        return cls([PlannedFile(**f) for f in plan["files"]], plan["granules"], plan["meta"])
+
+
+def _duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return "{}h {:02d}m".format(hours, minutes) if hours else "{}m {:02d}s".format(minutes, seconds)
+
+
+def main():
+    from .telemetry import measured_rate
+
+    parser = argparse.ArgumentParser(description="Show what a saved download plan would transfer")
+    parser.add_argument("plan", help="plan file written by a run with plan_only = True")
+    parser.add_argument("--telemetry", help="JSON lines telemetry of earlier runs, for their throughput")
+    parser.add_argument("--rate", type=float, help="throughput in MB/s instead of the measured one")
+    args = parser.parse_args()
+
+    plan = Plan.load(args.plan)
+    for key, value in plan.meta.items():
+        print("{}: {}".format(key, value))
+    rate = args.rate*1e6 if args.rate else (measured_rate(args.telemetry) if args.telemetry else None)
+    print(plan.describe(rate))
+
+
+if __name__ == "__main__":
+    main()
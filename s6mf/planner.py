@@ -0,0 +1,147 @@
+"""
+Query planner for searches over many cycles and passes.
+
+CMR's `cycle[]`/`passes[n][pass]` parameters take one cycle per query but any
+number of passes, see https://cmr.earthdata.nasa.gov/search/site/docs/search/api.html#g-passes
+The planner turns cycle ranges and pass lists into one query per cycle and
+batch of passes, runs the queries concurrently under a request rate limit and
+merges the results into a single list of granules without duplicates.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from . import umm
+from .search import GranuleSearch
+from .session import Session
+
+# Passes per cycle of the Jason/Sentinel-6 reference orbit.  Odd passes are
+# ascending, even passes descending.
+PASSES_PER_CYCLE = 254
+
+
+def parse_numbers(spec) -> List[int]:
+    """
+    "1-60,62,65-70" -> [1, 2, ..., 60, 62, 65, ..., 70].  Ints and lists of ints
+    are accepted as they are; an empty spec or None gives an empty list.
+    """
+    if not spec:
+        return []
+    if isinstance(spec, int):
+        return [spec]
+    if not isinstance(spec, str):
+        return sorted(set(spec))
+    numbers = set()
+    for part in spec.replace(" ", "").split(","):
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        numbers.update(range(int(first), int(last or first)+1))
+    return sorted(numbers)
+
+
+def select_passes(passes: Iterable[int], direction: Optional[str] = None) -> List[int]:
+    """
+    Keep only the "ascending" (odd) or "descending" (even) passes.  Without
+    `passes`, start from every pass of a cycle.
+    """
+    passes = list(passes) or (list(range(1, PASSES_PER_CYCLE+1)) if direction else [])
+    if direction == "ascending":
+        return [p for p in passes if p % 2 == 1]
+    if direction == "descending":
+        return [p for p in passes if p % 2 == 0]
+    if direction:
+        raise ValueError("direction must be 'ascending' or 'descending', not "+repr(direction))
+    return passes
+
+
+class RateLimiter:
+    """
+    Allow at most `rate` calls of wait() per second, across threads.
+    """
+
+    def __init__(self, rate: float):
+        self.interval = 1.0/rate if rate else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next-now
+            self._next = max(now, self._next)+self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+class CyclePassPlanner:
+    """
+    Plan and run the granule searches for `cycles` x `passes`.
+
+    url              - search endpoint, e.g. https://cmr.earthdata.nasa.gov/search/granules.umm_json
+    params           - common query parameters (ShortName, token, ...)
+    cycles, passes   - lists of numbers or range specs such as "1-60"; no passes
+                       means whole cycles
+    direction        - "ascending" or "descending" to keep only those passes
+    passes_per_query - passes batched into one `passes[n][pass]` query
+    concurrency      - queries in flight at once
+    rate             - maximum search requests per second (0 = unlimited)
+    token            - optional s6mf.tokens.TokenCache for the searches
+    stream           - parse the search responses incrementally, keeping only the
+                       fields the scripts use (see GranuleSearch)
+    """
+
+    def __init__(self, url: str, params: Dict, cycles, passes=(), direction: Optional[str] = None,
+                 passes_per_query: int = 20, concurrency: int = 4, rate: float = 5.0,
+                 page_size: int = 2000, session: Optional[Session] = None, token=None,
+                 stream: bool = False):
+        self.url = url
+        self.params = params
+        self.cycles = parse_numbers(cycles)
+        self.passes = select_passes(parse_numbers(passes), direction)
+        self.passes_per_query = max(1, passes_per_query)
+        self.concurrency = max(1, concurrency)
+        self.limiter = RateLimiter(rate)
+        self.page_size = page_size
+        self.session = session or Session()
+        self.token = token
+        self.stream = stream
+        self.duplicates = 0
+
+    def queries(self) -> List[Dict]:
+        """
+        The query parameters of every search, one cycle and pass batch each.
+        """
+        queries = []
+        for cycle in self.cycles:
+            if not self.passes:
+                queries.append(dict(self.params, **{"cycle[]": cycle}))
+            for i in range(0, len(self.passes), self.passes_per_query):
+                query = dict(self.params, **{"cycle[]": cycle})
+                for n, p in enumerate(self.passes[i:i+self.passes_per_query]):
+                    query["passes[{}][pass]".format(n)] = p
+                queries.append(query)
+        return queries
+
+    def _search(self, params: Dict) -> List[Dict]:
+        return list(GranuleSearch(self.url, params, self.page_size, session=self.session,
+                                  rate_limit=self.limiter, token=self.token, stream=self.stream))
+
+    def granules(self) -> Iterator[Dict]:
+        """
+        Run the searches and yield each granule record once, as the searches
+        complete.  Records already seen (by concept-id) are counted in
+        `duplicates` and skipped.
+        """
+        seen = set()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            for future in as_completed([pool.submit(self._search, q) for q in self.queries()]):
+                for item in future.result():
+                    key = umm.concept_id(item) or umm.granule_ur(item)
+                    if key in seen:
+                        self.duplicates += 1
+                        continue
+                    seen.add(key)
+                    yield item
@@ -0,0 +1,253 @@
+"""
+Backoff, circuit breakers and adaptive concurrency for CMR and the archive.
+
+Under load PO.DAAC answers with 429 Too Many Requests or 503 Service
+Unavailable, often with a Retry-After header.  Retrying at once, or with every
+worker at the same moment, only prolongs the throttling, so:
+
+- Backoff spaces retries out exponentially with random jitter and waits as
+  long as Retry-After asks.
+- CircuitBreaker stops sending requests to a host that keeps failing (5xx or
+  no connection) and lets a single trial request through after a pause.
+- AdaptiveLimit caps the requests in flight against a host.  It halves the cap
+  when the host pushes back and raises it by one per cap's worth of successes
+  (AIMD, as TCP does), so concurrency settles at what the host sustains.
+
+HostHealth keeps one breaker and one limit per host.  A Session carries one
+(`session.health`) so searches and downloads through it share them.
+"""
+
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+# Responses worth retrying, and those that mean "slow down"
+RETRY_STATUS = frozenset((429, 500, 502, 503, 504))
+PUSHBACK_STATUS = frozenset((429, 503))
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of sending a request to a host whose circuit is open.
+    """
+
+
+def retry_after(response) -> Optional[float]:
+    """
+    Seconds to wait according to the Retry-After header of `response`, which
+    is either a number of seconds or an HTTP date; None without one.
+    """
+    value = response.headers.get("Retry-After") if response is not None else None
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when-datetime.now(timezone.utc)).total_seconds())
+
+
+class Backoff:
+    """
+    Delays between retries: a random time up to `base` * 2**attempt seconds
+    ("full jitter"), at most `cap`.  A Retry-After from the server replaces
+    the exponential delay, plus up to 10% jitter, but is never waited longer
+    than `max_retry_after`.
+    """
+
+    def __init__(self, base: float = 1.0, cap: float = 60.0, max_retry_after: float = 300.0):
+        self.base = base
+        self.cap = cap
+        self.max_retry_after = max_retry_after
+
+    def delay(self, attempt: int, after: Optional[float] = None) -> float:
+        if after is not None:
+            after = min(after, self.max_retry_after)
+            return after+random.uniform(0, after*0.1)
+        return random.uniform(0, min(self.cap, self.base * 2 ** attempt))
+
+    def sleep(self, attempt: int, response=None) -> None:
+        time.sleep(self.delay(attempt, retry_after(response)))
+
+
+class CircuitBreaker:
+    """
+    Open after `threshold` failures in a row and refuse requests for
+    `reset_after` seconds.  Then one trial request is let through: if it
+    succeeds the circuit closes, if not it stays open twice as long (at most
+    `max_reset` seconds).  A trial whose outcome is never recorded, e.g.
+    because it ended in an exception other than a connection error, is given
+    up after the same pause and another one is let through.
+    """
+
+    def __init__(self, threshold: int = 5, reset_after: float = 30.0, max_reset: float = 600.0):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.max_reset = max_reset
+        self.failures = 0
+        self.opened = 0
+        self._open_for = reset_after
+        self._open_until = 0.0
+        # When the pending trial request was let through, 0 without one
+        self._trial = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self.failures < self.threshold:
+                return "closed"
+            return "open" if time.monotonic() < self._open_until else "half-open"
+
+    def allow(self) -> bool:
+        """
+        True if a request may be sent now; in the half-open state only the
+        first caller gets True.
+        """
+        with self._lock:
+            if self.failures < self.threshold:
+                return True
+            now = time.monotonic()
+            if now < self._open_until or (self._trial and now < self._trial+self._open_for):
+                return False
+            self._trial = now
+            return True
+
+    def wait(self, timeout: float) -> bool:
+        """
+        Wait up to `timeout` seconds until a request may be sent.
+        """
+        deadline = time.monotonic()+timeout
+        while not self.allow():
+            with self._lock:
+                until = max(self._open_until, self._trial+self._open_for) if self._trial else self._open_until
+                pause = max(until-time.monotonic(), 0.1)
+            if time.monotonic()+pause > deadline:
+                return False
+            time.sleep(pause)
+        return True
+
+    def success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self._trial = 0.0
+            self._open_for = self.reset_after
+
+    def failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self._trial:
+                # The trial request failed: back off for longer
+                self._trial = 0.0
+                self._open_for = min(self._open_for*2, self.max_reset)
+                self._open_until = time.monotonic()+self._open_for
+                self.opened += 1
+            elif self.failures == self.threshold:
+                self._open_until = time.monotonic()+self._open_for
+                self.opened += 1
+
+
+class AdaptiveLimit:
+    """
+    A semaphore whose size moves between `minimum` and `maximum`: halved by
+    pushback() (at most once per `cooldown` seconds, so one burst of refusals
+    counts once) and grown by 1/limit per success().  Use as a context
+    manager around each request or transfer.
+    """
+
+    def __init__(self, maximum: int, minimum: int = 1, cooldown: float = 1.0):
+        self.maximum = max(1, maximum)
+        self.minimum = max(1, min(minimum, self.maximum))
+        self.cooldown = cooldown
+        self.limit = float(self.maximum)
+        self.in_flight = 0
+        self.pushbacks = 0
+        self._last_decrease = float("-inf")
+        self._cond = threading.Condition()
+
+    def __enter__(self):
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+        return self
+
+    def __exit__(self, *exc):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify()
+
+    def pushback(self) -> None:
+        with self._cond:
+            self.pushbacks += 1
+            now = time.monotonic()
+            if now-self._last_decrease >= self.cooldown:
+                self._last_decrease = now
+                self.limit = max(float(self.minimum), self.limit/2)
+
+    def success(self) -> None:
+        with self._cond:
+            if self.limit < self.maximum:
+                before = int(self.limit)
+                self.limit = min(float(self.maximum), self.limit+1/self.limit)
+                if int(self.limit) > before:
+                    self._cond.notify()
+
+
+class HostHealth:
+    """
+    One CircuitBreaker and one AdaptiveLimit per host, created on first use.
+    With `adaptive` False the limits stay at their maximum.
+    """
+
+    def __init__(self, threshold: int = 5, reset_after: float = 30.0, adaptive: bool = True):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.adaptive = adaptive
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._limits: Dict[str, AdaptiveLimit] = {}
+        self._lock = threading.Lock()
+
+    def breaker(self, url: str) -> CircuitBreaker:
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._breakers:
+                self._breakers[host] = CircuitBreaker(self.threshold, self.reset_after)
+            return self._breakers[host]
+
+    def limit(self, url: str, maximum: int) -> AdaptiveLimit:
+        """
+        The concurrency limit of the host of `url`; `maximum` applies when it is created.
+        """
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._limits:
+                self._limits[host] = AdaptiveLimit(maximum, 1 if self.adaptive else maximum)
+            return self._limits[host]
+
+    def record(self, url: str, status: Optional[int]) -> None:
+        """
+        Feed the outcome of a request to the host's breaker and limit: an HTTP
+        status, or None when no response came back.  A 4xx is the client's
+        fault, not the host's, so it closes the breaker like any other answer.
+        """
+        breaker = self.breaker(url)
+        limit = self._limits.get(urlsplit(url).netloc)
+        if status is None or status >= 500:
+            breaker.failure()
+        else:
+            breaker.success()
+        if limit is not None:
+            if status in PUSHBACK_STATUS:
+                limit.pushback()
+            elif status is not None and status < 400:
+                limit.success()
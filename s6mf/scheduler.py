@@ -0,0 +1,66 @@
+"""
+Fair scheduling of downloads from several collections.
+
+When all collections feed one pool of download workers through a plain FIFO
+queue, a collection that lists thousands of files at once (a reprocessed L2
+collection, say) pushes the files of the small NRT collections to the back of
+the queue.  The queues here hand out files round-robin by collection instead:
+every collection with files waiting gets a worker in turn, however many files
+the others have queued.
+"""
+
+import asyncio
+from collections import OrderedDict, deque
+from typing import Any, Callable, Deque, Hashable
+
+
+class RoundRobin:
+    """
+    A queue of items kept in one FIFO per key, `key(item)` being the first
+    element of the item by default.  popleft() takes the oldest item of the key
+    whose turn it is; append() and popleft() match collections.deque, so it can
+    stand in for the deque of asyncio.Queue.
+    """
+
+    def __init__(self, key: Callable[[Any], Hashable] = lambda item: item[0]):
+        self.key = key
+        self._queues: "OrderedDict[Hashable, Deque]" = OrderedDict()
+        self._len = 0
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __bool__(self) -> bool:
+        return self._len > 0
+
+    def __iter__(self):
+        for items in self._queues.values():
+            yield from items
+
+    def append(self, item) -> None:
+        key = self.key(item)
+        if key not in self._queues:
+            self._queues[key] = deque()
+        self._queues[key].append(item)
+        self._len += 1
+
+    def popleft(self):
+        if not self._len:
+            raise IndexError("pop from an empty RoundRobin")
+        key, items = next(iter(self._queues.items()))
+        item = items.popleft()
+        # The key goes to the back of the rotation, or leaves it when drained
+        del self._queues[key]
+        if items:
+            self._queues[key] = items
+        self._len -= 1
+        return item
+
+
+class AsyncFairQueue(asyncio.Queue):
+    """
+    asyncio.Queue of (key, ...) tuples served round-robin by key.
+    """
+
+    def _init(self, maxsize: int) -> None:
+        self._queue = RoundRobin()
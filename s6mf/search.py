@@ -0,0 +1,192 @@
+"""
+CMR granule search that follows paging.
+
+CMR returns at most `page_size` granules per response.  The remaining pages are
+requested by sending back the `CMR-Search-After` header of the previous
+response, see https://cmr.earthdata.nasa.gov/search/site/docs/search/api.html#search-after
+
+Two result formats are understood, chosen by the endpoint: `granules.umm_json`
+(full UMM-G records) and the lighter Atom `granules.json`, whose entries are
+converted to UMM-G shaped records by umm.from_atom().  Atom results are
+smaller and faster to parse but carry no file sizes, checksums or track, so
+downloads from them are not verified and the manifest has no cycle/pass for
+them.  Either way only `fields` of each record are kept.
+"""
+
+from typing import Dict, Iterator, List, Optional
+from urllib.parse import urlencode, urlsplit
+
+from requests import RequestException
+
+from . import umm
+from .jsonstream import ItemStream
+from .resilience import RETRY_STATUS, Backoff, CircuitOpenError
+from .session import Session
+
+CMR = "cmr.earthdata.nasa.gov"
+SEARCH_AFTER = "CMR-Search-After"
+HITS = "CMR-Hits"
+# Bytes read at a time from a streamed search response
+STREAM_CHUNK = 64 * 1024
+
+
+def granule_search_url(cmr: str = CMR, search_format: str = "umm_json") -> str:
+    """
+    The granule search endpoint of the CMR host `cmr`, or of a base URL such
+    as http://localhost:8080, in `search_format` ("umm_json" or "json").
+    """
+    return _base_url(cmr)+"/search/granules."+search_format
+
+
+def token_url(cmr: str = CMR) -> str:
+    """
+    The token service of the CMR host `cmr`, or of a base URL such as
+    http://localhost:8080, for s6mf.tokens.
+    """
+    return _base_url(cmr)+"/legacy-services/rest/tokens"
+
+
+def _base_url(cmr: str) -> str:
+    return cmr if "://" in cmr else "https://"+cmr
+
+
+class GranuleSearch:
+    """
+    Iterate over the UMM records of a granule search, one page at a time.
+
+    Pages are only requested as the iteration reaches them, so whatever consumes
+    the records (for example the download engine) starts working on the first
+    page while the next one is still being fetched.
+
+    url        - search endpoint, e.g. https://cmr.earthdata.nasa.gov/search/granules.umm_json
+    params     - CMR query parameters; `scroll` is dropped because CMR does not allow
+                 it together with search-after
+    session    - s6mf.session.Session to search with
+    rate_limit - optional object whose wait() is called before every page request,
+                 e.g. s6mf.planner.RateLimiter
+    token      - optional s6mf.tokens.TokenCache; its token is sent with every
+                 request and refreshed once if CMR rejects it
+    stream     - parse each response as it arrives (s6mf.jsonstream) instead of
+                 loading it whole; pages are then ItemStreams that can be
+                 iterated once
+    fields     - parts of the records to keep, see umm.project(); None keeps
+                 whole records
+    retries    - times a page request is retried after a 429/5xx response or a
+                 connection error, with `backoff` (s6mf.resilience.Backoff)
+                 between the tries and honouring Retry-After
+    """
+
+    def __init__(self, url: str, params: Dict, page_size: int = 2000, timeout: float = 60,
+                 session: Optional[Session] = None, rate_limit=None, token=None,
+                 stream: bool = False, fields: Optional[Dict] = umm.GRANULE_FIELDS,
+                 retries: int = 5, backoff: Optional[Backoff] = None):
+        self.endpoint = url
+        self.format = "json" if urlsplit(url).path.endswith(".json") else "umm_json"
+        self.params = {k: v for k, v in params.items() if k != "scroll"}
+        self.params["page_size"] = page_size
+        self.token = token
+        self.page_size = page_size
+        self.timeout = timeout
+        self.session = session or Session()
+        self.rate_limit = rate_limit
+        self.stream = stream
+        self.fields = fields
+        self.retries = max(0, retries)
+        self.backoff = backoff or Backoff()
+        self.hits: Optional[int] = None
+        self.page_count = 0
+        self._first: Optional[List[Dict]] = None
+        self._search_after: Optional[str] = None
+
+    @property
+    def url(self) -> str:
+        params = self.params
+        if self.token is not None:
+            params = dict(params, token=self.token.get())
+        return self.endpoint+"?"+urlencode(params, doseq=True)
+
+    @property
+    def query_url(self) -> str:
+        """
+        The search URL without the token, to show or save.
+        """
+        return self.endpoint+"?"+urlencode(self.params, doseq=True)
+
+    def _get(self, headers: Dict[str, str]):
+        if self.rate_limit is not None:
+            self.rate_limit.wait()
+        return self.session.get(self.url, headers=headers, timeout=self.timeout, stream=self.stream)
+
+    def _request(self, headers: Dict[str, str]):
+        """
+        GET the page, retrying throttled or failed requests.
+        """
+        breaker = self.session.health.breaker(self.endpoint)
+        for attempt in range(self.retries+1):
+            if not breaker.wait(self.backoff.max_retry_after):
+                raise CircuitOpenError(urlsplit(self.endpoint).netloc+" keeps failing")
+            try:
+                response = self._get(headers)
+            except RequestException:
+                if attempt == self.retries:
+                    raise
+                self.backoff.sleep(attempt)
+                continue
+            if response.status_code not in RETRY_STATUS or attempt == self.retries:
+                return response
+            response.close()
+            self.backoff.sleep(attempt, response)
+
+    def _fetch(self, search_after: Optional[str]) -> List[Dict]:
+        headers = {SEARCH_AFTER: search_after} if search_after else {}
+        self.page_count += 1
+        with self.session.telemetry.timer("search_page", url=self.endpoint, page=self.page_count) as fields:
+            response = self._request(headers)
+            if response.status_code in (401, 403) and self.token is not None:
+                response.close()
+                self.token.refresh(self.token.get())
+                response = self._request(headers)
+            fields["status"] = response.status_code
+        response.raise_for_status()
+        self._search_after = response.headers.get(SEARCH_AFTER)
+        hits = response.headers.get(HITS)
+        if self.stream:
+            items = ItemStream(response.iter_content(STREAM_CHUNK), "entry" if self.format == "json" else "items",
+                               self._record, response.close)
+            self.hits = int(hits) if hits is not None else items.hits
+            return items
+        results = response.json()
+        records = results["feed"]["entry"] if self.format == "json" else results["items"]
+        self.hits = int(hits) if hits is not None else results.get("hits")
+        return [self._record(r) for r in records]
+
+    def _record(self, item: Dict) -> Dict:
+        if self.format == "json":
+            item = umm.from_atom(item)
+        return item if self.fields is None else umm.project(item, self.fields)
+
+    def total(self) -> int:
+        """
+        Number of granules matching the search; fetches the first page if needed.
+        """
+        if self.hits is None:
+            self._first = self._fetch(None)
+        return self.hits
+
+    def pages(self) -> Iterator[List[Dict]]:
+        items = self._first if self._first is not None else self._fetch(None)
+        self._first = None
+        seen = 0
+        while True:
+            yield items
+            # Counted once the page has been used: a streamed page is read then
+            seen += len(items)
+            if isinstance(items, ItemStream):
+                items.close()
+            if not (self._search_after and len(items) and (self.hits is None or seen < self.hits)):
+                return
+            items = self._fetch(self._search_after)
+
+    def __iter__(self) -> Iterator[Dict]:
+        for page in self.pages():
+            yield from page
@@ -0,0 +1,182 @@
+"""
+Pooled HTTP session shared by the token, search and data requests.
+
+One requests.Session keeps connections alive between requests and holds a
+single cookie jar, so the Earthdata Login redirect is only followed once:
+after the first download the data host recognises the session cookie and
+serves the following files directly, over connections that are already open.
+
+Every request is timed.  The time spent opening new connections (TCP and TLS
+setup, including the connections opened while following redirects) is
+attached to the response as `connect_time`/`new_connections` and summed up in
+`Session.stats`, together with `response_time`, the time until request()
+returned (for a streamed download: until the response headers arrived).
+"""
+
+import getpass
+import netrc
+import threading
+import time
+from typing import Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from .resilience import HostHealth
+from .telemetry import Telemetry
+
+EDL_HOST = "urs.earthdata.nasa.gov"
+
+_local = threading.local()
+
+
+class _TimedConnect:
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            _local.connect_time = getattr(_local, "connect_time", 0.0)+time.perf_counter()-start
+            _local.connections = getattr(_local, "connections", 0)+1
+
+
+class _TimedHTTPConnection(_TimedConnect, HTTPConnection):
+    pass
+
+
+class _TimedHTTPSConnection(_TimedConnect, HTTPSConnection):
+    pass
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class _TimedAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TimedHTTPConnectionPool,
+            "https": _TimedHTTPSConnectionPool,
+        }
+
+
+class ConnectionStats:
+    """
+    Totals over all requests of a session.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.connections = 0
+        self.connect_time = 0.0
+        self.response_time = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, connections: int, connect_time: float, response_time: float) -> None:
+        with self._lock:
+            self.requests += 1
+            self.connections += connections
+            self.connect_time += connect_time
+            self.response_time += response_time
+
+    def __str__(self):
+        return "{} requests over {} new connections, {:.2f} s spent opening connections".format(
+            self.requests, self.connections, self.connect_time)
+
+
+class Session(requests.Session):
+    """
+    requests.Session keeping up to `pool_size` open connections per host.  The
+    pool only caps how many idle connections are kept for reuse; connections are
+    opened as they are needed.
+
+    With `credentials` set, they are sent to `auth_host` when a request is
+    redirected there for login, and to no other host.
+
+    The outcome of every request is recorded in `health`
+    (s6mf.resilience.HostHealth), the circuit breakers and concurrency limits
+    of the hosts the session talks to, and requests that went through the
+    login redirects are timed as the `auth` phase of `telemetry`
+    (s6mf.telemetry.Telemetry), which the search and download code report to.
+    """
+
+    def __init__(self, pool_size: int = 32, auth_host: str = EDL_HOST,
+                 credentials: Optional[Tuple[str, str]] = None):
+        super().__init__()
+        adapter = _TimedAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.mount("http://", adapter)
+        self.mount("https://", adapter)
+        self.auth_host = auth_host
+        self.credentials = credentials
+        self.stats = ConnectionStats()
+        self.health = HostHealth()
+        self.telemetry = Telemetry()
+
+    def rebuild_auth(self, prepared_request, response):
+        super().rebuild_auth(prepared_request, response)
+        if self.credentials and urlsplit(prepared_request.url).hostname == self.auth_host:
+            prepared_request.prepare_auth(self.credentials)
+
+    def request(self, method, url, *args, **kwargs):
+        _local.connect_time = 0.0
+        _local.connections = 0
+        start = time.perf_counter()
+        try:
+            response = super().request(method, url, *args, **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            self.health.record(url, None)
+            raise
+        self.health.record(url, response.status_code)
+        response.response_time = time.perf_counter()-start
+        response.connect_time = _local.connect_time
+        response.new_connections = _local.connections
+        self.stats.add(response.new_connections, response.connect_time, response.response_time)
+        if any(urlsplit(r.url).hostname == self.auth_host for r in response.history):
+            self.telemetry.record("auth", response.response_time, url=url, status=response.status_code)
+        return response
+
+
+def setup_earthdata_login_auth(endpoint: str = EDL_HOST, pool_size: int = 32) -> Session:
+    """
+    Set up a pooled HTTP session that authenticates against the given Earthdata Login
+    endpoint and is able to track cookies between requests.  This looks in the .netrc file
+    first and if no credentials are found, it prompts for them.
+
+    The same session is used for the token, search and data requests, so connections
+    are kept open and the Earthdata Login cookies are reused for every granule.
+
+    Valid endpoints include:
+        urs.earthdata.nasa.gov - Earthdata Login production
+    """
+    try:
+        username, _, password = netrc.netrc().authenticators(endpoint)
+    except (FileNotFoundError, TypeError):
+        # FileNotFound = There's no .netrc file
+        # TypeError = The endpoint isn't in the netrc file, causing the above to try unpacking None
+        print("There's no .netrc file or the The endpoint isn't in the netrc file")
+        username = input("Earthdata Login username: ")
+        password = getpass.getpass("Earthdata Login password: ")
+
+    return Session(pool_size=pool_size, auth_host=endpoint, credentials=(username, password))
+
+
+def earthdata_session(endpoint: str = EDL_HOST, pool_size: int = 32) -> Session:
+    """
+    A Session logging in to `endpoint` with the credentials from the .netrc file.
+    Without them the session still works for data that needs no login; unlike
+    setup_earthdata_login_auth it never prompts, for use from daemons and cron.
+    """
+    try:
+        username, _, password = netrc.netrc().authenticators(endpoint)
+        credentials = (username, password)
+    except (FileNotFoundError, TypeError):
+        credentials = None
+    return Session(pool_size=pool_size, auth_host=endpoint, credentials=credentials)
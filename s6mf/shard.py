@@ -0,0 +1,72 @@
+"""
+Splitting one download plan over several processes or hosts.
+
+Every process runs the same search and keeps only the granules of its shard:
+shard `index` of `count` owns the granules whose ID hashes to `index` modulo
+`count`.  The hash is CRC-32 of the CMR concept-id (the GranuleUR if there is
+none), so every process and host agrees on the split without talking to the
+others, and a granule stays in the same shard when it is revised.
+
+Each shard keeps its own checkpoint, lease and manifest in the data
+directory (`.update-2-of-4`, `.lease-2-of-4`, `.manifest-2-of-4.sqlite`), so
+the shards of one directory never wait for each other and never write to the
+same SQLite file, which is not safe from several hosts.  A shard without a
+checkpoint of its own starts from the unsharded `.update`, and a new shard
+manifest takes over its granules' rows of the unsharded `.manifest.sqlite`,
+so a directory can be split without searching again from the beginning.
+
+The track index and the store (s6mf.trackindex, s6mf.store) are shared by
+the whole directory and only locked between processes on one host: with
+shards on several hosts, let one of them build them.
+"""
+
+import zlib
+from dataclasses import dataclass
+from typing import Dict
+
+from . import umm
+
+
+@dataclass(frozen=True)
+class Shard:
+    index: int = 0
+    count: int = 1
+
+    def __post_init__(self):
+        if self.count < 1 or not 0 <= self.index < self.count:
+            raise ValueError("no shard {} of {}".format(self.index, self.count))
+
+    @classmethod
+    def parse(cls, spec: str) -> "Shard":
+        """
+        The shard for "INDEX/COUNT", e.g. "0/4" for the first of four; an
+        empty string is the whole plan.
+        """
+        if not spec:
+            return cls()
+        index, _, count = spec.partition("/")
+        return cls(int(index), int(count))
+
+    @property
+    def suffix(self) -> str:
+        """
+        Appended to the names of the per-shard files of a data directory.
+        """
+        return "" if self.count == 1 else "-{}-of-{}".format(self.index, self.count)
+
+    def owns(self, item: Dict) -> bool:
+        """
+        True if the granule record `item` belongs to this shard.
+        """
+        if self.count == 1:
+            return True
+        return self.owns_key(umm.concept_id(item) or umm.granule_ur(item) or "")
+
+    def owns_key(self, key: str) -> bool:
+        """
+        True if the granule with concept-id (or GranuleUR) `key` belongs to this shard.
+        """
+        return zlib.crc32(key.encode()) % self.count == self.index
+
+    def __str__(self):
+        return "{}/{}".format(self.index, self.count)
@@ -0,0 +1,404 @@
+"""
+Cycle-partitioned columnar store of the downloaded granules.
+
+A time series over a cycle otherwise means opening and decoding the pass
+files of the cycle one by one, thousands of them for a mission.  Store
+appends the along-track variables of every downloaded granule to one array
+per variable and cycle instead, cut into large compressed chunks, so reading
+a variable over a whole cycle takes a few large sequential reads.
+
+The store is a directory in the Zarr v2 layout, written with NumPy and zlib
+alone: neither zarr nor xarray is needed to write or read it, but where they
+are installed they can open it, e.g.
+xarray.open_zarr("s6mf.zarr", group="cycle_012/data_20", consolidated=False).
+
+    s6mf.zarr/cycle_012/data_20/ku/range_ocean/{.zarray,.zattrs,0,1,...}
+
+Each along-track group (`data_01`, `data_20`) of a cycle holds the records of
+all the passes added so far end to end, in the order the files were added,
+with the variables of the group and its subgroups (`ku`, `c`) that run along
+its records, plus `pass_number`.  Values are stored packed, as they are in
+the files, with their scale_factor/add_offset attributes; read() unpacks
+them.  `.files.json` in each cycle lists the files and their record ranges.
+
+add() is incremental: a file that is in the store already is skipped, and
+appending rewrites only the last, partly filled chunk of each variable.  A
+file that changed since it was added (a revised granule downloaded again)
+has the cycle rebuilt from its files, since records cannot be taken out of
+the middle of the arrays.
+
+Needs the netCDF4 package (pip3 install netCDF4), like s6mf.subset.
+
+    python3 -m s6mf.store /path/to/data --update
+    python3 -m s6mf.store /path/to/data --cycle 12 --read ku/range_ocean --group /data_20
+"""
+
+import argparse
+import glob
+import json
+import os
+import shutil
+import zlib
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from netCDF4 import Dataset, Group
+
+from .locking import FileLock
+from .subset import track_groups
+from .trackindex import cycle_pass
+
+STORE_NAME = "s6mf.zarr"
+FILES_NAME = ".files.json"
+# Records per chunk: about one pass of 20 Hz records, 256 KB of a 4-byte
+# variable.  Every file added rewrites the last chunk of each variable, so
+# larger chunks make appending slower for little gain in reading.
+CHUNK_RECORDS = 2 ** 16
+PASS_VARIABLE = "pass_number"
+
+
+def _save_json(path: str, obj) -> None:
+    tmp = "{}.{}.tmp".format(path, os.getpid())
+    with open(tmp, "w") as f:
+        json.dump(obj, f)
+    os.replace(tmp, path)
+
+
+def _load_json(path: str, default=None):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+
+
+def _attribute(value):
+    """
+    A netCDF attribute value as JSON.
+    """
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, bytes):
+        return value.decode(errors="replace")
+    return value
+
+
+def _fill_value(value, dtype: np.dtype):
+    if value is None:
+        return None
+    value = np.asarray(value, dtype).item()
+    if isinstance(value, float) and not np.isfinite(value):
+        return "NaN" if np.isnan(value) else ("Infinity" if value > 0 else "-Infinity")
+    return value
+
+
+class _Array:
+    """
+    A Zarr v2 array in the directory `path`, chunked along its first
+    dimension, byte-shuffled and zlib compressed.
+    """
+
+    def __init__(self, path: str, meta: Dict, attrs: Dict):
+        self.path = path
+        self.meta = meta
+        self.attrs = attrs
+        self.dtype = np.dtype(meta["dtype"])
+        self.chunk = meta["chunks"][0]
+        fill = meta["fill_value"]
+        self.fill = np.array(0 if fill is None else fill, self.dtype)
+
+    @classmethod
+    def open(cls, path: str) -> "_Array":
+        meta = _load_json(os.path.join(path, ".zarray"))
+        if meta is None:
+            raise KeyError(path)
+        return cls(path, meta, _load_json(os.path.join(path, ".zattrs"), {}))
+
+    @classmethod
+    def create(cls, path: str, dtype: np.dtype, shape: Tuple[int, ...], chunk: int, fill, attrs: Dict,
+               level: int) -> "_Array":
+        dtype = dtype.newbyteorder("<") if dtype.byteorder == ">" else dtype
+        meta = {
+            "zarr_format": 2, "shape": list(shape), "chunks": [chunk]+list(shape[1:]), "dtype": dtype.str,
+            "compressor": {"id": "zlib", "level": level}, "fill_value": _fill_value(fill, dtype), "order": "C",
+            "filters": [{"id": "shuffle", "elementsize": dtype.itemsize}] if dtype.itemsize > 1 else None,
+        }
+        os.makedirs(path, exist_ok=True)
+        _save_json(os.path.join(path, ".zattrs"), attrs)
+        _save_json(os.path.join(path, ".zarray"), meta)
+        return cls(path, meta, attrs)
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        return tuple(self.meta["shape"])
+
+    def _key(self, i: int) -> str:
+        return os.path.join(self.path, ".".join([str(i)]+["0"]*(len(self.shape)-1)))
+
+    def _chunk(self, i: int) -> np.ndarray:
+        shape = (self.chunk,)+self.shape[1:]
+        try:
+            with open(self._key(i), "rb") as f:
+                raw = zlib.decompress(f.read())
+        except FileNotFoundError:
+            return np.full(shape, self.fill, self.dtype)
+        if self.dtype.itemsize > 1:
+            raw = np.frombuffer(raw, np.uint8).reshape(self.dtype.itemsize, -1).T.tobytes()
+        return np.frombuffer(raw, self.dtype).reshape(shape).copy()
+
+    def _write_chunk(self, i: int, block: np.ndarray) -> None:
+        raw = block.tobytes()
+        if self.dtype.itemsize > 1:
+            raw = np.frombuffer(raw, np.uint8).reshape(-1, self.dtype.itemsize).T.tobytes()
+        tmp = self._key(i)+".tmp"
+        with open(tmp, "wb") as f:
+            f.write(zlib.compress(raw, self.meta["compressor"]["level"]))
+        os.replace(tmp, self._key(i))
+
+    def write(self, offset: int, values: np.ndarray) -> None:
+        """
+        Write `values` from record `offset` on, growing the array as needed.
+        """
+        values = np.asarray(values, self.dtype)
+        stop = offset+len(values)
+        size = self.shape[0]
+        for i in range(offset // self.chunk, -(-stop // self.chunk)):
+            lo, hi = i*self.chunk, (i+1)*self.chunk
+            a, b = max(offset, lo), min(stop, hi)
+            keep = lo < size and (a > lo or b < min(size, hi))
+            block = self._chunk(i) if keep else np.full((self.chunk,)+self.shape[1:], self.fill, self.dtype)
+            block[a-lo:b-lo] = values[a-offset:b-offset]
+            self._write_chunk(i, block)
+        if stop > size:
+            self.meta["shape"][0] = stop
+            _save_json(os.path.join(self.path, ".zarray"), self.meta)
+
+    def read(self, start: int, stop: int) -> np.ndarray:
+        out = np.empty((max(0, stop-start),)+self.shape[1:], self.dtype)
+        for i in range(start // self.chunk, -(-stop // self.chunk)):
+            lo = i*self.chunk
+            a, b = max(start, lo), min(stop, lo+self.chunk)
+            out[a-start:b-start] = self._chunk(i)[a-lo:b-lo]
+        return out
+
+
+def _group(path: str, attrs: Optional[Dict] = None) -> None:
+    os.makedirs(path, exist_ok=True)
+    if not os.path.exists(os.path.join(path, ".zgroup")):
+        if attrs:
+            _save_json(os.path.join(path, ".zattrs"), attrs)
+        _save_json(os.path.join(path, ".zgroup"), {"zarr_format": 2})
+
+
+def _attributes(obj) -> Dict:
+    return {k: _attribute(obj.getncattr(k)) for k in obj.ncattrs() if k != "_FillValue"}
+
+
+def _columns(track: Group) -> Iterator[Tuple[str, object]]:
+    """
+    (path relative to `track`, variable) of the numeric variables of the
+    along-track group `track` and its subgroups that run along its records.
+    """
+    dimension = track.variables["time"].dimensions[0]
+
+    def walk(group: Group, prefix: str):
+        for var in group.variables.values():
+            if var.dimensions[:1] == (dimension,) and var.dtype != str and var.dtype.kind in "biuf":
+                yield prefix+var.name, var
+        for child in group.groups.values():
+            if dimension not in child.dimensions and "time" not in child.variables:
+                yield from walk(child, prefix+child.name+"/")
+
+    yield from walk(track, "")
+
+
+def _decode(values: np.ndarray, array: _Array) -> np.ma.MaskedArray:
+    """
+    Mask the fill values and apply scale_factor/add_offset, as netCDF4 does.
+    """
+    if array.meta["fill_value"] is None:
+        mask = np.zeros(values.shape, dtype=bool)
+    elif values.dtype.kind == "f" and np.isnan(array.fill):
+        mask = np.isnan(values)
+    else:
+        mask = values == array.fill
+    scale, offset = array.attrs.get("scale_factor"), array.attrs.get("add_offset")
+    if scale is not None or offset is not None:
+        values = values*(1 if scale is None else scale)+(0 if offset is None else offset)
+    return np.ma.masked_array(values, mask)
+
+
+class Store:
+    """
+    Open (or create) the store at `path`.
+
+    chunk       - records per chunk of the arrays it creates
+    compression - zlib level of the chunks; low levels write much faster and
+                  still shrink packed, shuffled values well
+    """
+
+    def __init__(self, path: str, chunk: int = CHUNK_RECORDS, compression: int = 1):
+        self.path = path
+        self.chunk = chunk
+        self.compression = compression
+        _group(path)
+
+    def _partition(self, cycle: int) -> str:
+        return os.path.join(self.path, "cycle_{:03d}".format(cycle))
+
+    def cycles(self) -> List[int]:
+        return sorted(int(name[6:]) for name in os.listdir(self.path)
+                      if name.startswith("cycle_") and name[6:].isdigit())
+
+    def files(self, cycle: int) -> Dict:
+        """
+        The files of `cycle` in the store and their record ranges per group,
+        and the number of `records` of each group.
+        """
+        return _load_json(os.path.join(self._partition(cycle), FILES_NAME), {"records": {}, "files": {}})
+
+    def add(self, path: str) -> Optional[int]:
+        """
+        Append the along-track records of the granule `path` to the partition
+        of its cycle.  Returns the number of records added, 0 if the file is
+        in the store already and None if its cycle is not known.
+        """
+        name = os.path.basename(path)
+        stat = os.stat(path)
+        with Dataset(path) as nc:
+            cycle, pass_ = cycle_pass(nc, path)
+            if cycle is None:
+                return None
+            partition = self._partition(cycle)
+            _group(partition, {"cycle": cycle})
+            # Shards of one data directory may add files of the same cycle at once
+            with FileLock(os.path.join(partition, ".lock")):
+                registry = self.files(cycle)
+                entry = registry["files"].get(name)
+                if entry is None:
+                    return self._append(nc, path, pass_, partition, registry)
+                if (entry["size"], entry["mtime"]) == (stat.st_size, stat.st_mtime):
+                    return 0
+        return self._rebuild(cycle, path)
+
+    def _append(self, nc: Dataset, path: str, pass_: Optional[int], partition: str, registry: Dict) -> int:
+        stat = os.stat(path)
+        ranges = {}
+        for track in track_groups(nc):
+            n = track.variables["time"].shape[0]
+            start = registry["records"].get(track.path, 0)
+            directory = os.path.join(partition, track.path.strip("/"))
+            _group(directory, _attributes(track))
+            dimension = track.variables["time"].dimensions[0]
+            columns = dict(_columns(track))
+            for name, var in columns.items():
+                parts = name.split("/")[:-1]
+                for i in range(1, len(parts)+1):
+                    _group(os.path.join(directory, *parts[:i]), _attributes(track["/".join(parts[:i])]))
+                var.set_auto_maskandscale(False)
+                values = var[...]
+                array = self._array(os.path.join(directory, name), values.dtype, (start,)+values.shape[1:],
+                                    var.getncattr("_FillValue") if "_FillValue" in var.ncattrs() else None,
+                                    dict(_attributes(var), _ARRAY_DIMENSIONS=list(var.dimensions)))
+                array.write(start, values)
+            if PASS_VARIABLE not in columns:
+                array = self._array(os.path.join(directory, PASS_VARIABLE), np.dtype("i2"), (start,), -1,
+                                    {"long_name": "pass number", "_ARRAY_DIMENSIONS": [dimension]})
+                array.write(start, np.full(n, -1 if pass_ is None else pass_))
+            # Variables this file lacks get fill values for its records
+            for name in registry.setdefault("variables", {}).get(track.path, []):
+                if name not in columns and name != PASS_VARIABLE:
+                    array = _Array.open(os.path.join(directory, name))
+                    array.write(start, np.full((n,)+array.shape[1:], array.fill))
+            known = registry["variables"].get(track.path, [])
+            registry["variables"][track.path] = known+[c for c in list(columns)+[PASS_VARIABLE] if c not in known]
+            registry["records"][track.path] = start+n
+            ranges[track.path] = [start, start+n]
+        registry["files"][os.path.basename(path)] = {"path": os.path.abspath(path), "size": stat.st_size,
+                                                    "mtime": stat.st_mtime, "pass": pass_, "records": ranges}
+        # Written last: the arrays only count up to the records listed here
+        _save_json(os.path.join(partition, FILES_NAME), registry)
+        return sum(stop-start for start, stop in ranges.values())
+
+    def _array(self, path: str, dtype: np.dtype, shape: Tuple[int, ...], fill, attrs: Dict) -> _Array:
+        try:
+            return _Array.open(path)
+        except KeyError:
+            return _Array.create(path, dtype, shape, self.chunk, fill, attrs, self.compression)
+
+    def _rebuild(self, cycle: int, path: str) -> int:
+        """
+        Write the partition of `cycle` again from its files, with the new
+        version of `path`.  Returns the number of records of `path`.
+        """
+        partition = self._partition(cycle)
+        added = 0
+        with FileLock(os.path.join(partition, ".lock")):
+            name = os.path.basename(path)
+            paths = [os.path.abspath(path) if n == name else e["path"] for n, e in self.files(cycle)["files"].items()]
+            for entry in os.listdir(partition):
+                if entry != ".lock":
+                    target = os.path.join(partition, entry)
+                    shutil.rmtree(target) if os.path.isdir(target) else os.remove(target)
+            _group(partition, {"cycle": cycle})
+            registry = self.files(cycle)
+            for p in paths:
+                if os.path.exists(p):
+                    with Dataset(p) as nc:
+                        n = self._append(nc, p, cycle_pass(nc, p)[1], partition, registry)
+                    if os.path.basename(p) == name:
+                        added = n
+        return added
+
+    def update(self, paths) -> int:
+        """
+        Add the granules in `paths` that are new or changed; returns the
+        number of records added.
+        """
+        return sum(self.add(path) or 0 for path in paths)
+
+    def read(self, cycle: int, variable: str, group: str = "/data_20", start: int = 0, stop: Optional[int] = None,
+             decode: bool = True) -> np.ndarray:
+        """
+        Records `start`-`stop` (all by default) of `variable` ("latitude",
+        "ku/range_ocean") of the along-track `group` of `cycle`, across all
+        its passes.  With `decode` the values are unpacked and masked as
+        netCDF4 does, otherwise they are returned as stored.
+        """
+        group = "/"+group.strip("/")
+        records = self.files(cycle)["records"].get(group, 0)
+        array = _Array.open(os.path.join(self._partition(cycle), group.strip("/"), variable))
+        values = array.read(start, records if stop is None else min(stop, records))
+        return _decode(values, array) if decode else values
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Consolidate downloaded granules into a store partitioned by cycle")
+    parser.add_argument("data", help="data directory")
+    parser.add_argument("--store", help="store directory (default: "+STORE_NAME+" in the data directory)")
+    parser.add_argument("--update", action="store_true", help="add new and changed files first")
+    parser.add_argument("--cycle", type=int)
+    parser.add_argument("--read", metavar="VARIABLE", help="e.g. ku/range_ocean")
+    parser.add_argument("--group", default="/data_20", help="along-track group, e.g. /data_01 for 1 Hz")
+    args = parser.parse_args()
+    if not os.path.isdir(args.data):
+        parser.error("no such directory: "+args.data)
+
+    store = Store(args.store or os.path.join(args.data, STORE_NAME))
+    if args.update:
+        paths = sorted(glob.glob(os.path.join(args.data, "**", "*.nc"), recursive=True))
+        print(str(store.update(paths))+" records added")
+    for cycle in [args.cycle] if args.cycle is not None else store.cycles():
+        files = store.files(cycle)
+        print("Cycle:{} {} files, {}".format(cycle, len(files["files"]), ", ".join(
+            "{} {} records".format(group, n) for group, n in sorted(files["records"].items()))))
+        if args.read:
+            values = store.read(cycle, args.read, args.group)
+            print("{} {}: {} values, {} valid, min {}, mean {}, max {}".format(
+                args.group, args.read, values.size, values.count(), values.min(), values.mean(), values.max()))
+
+
+if __name__ == "__main__":
+    main()
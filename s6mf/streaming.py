@@ -0,0 +1,137 @@
+"""
+Bounded-memory writing of response bodies to disk.
+
+iter_content() hands out a new bytes object for every block, and a buffered
+file copies it once more before it reaches the kernel.  write_body() instead
+reads the body with readinto() straight into a reusable buffer and writes it
+from there to an unbuffered file descriptor, so a transfer allocates nothing
+per block however large the blocks are.
+
+The buffers come from a BufferPool shared by all the transfers of a
+DownloadEngine.  The pool never holds more than `limit` bytes; a transfer
+that finds every buffer in use waits for one to come back, so raising the
+number of workers does not raise the memory held in buffers.
+
+Two policies help the file system when many files are written at once onto
+network or spinning storage:
+
+preallocate - reserve the whole file (posix_fallocate) before writing it, so
+              it is laid out in one piece instead of growing block by block
+sync_every  - flush the data to disk every so many bytes and drop it from the
+              page cache, so dirty pages do not pile up while the disk falls
+              behind the network
+"""
+
+import os
+import threading
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Optional
+
+from requests import Response
+
+BUFFER_SIZE = 1024 * 1024
+MEMORY_LIMIT = 64 * 1024 * 1024
+
+
+class BufferPool:
+    """
+    Reusable `size`-byte buffers, at most `limit` bytes of them in total.
+    Buffers are allocated as they are first needed.
+    """
+
+    def __init__(self, size: int = BUFFER_SIZE, limit: int = MEMORY_LIMIT):
+        self.size = max(4096, size)
+        self.count = max(1, limit // self.size)
+        self.allocated = 0
+        self.waits = 0
+        self._free: List[bytearray] = []
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def buffer(self) -> Iterator[memoryview]:
+        with self._cond:
+            while not self._free and self.allocated >= self.count:
+                self.waits += 1
+                self._cond.wait()
+            if self._free:
+                buf = self._free.pop()
+            else:
+                buf = bytearray(self.size)
+                self.allocated += 1
+        try:
+            yield memoryview(buf)
+        finally:
+            with self._cond:
+                self._free.append(buf)
+                self._cond.notify()
+
+
+def preallocate(fd: int, offset: int, length: int) -> bool:
+    """
+    Reserve `length` bytes of the file from `offset`, extending it as needed.
+    False where the platform or the file system cannot.
+    """
+    if length <= 0 or not hasattr(os, "posix_fallocate"):
+        return False
+    try:
+        os.posix_fallocate(fd, offset, length)
+    except OSError:
+        return False
+    return True
+
+
+def _sync(fd: int, start: int, stop: int) -> None:
+    if hasattr(os, "fdatasync"):
+        os.fdatasync(fd)
+    else:
+        os.fsync(fd)
+    if hasattr(os, "posix_fadvise"):
+        os.posix_fadvise(fd, start, stop-start, os.POSIX_FADV_DONTNEED)
+
+
+def _write(fd: int, data: memoryview) -> None:
+    while data:
+        data = data[os.write(fd, data):]
+
+
+def write_body(response: Response, fd: int, pool: BufferPool, hasher=None, sync_every: Optional[int] = None,
+               synced: Optional[Callable[[int], None]] = None) -> int:
+    """
+    Write the body of the streamed `response` to the file descriptor `fd`
+    from its current offset, feeding `hasher` on the way, and return the
+    number of bytes written.
+
+    With `sync_every`, the data is flushed to disk and dropped from the page
+    cache after every `sync_every` bytes, and `synced` is called with the
+    file offset up to which it is on disk.
+    """
+    raw = response.raw
+    fp = getattr(raw, "_fp", None)
+    # A compressed body has to be decoded by urllib3, a block at a time
+    direct = hasattr(fp, "readinto") and response.headers.get("Content-Encoding", "identity") == "identity"
+    blocks = None if direct else response.iter_content(pool.size)
+    start = position = flushed = os.lseek(fd, 0, os.SEEK_CUR)
+    while True:
+        with pool.buffer() as buf:
+            if direct:
+                data = buf[:fp.readinto(buf)]
+            else:
+                data = memoryview(next(blocks, b""))
+            if not data:
+                break
+            _write(fd, data)
+            if hasher:
+                hasher.update(data)
+        position += len(data)
+        if sync_every and position-flushed >= sync_every:
+            _sync(fd, flushed, position)
+            flushed = position
+            if synced:
+                synced(position)
+    if direct and getattr(fp, "isclosed", bool)():
+        # Read to the end behind urllib3's back: hand the connection back to
+        # the pool as urllib3 does itself, rather than have it closed
+        raw.release_conn()
+    if sync_every and position > flushed:
+        _sync(fd, flushed, position)
+    return position-start
@@ -0,0 +1,199 @@
+"""
+Local along-track subsetting of downloaded granules.
+
+For a small region a Harmony job spends most of its time queued, and the
+access scripts download whole granules (one pass around the globe) whatever
+`bounding_extent` is.  subset_file() cuts a downloaded Sentinel-6 MF netCDF
+granule down to the along-track records inside a bounding box and time range
+instead, without a round trip.
+
+Every group holding `latitude`, `longitude` and `time` along one dimension
+(`data_01` and `data_20` in the Sentinel-6 products) is subset on its own: the
+coordinates are read a chunk of records at a time and masked with NumPy, and
+only the runs of records inside the box are then read from the variables of
+the group and its subgroups (`ku`, `c`, ...).  Other variables are copied
+whole.  Values are copied packed, as stored, into a compressed netCDF-4 file
+with the same groups, attributes and encodings.
+
+Needs the netCDF4 package (pip3 install netCDF4), unlike the rest of s6mf.
+
+    python3 -m s6mf.subset /path/to/data/*.nc --bbox -10,30,10,50 --out /path/to/subsets
+"""
+
+import argparse
+import os
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from netCDF4 import Dataset, Group, date2num
+
+# Along-track records read at a time while building the mask
+CHUNK = 65536
+COORDINATES = ("latitude", "longitude", "time")
+
+
+def _bbox(bbox: str) -> Tuple[float, float, float, float]:
+    west, south, east, north = (float(v) for v in bbox.split(","))
+    return west, south, east, north
+
+
+def _time(value: str) -> datetime:
+    return datetime.fromisoformat(value.rstrip("Z"))
+
+
+def bbox_mask(lat: np.ndarray, lon: np.ndarray, bbox: str) -> np.ndarray:
+    """
+    True for the points inside `bbox` ("W,S,E,N").  Longitudes may be given
+    in -180..180 or 0..360, and a box with W > E crosses the antimeridian.
+    """
+    west, south, east, north = _bbox(bbox)
+    mask = (lat >= south) & (lat <= north)
+    width = east-west
+    if width < 360:
+        mask &= np.mod(lon-west, 360) <= np.mod(width, 360)
+    return mask
+
+
+def _runs(mask: np.ndarray) -> List[Tuple[int, int]]:
+    """
+    (start, stop) of the runs of True in `mask`.
+    """
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], mask.view(np.int8), [0]))))
+    return list(zip(edges[::2].tolist(), edges[1::2].tolist()))
+
+
+def track_groups(group: Group) -> Iterator[Group]:
+    """
+    The groups below and including `group` with along-track coordinates.
+    """
+    if all(name in group.variables for name in COORDINATES):
+        yield group
+    for child in group.groups.values():
+        yield from track_groups(child)
+
+
+def _record_dimension(group: Group) -> str:
+    return group.variables["time"].dimensions[0]
+
+
+def track_mask(group: Group, bbox: str, start: Optional[str] = None, stop: Optional[str] = None,
+               chunk: int = CHUNK) -> np.ndarray:
+    """
+    The mask of the records of `group` (a netCDF4 group with latitude,
+    longitude and time) inside `bbox` and the time range, read `chunk`
+    records at a time.
+    """
+    lat, lon, time = (group.variables[name] for name in COORDINATES)
+    limits = [date2num(_time(t), time.units, getattr(time, "calendar", "standard")) if t else None
+              for t in (start, stop)]
+    n = time.shape[0]
+    mask = np.zeros(n, dtype=bool)
+    for i in range(0, n, chunk):
+        part = bbox_mask(np.ma.filled(lat[i:i+chunk], np.nan), np.ma.filled(lon[i:i+chunk], np.nan), bbox)
+        if limits[0] is not None or limits[1] is not None:
+            t = np.ma.filled(time[i:i+chunk], np.nan)
+            if limits[0] is not None:
+                part &= t >= limits[0]
+            if limits[1] is not None:
+                part &= t <= limits[1]
+        mask[i:i+chunk] = part
+    return mask
+
+
+def _create_variable(dst: Group, var, compression: int):
+    fill = var.getncattr("_FillValue") if "_FillValue" in var.ncattrs() else None
+    kwargs = {}
+    if compression and var.dtype != str and var.dtype.kind != "V":
+        kwargs = dict(zlib=True, complevel=compression, shuffle=True)
+    out = dst.createVariable(var.name, var.datatype, var.dimensions, fill_value=fill, **kwargs)
+    out.setncatts({k: var.getncattr(k) for k in var.ncattrs() if k != "_FillValue"})
+    out.set_auto_maskandscale(False)
+    var.set_auto_maskandscale(False)
+    return out
+
+
+def _copy_group(src: Group, dst: Group, masks: Dict[Tuple[str, str], Tuple[np.ndarray, List]],
+                compression: int) -> None:
+    """
+    Copy `src` into `dst`, cutting variables along the dimensions in `masks`,
+    keyed by (group path, dimension name) of the group owning the dimension.
+    """
+    dst.setncatts({k: src.getncattr(k) for k in src.ncattrs()})
+    for name, dim in src.dimensions.items():
+        cut = masks.get((src.path, name))
+        size = int(cut[0].sum()) if cut is not None else (None if dim.isunlimited() else len(dim))
+        dst.createDimension(name, size)
+    for var in src.variables.values():
+        out = _create_variable(dst, var, compression)
+        cut = None
+        if var.dimensions:
+            owner = _dimension_owner(src, var.dimensions[0])
+            cut = masks.get((owner.path, var.dimensions[0]))
+        if cut is None:
+            out[...] = var[...]
+            continue
+        written = 0
+        for start, stop in cut[1]:
+            out[written:written+stop-start] = var[start:stop]
+            written += stop-start
+    for child in src.groups.values():
+        _copy_group(child, dst.createGroup(child.name), masks, compression)
+
+
+def _dimension_owner(group: Group, name: str) -> Group:
+    while name not in group.dimensions:
+        group = group.parent
+    return group
+
+
+def subset_file(src: str, dst: str, bbox: str, start: Optional[str] = None, stop: Optional[str] = None,
+                chunk: int = CHUNK, compression: int = 4) -> Optional[Dict[str, int]]:
+    """
+    Write the records of the granule `src` inside `bbox` ("W,S,E,N") and the
+    time range `start`-`stop` (%Y-%m-%dT%H:%M:%SZ) to `dst`.  Returns the
+    number of records kept per along-track group, or None without writing
+    anything if no record is inside.
+    """
+    with Dataset(src) as nc:
+        masks = {}
+        for group in track_groups(nc):
+            dimension = _record_dimension(group)
+            owner = _dimension_owner(group, dimension)
+            mask = track_mask(group, bbox, start, stop, chunk)
+            masks[(owner.path, dimension)] = (mask, _runs(mask))
+        kept = {path: int(mask.sum()) for (path, _), (mask, _) in masks.items()}
+        if not any(kept.values()):
+            return None
+        tmp = dst+".part"
+        with Dataset(tmp, "w", format="NETCDF4") as out:
+            _copy_group(nc, out, masks, compression)
+            out.setncattr("subset_bounding_box", bbox)
+            if start or stop:
+                out.setncattr("subset_time_range", (start or "")+","+(stop or ""))
+        os.replace(tmp, dst)
+    return kept
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cut downloaded granules down to a region and time range")
+    parser.add_argument("files", nargs="+", help="netCDF granules")
+    parser.add_argument("--bbox", required=True, help="W,S,E,N")
+    parser.add_argument("--start", help="e.g. 2021-06-01T00:00:00Z")
+    parser.add_argument("--stop")
+    parser.add_argument("--out", required=True, help="directory for the subsets")
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    for path in args.files:
+        dst = os.path.join(args.out, os.path.basename(path))
+        kept = subset_file(path, dst, args.bbox, args.start, args.stop)
+        if kept is None:
+            print(path+": no records inside")
+        else:
+            print(path+": "+", ".join("{} {}".format(group, n) for group, n in kept.items())
+                  + " records, {:.1f} of {:.1f} MB".format(os.path.getsize(dst)/1e6, os.path.getsize(path)/1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+One update of a local collection, as a function.
+
+sync() does what a run of Access_Sentinel6MF_usingshortname.py does: it
+searches CMR for the granules ingested since the collection's `.update`
+checkpoint, downloads the new files as the search pages arrive, records them in
+the manifest and moves the checkpoint forward once every file is there.  It
+returns a SyncResult instead of printing, so another Python program can call it
+as often as it likes.  Pass the same session, token and engine to every call:
+their connections, Earthdata Login cookies and CMR token are then reused, and
+a call that finds nothing new costs a single search request.
+
+    from s6mf.collection import Collection
+    from s6mf.session import earthdata_session
+    from s6mf.sync import sync
+
+    session = earthdata_session()
+    result = sync(Collection("JASON_CS_S6A_L2_ALT_LR_STD_OST_NRT_F", "/data/lr"), session=session)
+
+    python3 -m s6mf sync /data/lr JASON_CS_S6A_L2_ALT_LR_STD_OST_NRT_F
+"""
+
+import argparse
+import os
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional
+
+from .collection import Collection, utcnow
+from .download import DownloadEngine, DownloadResult, print_result
+from .locking import Lease, LeaseError
+from .manifest import Manifest, NewFiles
+from .search import CMR, GranuleSearch, granule_search_url, token_url
+from .session import Session
+from .shard import Shard
+from .umm import file_info
+
+
+@dataclass
+class SyncResult:
+    short_name: str
+    since: str
+    # Where the next sync starts if this one is complete
+    timestamp: str
+    hits: int = 0
+    skipped: int = 0
+    # True if the checkpoint was moved to `timestamp`
+    checkpoint: bool = False
+    results: List[DownloadResult] = field(default_factory=list, repr=False)
+
+    @property
+    def downloaded(self) -> int:
+        return sum(r.ok for r in self.results)
+
+    @property
+    def failed(self) -> int:
+        return sum(not r.ok for r in self.results)
+
+
+def sync(collection: Collection, cmr: str = CMR, session: Optional[Session] = None, token=None,
+         engine: Optional[DownloadEngine] = None, page_size: int = 2000, search_format: str = "umm_json",
+         lease_wait: float = 0, callback: Optional[Callable[[DownloadResult], None]] = None) -> SyncResult:
+    """
+    Bring the data directory of `collection` up to date.
+
+    cmr           - CMR host, or a base URL such as http://localhost:8080 for testing
+    session       - s6mf.session.Session for the searches and downloads; by
+                    default the one of `engine`
+    token         - optional s6mf.tokens.TokenCache for the searches
+    engine        - DownloadEngine to download with
+    lease_wait    - seconds to wait for another process to release the data
+                    directory; raises s6mf.locking.LeaseError after that
+    callback      - called with every DownloadResult as the file finishes
+
+    The checkpoint is only written if every file downloaded and the lease was
+    held throughout; otherwise the next call searches the same time span again
+    and the manifest keeps the files that did download from being fetched twice.
+    """
+    engine = engine or DownloadEngine(session=session)
+    session = session or engine.session
+    os.makedirs(collection.data, exist_ok=True)
+    lease = Lease(collection.lease_file).acquire(lease_wait)
+    try:
+        with Manifest(collection.data, collection.shard) as manifest:
+            since = collection.since()
+            result = SyncResult(collection.short_name, since, utcnow())
+            search = GranuleSearch(granule_search_url(cmr, search_format), collection.params(since), page_size,
+                                   session=session, token=token, stream=True)
+            files = NewFiles(collection, manifest, collection.shard)
+
+            def finished(r: DownloadResult) -> None:
+                if r.ok:
+                    manifest.add(files.pending[r.url], r.url, r.path, r.nbytes)
+                if callback:
+                    callback(r)
+
+            jobs = ((url, collection.path(url), file_info(item, url)) for url, item in files(search))
+            result.results = engine.run(jobs, callback=finished)
+            result.hits = search.hits or 0
+            result.skipped = files.skipped
+            if not result.failed:
+                try:
+                    lease.check()
+                except LeaseError:
+                    return result
+                collection.write_checkpoint(result.timestamp)
+                result.checkpoint = True
+        return result
+    finally:
+        lease.release()
+
+
+def main():
+    from .session import earthdata_session
+    from .telemetry import Telemetry
+    from .tokens import TokenCache, create_token
+
+    parser = argparse.ArgumentParser(description="Download what is new in a Sentinel-6 MF collection, once")
+    parser.add_argument("data", help="data directory of the collection")
+    parser.add_argument("short_name")
+    parser.add_argument("--extensions", nargs="+", default=[".nc", ".bin"])
+    parser.add_argument("--bbox", default="-180,-90,180,90", help="W,S,E,N")
+    parser.add_argument("--mins", type=int, default=60, help="minutes to look back on the first run")
+    parser.add_argument("--granule-names", nargs="+", default=[], help="granule name patterns, e.g. '*_NR_*_F08'")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--cmr", default=CMR)
+    parser.add_argument("--format", default="umm_json", choices=["umm_json", "json"],
+                        help="CMR result format; json (Atom) is lighter but has no checksums")
+    parser.add_argument("--token", action="store_true", help="send a (cached) CMR token with the search")
+    parser.add_argument("--shard", type=Shard.parse, default=Shard(), metavar="INDEX/COUNT",
+                        help="download only this share of the granules, e.g. 0/4 (s6mf/shard.py)")
+    parser.add_argument("--lease-wait", type=float, default=0,
+                        help="seconds to wait for another process working on the data directory")
+    parser.add_argument("--telemetry", help="append the timing of every request and file to this file as JSON lines")
+    args = parser.parse_args()
+
+    collection = Collection(args.short_name, args.data, args.extensions, args.bbox, args.mins,
+                            args.granule_names, args.shard)
+    session = earthdata_session(pool_size=args.workers)
+    session.telemetry = Telemetry(args.telemetry)
+    token = None
+    if args.token:
+        tokens = token_url(args.cmr)
+        token = TokenCache(lambda: create_token(tokens, 'Sentinel-6MF', session=session),
+                           tokens+" Sentinel-6MF", telemetry=session.telemetry)
+    engine = DownloadEngine(args.workers, session=session)
+    result = sync(collection, args.cmr, session, token, engine, search_format=args.format,
+                  lease_wait=args.lease_wait, callback=print_result)
+    print("{} granules since {}: {} downloaded, {} failed, {} skipped (already downloaded)".format(
+        result.hits, result.since, result.downloaded, result.failed, result.skipped))
+    print(session.telemetry.summary())
+    session.telemetry.close()
+    if result.failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
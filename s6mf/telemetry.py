@@ -0,0 +1,220 @@
+"""
+Per-phase timings of a run.
+
+Every Session carries a Telemetry (`session.telemetry`) that the search, token
+and download code report to:
+
+    auth         requests that went through the Earthdata Login redirects
+    token        creation of a CMR token
+    search_page  each CMR search page, until its response headers arrived
+    file         each downloaded file, from start to rename (with `bytes`,
+                 `ttfb`, `rate` and `ok` fields)
+    ttfb         time to the first response of each file
+    transfer     time spent receiving each file
+    verify       checksum verification of each file
+
+Each event can be written as a JSON line, the totals and percentiles of each
+phase in the Prometheus text format (for the node_exporter textfile
+collector), and summary() gives a few lines for the end of a run.
+"""
+
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Deque, Dict, List, Optional
+
+# Samples kept per phase for the percentiles
+SAMPLES = 10000
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    """
+    Nearest-rank percentile, `p` between 0 and 100.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered), max(1, math.ceil(p/100*len(ordered))))-1]
+
+
+def measured_rate(jsonl: str, files: int = 500) -> Optional[float]:
+    """
+    Download throughput in bytes/s of the last `files` successful downloads
+    in a JSON lines file written by Telemetry: their bytes over the time at
+    least one of them was running, so parallel downloads are not counted
+    twice and the time between runs not at all.  None without any.
+    """
+    spans: Deque[tuple] = deque(maxlen=files)
+    try:
+        with open(jsonl) as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue
+                if event.get("phase") == "file" and event.get("ok") and event.get("bytes"):
+                    end = datetime.fromisoformat(event["time"].rstrip("Z")).timestamp()
+                    spans.append((end-event["seconds"], end, event["bytes"]))
+    except FileNotFoundError:
+        return None
+    busy = 0.0
+    until = None
+    for start, end, _ in sorted(spans):
+        if until is None or start > until:
+            busy += end-start
+            until = end
+        elif end > until:
+            busy += end-until
+            until = end
+    return sum(s[2] for s in spans)/busy if busy > 0 else None
+
+
+class _Phase:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.samples: Deque[float] = deque(maxlen=SAMPLES)
+
+
+class Telemetry:
+    """
+    Collect timings and optionally write them out.
+
+    jsonl      - file each event is appended to as a JSON line
+    prometheus - file rewritten with the totals in Prometheus text format by
+                 write_prometheus() and close()
+    """
+
+    def __init__(self, jsonl: Optional[str] = None, prometheus: Optional[str] = None):
+        self.prometheus = prometheus
+        self.started = time.monotonic()
+        self.finished: Optional[float] = None
+        self.files_ok = 0
+        self.files_failed = 0
+        self.bytes = 0
+        self._phases: Dict[str, _Phase] = {}
+        self._lock = threading.Lock()
+        self._out = open(jsonl, "a") if jsonl else None
+
+    def record(self, phase: str, seconds: float, **fields) -> None:
+        with self._lock:
+            if phase not in self._phases:
+                self._phases[phase] = _Phase()
+            stats = self._phases[phase]
+            stats.count += 1
+            stats.seconds += seconds
+            stats.samples.append(seconds)
+            if self._out:
+                event = dict(time=datetime.utcnow().isoformat()+"Z", phase=phase, seconds=round(seconds, 6), **fields)
+                self._out.write(json.dumps(event)+"\n")
+                self._out.flush()
+
+    @contextmanager
+    def timer(self, phase: str, **fields):
+        """
+        Record the time spent in the `with` block.  Fields can be added to the
+        yielded dict inside the block.
+        """
+        start = time.perf_counter()
+        try:
+            yield fields
+        finally:
+            self.record(phase, time.perf_counter()-start, **fields)
+
+    def file(self, result, ttfb: Optional[float] = None, transfer: Optional[float] = None,
+             verify: Optional[float] = None, attempts: int = 1) -> None:
+        """
+        Record a finished download (an s6mf.download.DownloadResult) and its phases.
+        """
+        with self._lock:
+            if result.ok:
+                self.files_ok += 1
+                self.bytes += result.nbytes
+            else:
+                self.files_failed += 1
+        if ttfb is not None:
+            self.record("ttfb", ttfb, url=result.url)
+        if transfer is not None:
+            self.record("transfer", transfer, url=result.url, bytes=result.nbytes)
+        if verify is not None:
+            self.record("verify", verify, url=result.url)
+        fields = dict(url=result.url, ok=result.ok, bytes=result.nbytes, attempts=attempts,
+                      rate=round(result.nbytes/transfer, 1) if transfer else None)
+        if ttfb is not None:
+            fields["ttfb"] = round(ttfb, 6)
+        if not result.ok:
+            fields["error"] = str(result.error)
+        self.record("file", result.elapsed, **fields)
+
+    def phase(self, name: str) -> Dict:
+        """
+        count, total seconds, p50 and p95 of one phase.
+        """
+        with self._lock:
+            stats = self._phases.get(name) or _Phase()
+            samples = list(stats.samples)
+            return {"count": stats.count, "seconds": stats.seconds,
+                    "p50": percentile(samples, 50), "p95": percentile(samples, 95)}
+
+    @property
+    def elapsed(self) -> float:
+        """
+        Seconds since the start of the run, or until close().
+        """
+        return (self.finished or time.monotonic())-self.started
+
+    def summary(self) -> str:
+        elapsed = self.elapsed
+        lines = ["{} files downloaded ({} failed), {:.1f} MB in {:.1f} s: {:.2f} MB/s".format(
+            self.files_ok, self.files_failed, self.bytes/1e6, elapsed, self.bytes/1e6/elapsed if elapsed else 0.0)]
+        with self._lock:
+            names = list(self._phases)
+        for name in names:
+            p = self.phase(name)
+            lines.append("{:<12} {:>6} x  total {:>8.2f} s  p50 {:>7.3f} s  p95 {:>7.3f} s".format(
+                name, p["count"], p["seconds"], p["p50"], p["p95"]))
+        return "\n".join(lines)
+
+    def prometheus_text(self) -> str:
+        lines = ["# HELP s6mf_phase_seconds Time spent per phase of the Sentinel-6 MF download.",
+                 "# TYPE s6mf_phase_seconds summary"]
+        with self._lock:
+            names = list(self._phases)
+        for name in names:
+            p = self.phase(name)
+            for quantile, key in (("0.5", "p50"), ("0.95", "p95")):
+                lines.append('s6mf_phase_seconds{{phase="{}",quantile="{}"}} {}'.format(name, quantile, p[key]))
+            lines.append('s6mf_phase_seconds_sum{{phase="{}"}} {}'.format(name, p["seconds"]))
+            lines.append('s6mf_phase_seconds_count{{phase="{}"}} {}'.format(name, p["count"]))
+        lines += ["# HELP s6mf_files_total Files downloaded, by result.",
+                  "# TYPE s6mf_files_total counter",
+                  's6mf_files_total{{result="ok"}} {}'.format(self.files_ok),
+                  's6mf_files_total{{result="failed"}} {}'.format(self.files_failed),
+                  "# HELP s6mf_bytes_total Bytes downloaded.",
+                  "# TYPE s6mf_bytes_total counter",
+                  "s6mf_bytes_total {}".format(self.bytes),
+                  "# HELP s6mf_throughput_bytes_per_second Bytes downloaded per second of the run.",
+                  "# TYPE s6mf_throughput_bytes_per_second gauge",
+                  "s6mf_throughput_bytes_per_second {}".format(self.bytes/self.elapsed)]
+        return "\n".join(lines)+"\n"
+
+    def write_prometheus(self) -> None:
+        if not self.prometheus:
+            return
+        tmp = self.prometheus+".tmp"
+        with open(tmp, "w") as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp, self.prometheus)
+
+    def close(self) -> None:
+        if self.finished is None:
+            self.finished = time.monotonic()
+        self.write_prometheus()
+        if self._out:
+            self._out.close()
+            self._out = None
@@ -0,0 +1,166 @@
+"""
+CMR token cache.
+
+Creating a CMR token costs a request to the token service (and a host name
+lookup for the IP address that goes with it), and deleting it another one.
+TokenCache keeps the token in a file readable only by the current user and
+hands the same token to every run until it is older than `max_age` or CMR
+rejects it.  The file is locked while it is read or refreshed, so concurrent
+processes on one host share one token instead of each creating their own.
+"""
+
+import json
+import netrc
+import os
+import socket
+import time
+from typing import Callable, Dict, Optional
+from xml.sax.saxutils import escape
+
+from .locking import FileLock
+from .session import EDL_HOST, Session
+
+DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".cache", "s6mf", "cmr_tokens.json")
+
+
+def create_token(url: str, client_id: str, endpoint: str = EDL_HOST, session: Optional[Session] = None,
+                 user_ip: Optional[str] = None) -> str:
+    """
+    Create a CMR token at the token service `url` for the Earthdata Login user
+    in the .netrc file.  Unlike get_token errors are raised, not printed.
+    """
+    username, _, password = netrc.netrc().authenticators(endpoint)
+    xml = """<?xml version='1.0' encoding='utf-8'?>
+    <token><username>{}</username><password>{}</password><client_id>{}</client_id>
+    <user_ip_address>{}</user_ip_address></token>""".format(
+        escape(username), escape(password), escape(client_id),
+        user_ip or socket.gethostbyname(socket.gethostname()))
+    headers = {'Content-Type': 'application/xml', 'Accept': 'application/json'}
+    resp = (session or Session()).post(url, headers=headers, data=xml)
+    resp.raise_for_status()
+    return resp.json()['token']['id']
+
+
+def get_token(url: str, client_id: str, user_ip: str, endpoint: str = EDL_HOST,
+              session: Optional[Session] = None) -> str:
+    """
+    Create a CMR token like create_token, but print errors and return an
+    empty string instead of raising them, as the access scripts expect.
+    """
+    try:
+        return create_token(url, client_id, endpoint, session, user_ip)
+    except Exception:
+        print("Error getting the token - check user name and password")
+        return ''
+
+
+def delete_token(url: str, token: str, session: Optional[Session] = None) -> None:
+    """
+    Delete `token` at the token service `url` and print whether that worked.
+    """
+    try:
+        headers = {'Content-Type': 'application/xml', 'Accept': 'application/json'}
+        resp = (session or Session()).request('DELETE', '{}/{}'.format(url, token), headers=headers)
+        if resp.status_code == 204:
+            print("CMR token successfully deleted")
+        else:
+            print("CMR token deleting failed.")
+    except Exception:
+        print("Error deleting the token")
+
+
+class TokenCache:
+    """
+    create    - function returning a new token, e.g. a call to get_token; an
+                empty string means it failed and nothing is cached
+    key       - identifies the token in the cache file, e.g. the token URL and
+                client id
+    path      - cache file
+    max_age   - seconds after which a cached token is replaced
+    telemetry - optional s6mf.telemetry.Telemetry the creation of tokens is
+                timed in (phase `token`)
+    """
+
+    def __init__(self, create: Callable[[], str], key: str, path: str = DEFAULT_PATH,
+                 max_age: float = 24 * 3600, telemetry=None):
+        self.create = create
+        self.key = key
+        self.path = path
+        self.max_age = max_age
+        self.telemetry = telemetry
+        self.created = 0
+        self._token: Optional[str] = None
+
+    def _load(self) -> Dict:
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _save(self, tokens: Dict) -> None:
+        tmp = self.path+".tmp"
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump(tokens, f)
+        os.replace(tmp, self.path)
+
+    def _lock(self) -> FileLock:
+        os.makedirs(os.path.dirname(self.path), mode=0o700, exist_ok=True)
+        return FileLock(self.path+".lock")
+
+    def _new_token(self, tokens: Dict) -> str:
+        if self.telemetry is None:
+            token = self.create()
+        else:
+            with self.telemetry.timer("token", key=self.key) as fields:
+                token = self.create()
+                fields["ok"] = bool(token)
+        self.created += 1
+        if token:
+            tokens[self.key] = {"token": token, "created": time.time()}
+            self._save(tokens)
+        return token
+
+    def get(self) -> str:
+        """
+        The cached token, or a new one if there is none or it is too old.
+        """
+        if self._token:
+            return self._token
+        with self._lock():
+            tokens = self._load()
+            entry = tokens.get(self.key)
+            if entry and time.time()-entry["created"] < self.max_age:
+                self._token = entry["token"]
+            else:
+                self._token = self._new_token(tokens)
+        return self._token
+
+    def refresh(self, rejected: str) -> str:
+        """
+        Replace `rejected` after CMR turned it down.  If another process has
+        already replaced it, its new token is used instead of creating one more.
+        """
+        with self._lock():
+            tokens = self._load()
+            entry = tokens.get(self.key)
+            if entry and entry["token"] != rejected and time.time()-entry["created"] < self.max_age:
+                self._token = entry["token"]
+            else:
+                self._token = self._new_token(tokens)
+        return self._token
+
+    def clear(self) -> Optional[str]:
+        """
+        Stop using the current token and return it, e.g. to delete it at CMR.
+        It is dropped from the cache file unless another process has replaced
+        it there already.
+        """
+        token, self._token = self._token, None
+        with self._lock():
+            tokens = self._load()
+            if token and tokens.get(self.key, {}).get("token") == token:
+                del tokens[self.key]
+                self._save(tokens)
+        return token
@@ -0,0 +1,362 @@
+"""
+Along-track index of the downloaded granules.
+
+CMR only knows the footprint of each granule, so finding the records near a
+point means searching CMR and opening every file it returns.  TrackIndex
+keeps, in a SQLite database in the data directory, where each granule's
+track goes: the records of every along-track group (`data_01`, `data_20`)
+are cut into segments of consecutive records within one cell of a
+`CELL_DEGREES` grid, each stored with its record offsets, time range and
+lat/lon extent, next to the cycle and pass of the file.  A query such as
+"the 20 Hz records within 50 km of this tide gauge in cycles 10-40" then
+looks up the cells around the point in the index and reads only the record
+ranges of the matching segments.
+
+The index is updated incrementally: update() scans the files that are new or
+changed since they were indexed and forgets the ones that are gone.
+
+Needs the netCDF4 package (pip3 install netCDF4), like s6mf.subset.
+
+    python3 -m s6mf.trackindex /path/to/data --update
+    python3 -m s6mf.trackindex /path/to/data --near 43.30 5.35 --radius 50 --cycles 10 40
+"""
+
+import argparse
+import glob
+import math
+import os
+import re
+import sqlite3
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from netCDF4 import Dataset, date2num
+
+from .subset import COORDINATES, track_groups
+
+INDEX_NAME = ".track_index.sqlite"
+CELL_DEGREES = 1.0
+EARTH_RADIUS_KM = 6371.0
+# Cycle and pass in Sentinel-6 MF file names, e.g. S6A_P4_2__LR_STD__ST_012_245_...
+_CYCLE_PASS = re.compile(r"_(\d{3})_(\d{3})_")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id         INTEGER PRIMARY KEY,
+    path       TEXT UNIQUE NOT NULL,
+    size       INTEGER,
+    mtime      REAL,
+    cycle      INTEGER,
+    pass       INTEGER,
+    time_start REAL,
+    time_end   REAL
+);
+CREATE TABLE IF NOT EXISTS segments (
+    file_id    INTEGER NOT NULL REFERENCES files (id) ON DELETE CASCADE,
+    grp        TEXT NOT NULL,
+    cell       INTEGER NOT NULL,
+    start      INTEGER NOT NULL,
+    stop       INTEGER NOT NULL,
+    time_start REAL,
+    time_end   REAL,
+    lat_min    REAL,
+    lat_max    REAL,
+    lon_min    REAL,
+    lon_max    REAL
+);
+CREATE INDEX IF NOT EXISTS segments_cell ON segments (cell, grp);
+CREATE INDEX IF NOT EXISTS segments_file ON segments (file_id);
+CREATE INDEX IF NOT EXISTS files_cycle_pass ON files (cycle, pass);
+"""
+
+
+def cells(lat: np.ndarray, lon: np.ndarray, degrees: float = CELL_DEGREES) -> np.ndarray:
+    """
+    Grid cell number of each point; longitudes in -180..180 or 0..360.
+    """
+    columns = int(round(360/degrees))
+    row = np.clip(np.floor((lat+90)/degrees), 0, int(round(180/degrees))-1).astype(np.int64)
+    column = np.floor(np.mod(lon, 360)/degrees).astype(np.int64) % columns
+    return row*columns+column
+
+
+def cells_near(lat: float, lon: float, radius_km: float, degrees: float = CELL_DEGREES) -> List[int]:
+    """
+    The cells that may hold points within `radius_km` of (lat, lon).
+    """
+    dlat = math.degrees(radius_km/EARTH_RADIUS_KM)
+    south, north = max(-90.0, lat-dlat), min(90.0, lat+dlat)
+    if south <= -90 or north >= 90:
+        dlon = 180.0
+    else:
+        dlon = min(180.0, dlat/math.cos(math.radians(max(abs(south), abs(north)))))
+    lats = np.arange(math.floor(south/degrees)*degrees, north+degrees, degrees)
+    lons = np.arange(math.floor((lon-dlon)/degrees)*degrees, lon+dlon+degrees, degrees)
+    lat_grid, lon_grid = np.meshgrid(lats, lons)
+    return sorted(set(cells(lat_grid.ravel(), lon_grid.ravel(), degrees).tolist()))
+
+
+def distance_km(lat0: float, lon0: float, lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    """
+    Great circle distance of the points from (lat0, lon0).
+    """
+    lat0, lon0, lat, lon = np.radians(lat0), np.radians(lon0), np.radians(lat), np.radians(lon)
+    h = np.sin((lat-lat0)/2)**2+np.cos(lat0)*np.cos(lat)*np.sin((lon-lon0)/2)**2
+    return 2*EARTH_RADIUS_KM*np.arcsin(np.sqrt(np.minimum(h, 1.0)))
+
+
+def _epoch(value: str) -> float:
+    return datetime.fromisoformat(value.rstrip("Z")).replace(tzinfo=timezone.utc).timestamp()
+
+
+def _seconds(time, values: np.ndarray) -> np.ndarray:
+    """
+    Raw values of the netCDF `time` variable as seconds since 1970.
+    """
+    calendar = getattr(time, "calendar", "standard")
+    epoch, day = date2num([datetime(1970, 1, 1), datetime(1970, 1, 2)], time.units, calendar)
+    return (values-epoch)*(86400/(day-epoch))
+
+
+def cycle_pass(nc, path: str) -> Tuple[Optional[int], Optional[int]]:
+    """
+    Cycle and pass of the open granule `nc`, from its global attributes or
+    else from its file name `path`.
+    """
+    cycle, pass_ = getattr(nc, "cycle_number", None), getattr(nc, "pass_number", None)
+    if cycle is None or pass_ is None:
+        match = _CYCLE_PASS.search(os.path.basename(path))
+        if match:
+            return int(match.group(1)), int(match.group(2))
+    return (int(cycle) if cycle is not None else None), (int(pass_) if pass_ is not None else None)
+
+
+def scan(path: str, degrees: float = CELL_DEGREES) -> Tuple[tuple, List[tuple]]:
+    """
+    Read the along-track coordinates of the granule `path` and cut them into
+    segments.  Returns the row of the file and the rows of its segments,
+    without touching the index, so it can run in another thread.
+    """
+    stat = os.stat(path)
+    segments = []
+    with Dataset(path) as nc:
+        cycle, pass_ = cycle_pass(nc, path)
+        for group in track_groups(nc):
+            lat, lon, time = (group.variables[name][:] for name in COORDINATES)
+            valid = ~(np.ma.getmaskarray(lat) | np.ma.getmaskarray(lon) | np.ma.getmaskarray(time))
+            lat, lon = np.ma.filled(lat, np.nan), np.ma.filled(lon, np.nan)
+            cell = np.where(valid, cells(np.nan_to_num(lat), np.nan_to_num(lon), degrees), -1)
+            # A segment ends where the cell changes
+            starts = np.concatenate(([0], np.flatnonzero(np.diff(cell))+1))
+            stops = np.append(starts[1:], len(cell))
+            lon360 = np.mod(lon, 360)
+            extent = [f.reduceat(a, starts) for f, a in ((np.fmin, lat), (np.fmax, lat), (np.fmin, lon360),
+                                                         (np.fmax, lon360))]
+            keep = cell[starts] >= 0
+            if not keep.any():
+                continue
+            starts, stops, extent = starts[keep], stops[keep], [e[keep] for e in extent]
+            seconds = _seconds(group.variables["time"], np.ma.filled(time, np.nan)[np.concatenate((starts, stops-1))])
+            n = len(starts)
+            segments += zip([group.path]*n, cell[starts].tolist(), starts.tolist(), stops.tolist(),
+                            seconds[:n].tolist(), seconds[n:].tolist(), *(e.tolist() for e in extent))
+    times = [s[4] for s in segments]+[s[5] for s in segments]
+    file_row = (path, stat.st_size, stat.st_mtime, cycle, pass_,
+                min(times) if times else None, max(times) if times else None)
+    return file_row, segments
+
+
+@dataclass
+class Segment:
+    path: str
+    group: str
+    start: int
+    stop: int
+    cycle: Optional[int]
+    pass_: Optional[int]
+    time_start: float
+    time_end: float
+    lat_min: float
+    lat_max: float
+    lon_min: float
+    lon_max: float
+
+    def distance_km(self, lat: float, lon: float) -> float:
+        """
+        Lower bound of the distance of the segment's records from (lat, lon),
+        from the lat/lon extent of the segment (which lies within one cell).
+        """
+        # Take the longitude the way round that is nearest the segment, so
+        # that e.g. -0.05 lies next to a segment at 0.02-0.9, not 360 away
+        middle = (self.lon_min+self.lon_max)/2
+        lon = middle+(lon-middle+180) % 360-180
+        return float(distance_km(lat, lon, min(max(lat, self.lat_min), self.lat_max),
+                                 min(max(lon, self.lon_min), self.lon_max)))
+
+
+class TrackIndex:
+    """
+    Open (or create) the along-track index of the data directory `data`.
+    """
+
+    def __init__(self, data: str, degrees: float = CELL_DEGREES):
+        self.data = data
+        self.degrees = degrees
+        self.path = os.path.join(data, INDEX_NAME)
+        self.db = sqlite3.connect(self.path, timeout=60)
+        self.db.execute("PRAGMA foreign_keys = ON")
+        self.db.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def is_current(self, path: str) -> bool:
+        """
+        True if `path` is indexed and has not changed since.
+        """
+        row = self.db.execute("SELECT size, mtime FROM files WHERE path = ?", (path,)).fetchone()
+        if row is None:
+            return False
+        stat = os.stat(path)
+        return row == (stat.st_size, stat.st_mtime)
+
+    def add(self, path: str, scanned: Optional[Tuple[tuple, List[tuple]]] = None) -> int:
+        """
+        Index (or re-index) the granule `path`, from the result of scan() if
+        it has been scanned already.  Returns the number of segments.
+        """
+        with self.db:
+            return self._insert(path, scanned)
+
+    def _insert(self, path: str, scanned: Optional[Tuple[tuple, List[tuple]]] = None) -> int:
+        file_row, segments = scanned or scan(path, self.degrees)
+        self.db.execute("DELETE FROM files WHERE path = ?", (path,))
+        file_id = self.db.execute("INSERT INTO files (path, size, mtime, cycle, pass, time_start, time_end) "
+                                  "VALUES (?, ?, ?, ?, ?, ?, ?)", file_row).lastrowid
+        self.db.executemany("INSERT INTO segments VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                            [(file_id,)+s for s in segments])
+        return len(segments)
+
+    def remove(self, path: str) -> None:
+        with self.db:
+            self.db.execute("DELETE FROM files WHERE path = ?", (path,))
+
+    def update(self, paths: Optional[Iterable[str]] = None) -> Tuple[int, int]:
+        """
+        Index the files in `paths` (by default the .nc files of the data
+        directory) that are new or changed, and forget indexed files that no
+        longer exist.  Returns the numbers of files indexed and removed.
+        """
+        if paths is None:
+            paths = glob.glob(os.path.join(self.data, "**", "*.nc"), recursive=True)
+        added = 0
+        with self.db:
+            for path in paths:
+                if not self.is_current(path):
+                    self._insert(path)
+                    added += 1
+            gone = [p for (p,) in self.db.execute("SELECT path FROM files") if not os.path.exists(p)]
+            self.db.executemany("DELETE FROM files WHERE path = ?", [(p,) for p in gone])
+        return added, len(gone)
+
+    def segments(self, cells: Sequence[int], group: Optional[str] = None,
+                 cycles: Optional[Tuple[int, int]] = None, passes: Optional[Sequence[int]] = None,
+                 start: Optional[str] = None, stop: Optional[str] = None) -> List[Segment]:
+        """
+        The indexed segments in `cells`, optionally only of one along-track
+        `group` (e.g. "/data_20"), the cycles from cycles[0] to cycles[1],
+        some passes and the time range `start`-`stop`.
+        """
+        sql = ("SELECT f.path, s.grp, s.start, s.stop, f.cycle, f.pass, s.time_start, s.time_end, "
+               "s.lat_min, s.lat_max, s.lon_min, s.lon_max "
+               "FROM segments s JOIN files f ON f.id = s.file_id "
+               "WHERE s.cell IN ({})".format(",".join("?"*len(cells))))
+        args: list = list(cells)
+        if group:
+            sql += " AND s.grp = ?"
+            args.append(group)
+        if cycles:
+            sql += " AND f.cycle BETWEEN ? AND ?"
+            args += list(cycles)
+        if passes:
+            sql += " AND f.pass IN ({})".format(",".join("?"*len(passes)))
+            args += list(passes)
+        if start:
+            sql += " AND s.time_end >= ?"
+            args.append(_epoch(start))
+        if stop:
+            sql += " AND s.time_start <= ?"
+            args.append(_epoch(stop))
+        rows = self.db.execute(sql+" ORDER BY f.cycle, f.pass, f.path, s.grp, s.start", args).fetchall()
+        return [Segment(*row) for row in rows]
+
+    def near(self, lat: float, lon: float, radius_km: float, **filters) -> List[Segment]:
+        """
+        The segments that may hold records within `radius_km` of (lat, lon);
+        `filters` as for segments().
+        """
+        return [s for s in self.segments(cells_near(lat, lon, radius_km, self.degrees), **filters)
+                if s.distance_km(lat, lon) <= radius_km]
+
+    def records_near(self, lat: float, lon: float, radius_km: float, **filters) -> List[Tuple[Segment, np.ndarray]]:
+        """
+        The records within `radius_km` of (lat, lon): for every segment near
+        the point, the record numbers in its group that are that close.  Only
+        the coordinates of the records from the first to the last of the
+        segments of each file and group are read.
+        """
+        found = []
+        by_file = {}
+        for s in self.near(lat, lon, radius_km, **filters):
+            by_file.setdefault((s.path, s.group), []).append(s)
+        for (path, group), segments in by_file.items():
+            first, last = min(s.start for s in segments), max(s.stop for s in segments)
+            with Dataset(path) as nc:
+                coordinates = nc[group]
+                d = distance_km(lat, lon, coordinates["latitude"][first:last], coordinates["longitude"][first:last])
+            close = np.ma.filled(d, np.inf) <= radius_km
+            for s in segments:
+                inside = np.flatnonzero(close[s.start-first:s.stop-first])
+                if len(inside):
+                    found.append((s, inside+s.start))
+        return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index and query the tracks of the downloaded granules")
+    parser.add_argument("data", help="data directory")
+    parser.add_argument("--update", action="store_true", help="index new and changed files first")
+    parser.add_argument("--near", nargs=2, type=float, metavar=("LAT", "LON"))
+    parser.add_argument("--radius", type=float, default=50, help="km")
+    parser.add_argument("--cycles", nargs=2, type=int, metavar=("FIRST", "LAST"))
+    parser.add_argument("--pass", dest="passes", type=int, nargs="*")
+    parser.add_argument("--group", default="/data_20", help="along-track group, e.g. /data_01 for 1 Hz")
+    parser.add_argument("--start")
+    parser.add_argument("--stop")
+    args = parser.parse_args()
+    if not os.path.isdir(args.data):
+        parser.error("no such directory: "+args.data)
+
+    with TrackIndex(args.data) as index:
+        if args.update:
+            added, removed = index.update()
+            print(str(added)+" files indexed, "+str(removed)+" removed")
+        if args.near:
+            found = index.records_near(args.near[0], args.near[1], args.radius, group=args.group,
+                                       cycles=args.cycles, passes=args.passes, start=args.start, stop=args.stop)
+            for segment, records in found:
+                print("{}\t{}\t{}\t{}\t{}-{}".format(segment.cycle, segment.pass_, segment.path, segment.group,
+                                                     records[0], records[-1]))
+            print(str(sum(len(r) for _, r in found))+" records within "+str(args.radius)+" km")
+
+
+if __name__ == "__main__":
+    main()
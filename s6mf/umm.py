@@ -0,0 +1,135 @@
+"""
+Accessors for the UMM-G granule records returned by the CMR search.
+
+See https://cdn.earthdata.nasa.gov/umm/granule/ for the schema.  Fields that
+are optional in the schema come back as None rather than raising KeyError.
+"""
+
+from os.path import basename
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+SIZE_UNITS = {"B": 1, "KB": 1024, "MB": 1024**2, "GB": 1024**3, "TB": 1024**4}
+
+# The parts of a granule record used by the scripts and the s6mf modules
+GRANULE_FIELDS = {
+    "meta": ("concept-id", "revision-date", "updated", "created-at"),
+    "umm": ("GranuleUR", "RelatedUrls", "DataGranule", "TemporalExtent", "SpatialExtent"),
+}
+
+
+class ArchiveInfo(NamedTuple):
+    size: Optional[int]
+    checksum: Optional[str]
+    algorithm: Optional[str]
+    # False when the size was converted from a rounded SizeUnit value
+    size_exact: bool = False
+
+
+# RelatedUrls Type of the links in CMR's Atom (.json) results, by rel
+ATOM_RELS = {
+    "http://esipfed.org/ns/fedsearch/1.1/data#": "GET DATA",
+    "http://esipfed.org/ns/fedsearch/1.1/s3#": "GET DATA VIA DIRECT ACCESS",
+    "http://esipfed.org/ns/fedsearch/1.1/metadata#": "EXTENDED METADATA",
+    "http://esipfed.org/ns/fedsearch/1.1/service#": "USE SERVICE API",
+    "http://esipfed.org/ns/fedsearch/1.1/browse#": "GET RELATED VISUALIZATION",
+    "http://esipfed.org/ns/fedsearch/1.1/documentation#": "VIEW RELATED INFORMATION",
+}
+
+
+def from_atom(entry: Dict) -> Dict:
+    """
+    A UMM-G shaped record from an entry of CMR's Atom (.json) results, with
+    the fields the Atom format carries: concept-id, GranuleUR, temporal extent
+    and RelatedUrls.  Atom has no revision date, only `updated`, which is a
+    different time (see revision()).  It has no file sizes, checksums or
+    track either, and links inherited from the collection are left out.
+    """
+    urls = []
+    for link in entry.get("links", ()):
+        if link.get("inherited") or link.get("rel") not in ATOM_RELS:
+            continue
+        url = {"URL": link["href"], "Type": ATOM_RELS[link["rel"]]}
+        if "OPeNDAP" in link.get("title", "") or "opendap" in link["href"]:
+            url["Subtype"] = "OPENDAP DATA"
+        urls.append(url)
+    record = {
+        "meta": {"concept-id": entry.get("id"), "updated": entry.get("updated")},
+        "umm": {"GranuleUR": entry.get("title") or entry.get("producer_granule_id"), "RelatedUrls": urls},
+    }
+    if "time_start" in entry:
+        record["umm"]["TemporalExtent"] = {"RangeDateTime": {
+            "BeginningDateTime": entry["time_start"], "EndingDateTime": entry.get("time_end")}}
+    return record
+
+
+def project(item: Dict, fields: Dict = GRANULE_FIELDS) -> Dict:
+    """
+    A copy of `item` with only `fields`, e.g. {"meta": ["concept-id"], "umm": ["RelatedUrls"]}.
+    Fields missing from the record are left out.
+    """
+    projected = {}
+    for section, keys in fields.items():
+        part = item.get(section)
+        if part is not None:
+            projected[section] = {k: part[k] for k in keys if k in part}
+    return projected
+
+
+def concept_id(item: Dict) -> Optional[str]:
+    return item.get("meta", {}).get("concept-id")
+
+
+def revision_date(item: Dict) -> Optional[str]:
+    return item.get("meta", {}).get("revision-date")
+
+
+def revision(item: Dict) -> Tuple[str, Optional[str]]:
+    """
+    (format, time) that tells revisions of a granule apart: ("umm_json",
+    revision-date) for a UMM-G record, ("json", updated) for one made from
+    Atom results.  The two times differ for the same revision, so only times
+    of the same format can be compared.
+    """
+    meta = item.get("meta", {})
+    if "revision-date" in meta or "updated" not in meta:
+        return "umm_json", meta.get("revision-date")
+    return "json", meta["updated"]
+
+
+def granule_ur(item: Dict) -> Optional[str]:
+    return item.get("umm", {}).get("GranuleUR")
+
+
+def track(item: Dict) -> Tuple[Optional[int], List[int]]:
+    """
+    (cycle, [passes]) of a granule, from SpatialExtent.HorizontalSpatialDomain.Track.
+    """
+    domain = item.get("umm", {}).get("SpatialExtent", {}).get("HorizontalSpatialDomain", {})
+    t = domain.get("Track") or {}
+    return t.get("Cycle"), [p["Pass"] for p in t.get("Passes", []) if "Pass" in p]
+
+
+def archive_info(item: Dict) -> Dict[str, ArchiveInfo]:
+    """
+    Advertised size and checksum of each file in the granule, keyed by file name,
+    from DataGranule.ArchiveAndDistributionInformation.
+    """
+    info = {}
+    for a in item.get("umm", {}).get("DataGranule", {}).get("ArchiveAndDistributionInformation", []):
+        exact = "SizeInBytes" in a or a.get("SizeUnit", "B") == "B"
+        if "SizeInBytes" in a:
+            size = int(a["SizeInBytes"])
+        elif "Size" in a:
+            size = int(float(a["Size"]) * SIZE_UNITS.get(a.get("SizeUnit", "B"), 1))
+        else:
+            size, exact = None, False
+        checksum = a.get("Checksum") or {}
+        info[a.get("Name")] = ArchiveInfo(size, checksum.get("Value"), checksum.get("Algorithm"), exact)
+    return info
+
+
+def file_info(item: Dict, url: str) -> ArchiveInfo:
+    """
+    Advertised size and checksum of the file behind `url`, if the record lists it.
+    """
+    return archive_info(item).get(basename(url), ArchiveInfo(None, None, None))